@@ -0,0 +1,72 @@
+"""
+Render + preprocess cost per page size at a fixed 144 dpi vs the per-page render_zoom.
+
+    python benchmarks/bench_adaptive_dpi.py [--pages 10] [--mode gundam]
+
+For every page size a synthetic text page is rendered both ways and run through tokenize_with_images;
+the vision tokens must match, rendered megapixels and ms/page are what changes.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from process.image_process import get_processor
+from process.modes import get_mode
+from process.pdf_render import pixmap_to_image, render_zoom
+
+PAGE_SIZES = {
+    'card': (252, 144),
+    'A6': (298, 420),
+    'letter': (612, 792),
+    'A4': (595, 842),
+    'A3': (842, 1191),
+    'A0 poster': (2384, 3370),
+}
+
+
+def synthetic_page(doc, width, height):
+    page = doc.new_page(width=width, height=height)
+    fontsize = max(4, width / 60)
+    text = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 30
+    page.insert_textbox(fitz.Rect(width * 0.08, height * 0.08, width * 0.92, height * 0.92), text, fontsize=fontsize)
+    return page
+
+
+def run(page, zoom, mode, repeats):
+    processor = get_processor()
+    render = preprocess = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        image = pixmap_to_image(page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False))
+        render += time.perf_counter() - start
+        start = time.perf_counter()
+        tokens = processor.tokenize_with_images(images=[image], bos=True, eos=True, mode=mode)[0][5][0]
+        preprocess += time.perf_counter() - start
+    return image.size, tokens, render / repeats * 1000, preprocess / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=10, help="renders per page size and variant")
+    parser.add_argument("--mode", default=None)
+    args = parser.parse_args()
+
+    mode = get_mode(args.mode)
+    doc = fitz.open()
+    print(f"mode {mode.name}")
+    for name, (width, height) in PAGE_SIZES.items():
+        page = synthetic_page(doc, width, height)
+        for variant, zoom in (("144 dpi", 2.0), ("adaptive", render_zoom(page.rect, mode))):
+            size, tokens, render_ms, preprocess_ms = run(page, zoom, mode, args.pages)
+            print(f"{name:10s} {variant:9s} {zoom * 72:5.0f} dpi  {size[0]:5d}x{size[1]:<5d} "
+                  f"{size[0] * size[1] / 1e6:5.2f} MP  tokens {tokens:5d}  "
+                  f"render {render_ms:7.1f} ms  preprocess {preprocess_ms:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
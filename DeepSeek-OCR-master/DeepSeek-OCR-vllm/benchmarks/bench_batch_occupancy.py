@@ -0,0 +1,82 @@
+"""
+Engine occupancy for many small documents: one run per document (what a run per INPUT_PATH does)
+vs batch mode feeding the pages of all documents into one engine.
+
+    python benchmarks/bench_batch_occupancy.py [--documents 500] [--pages 1 3] [--concurrency 100]
+
+The engine is simulated: every decode step advances all running requests by one token, and a page
+needs a random 100-1000 tokens. The requests go through iter_engine_outputs as in run_dpsk_ocr_pdf.py.
+Decode is memory bound, so a step is taken to cost the same however many requests run. Reported are
+engine steps, mean running requests per step, and the estimated GPU time at --step-ms
+per step plus --startup-s of engine startup per run.
+"""
+import argparse
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process.streaming import iter_engine_outputs
+
+
+class SimulatedEngine:
+    def __init__(self):
+        self.running = {}
+        self.steps = 0
+        self.busy = 0  # running requests summed over steps
+
+    def add_request(self, request_id, inputs, sampling_params):
+        self.running[request_id] = inputs
+
+    def has_unfinished_requests(self):
+        return bool(self.running)
+
+    def step(self):
+        self.steps += 1
+        self.busy += len(self.running)
+        outputs = []
+        for request_id in list(self.running):
+            self.running[request_id] -= 1
+            if not self.running[request_id]:
+                del self.running[request_id]
+                outputs.append(SimpleNamespace(request_id=request_id, finished=True))
+        return outputs
+
+
+def run(engine, pages, concurrency):
+    requests = ((f'{doc}:{idx}', tokens) for doc, idx, tokens in pages)
+    for _ in iter_engine_outputs(engine, requests, None, concurrency):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--pages", type=int, nargs=2, default=[1, 3], help="min and max pages per document")
+    parser.add_argument("--concurrency", type=int, default=100, help="MAX_CONCURRENCY")
+    parser.add_argument("--step-ms", type=float, default=25.0)
+    parser.add_argument("--startup-s", type=float, default=60.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    documents = [[(doc, idx, rng.randint(100, 1000)) for idx in range(rng.randint(*args.pages))]
+                 for doc in range(args.documents)]
+    num_pages = sum(len(pages) for pages in documents)
+
+    per_document = SimulatedEngine()
+    for pages in documents:
+        run(per_document, pages, args.concurrency)
+    batch = SimulatedEngine()
+    run(batch, (page for pages in documents for page in pages), args.concurrency)
+
+    print(f"{args.documents} documents, {num_pages} pages, MAX_CONCURRENCY {args.concurrency}")
+    for name, engine, runs in (("run per document", per_document, args.documents), ("batch", batch, 1)):
+        seconds = engine.steps * args.step_ms / 1000 + runs * args.startup_s
+        print(f"{name:16s} {engine.steps:8d} steps  {engine.busy / engine.steps:6.1f} running/step  "
+              f"{seconds / 3600:7.2f} h  ({seconds / num_pages:6.2f} s/page)")
+
+
+if __name__ == "__main__":
+    main()
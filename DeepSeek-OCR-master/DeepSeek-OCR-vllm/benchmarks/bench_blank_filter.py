@@ -0,0 +1,92 @@
+"""
+Pages/s with and without the blank-page pre-filter on a mixed corpus.
+
+    python benchmarks/bench_blank_filter.py [path/to/doc.pdf] [--pages 300] [--blank-every 4] [--model-ms 400]
+
+Without a path a synthetic scan-like PDF is generated where every --blank-every-th page is an
+empty sheet with scanner noise. Preprocessing (tokenize_with_images) is measured; the GPU side
+is not available offline, so --model-ms adds an assumed per-page encode + decode cost to the
+projection.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from process.image_process import get_processor
+from process.page_filter import is_blank_page
+
+
+def synthetic_pdf(num_pages, blank_every):
+    rng = np.random.default_rng(0)
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        if blank_every and page_num % blank_every == blank_every - 1:
+            # paper grain and a few dust specks, as on a scanned empty back side
+            noise = np.clip(rng.normal(238, 6, (396, 306)), 0, 255).astype(np.uint8)
+            noise[rng.integers(0, 396, 8), rng.integers(0, 306, 8)] = 60
+            buffer = io.BytesIO()
+            Image.fromarray(noise).save(buffer, format='PNG')
+            page.insert_image(page.rect, stream=buffer.getvalue())
+        else:
+            text = f"Page {page_num + 1}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 30
+            page.insert_textbox(fitz.Rect(54, 54, 558, 738), text, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return fitz.open("pdf", data)
+
+
+def render(doc, num_pages, dpi=144):
+    matrix = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    images = []
+    for page_num in range(min(num_pages, doc.page_count)):
+        pixmap = doc[page_num].get_pixmap(matrix=matrix, alpha=False)
+        images.append(Image.open(io.BytesIO(pixmap.tobytes("png"))).convert('RGB'))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf", nargs="?")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--blank-every", type=int, default=4)
+    parser.add_argument("--model-ms", type=float, default=400.0, help="assumed GPU cost of one page")
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf) if args.pdf else synthetic_pdf(args.pages, args.blank_every)
+    images = render(doc, args.pages)
+    processor = get_processor()
+
+    start = time.perf_counter()
+    for image in images:
+        processor.tokenize_with_images(images=[image], bos=True, eos=True)
+    unfiltered = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blank = [is_blank_page(image) for image in images]
+    filter_time = time.perf_counter() - start
+    for image, is_blank in zip(images, blank):
+        if not is_blank:
+            processor.tokenize_with_images(images=[image], bos=True, eos=True)
+    filtered = time.perf_counter() - start
+
+    n, skipped = len(images), sum(blank)
+    model = args.model_ms / 1e3
+    print(f"{n} pages, {skipped} blank, filter {filter_time / n * 1e3:.2f} ms/page")
+    print(f"preprocess only   without filter: {n / unfiltered:8.1f} pages/s   with filter: {n / filtered:8.1f} pages/s")
+    end_to_end = (unfiltered + n * model, filtered + (n - skipped) * model)
+    print(f"with {args.model_ms:.0f} ms/page model cost   without filter: {n / end_to_end[0]:8.2f} pages/s"
+          f"   with filter: {n / end_to_end[1]:8.2f} pages/s")
+    print(f"saved: {(end_to_end[0] - end_to_end[1]) / n * 1e3:.1f} ms/page")
+
+
+if __name__ == "__main__":
+    main()
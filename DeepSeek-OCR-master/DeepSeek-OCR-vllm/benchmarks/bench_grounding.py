@@ -0,0 +1,80 @@
+"""
+Post-processing of long model outputs: the old re_match + str.replace per match + eval() of the
+boxes, as the runners did it, vs process/grounding.py (one parse, one pass to build the markdown,
+boxes to pixels as one array operation).
+
+    python benchmarks/bench_grounding.py [--tokens 50000] [--block-tokens 60]
+
+Outputs are synthetic grounded markdown, about 4 characters per token, in blocks of --block-tokens.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process.grounding import parse_grounding, to_markdown, to_pixels
+
+LABELS = ["text", "text", "text", "title", "table", "image", "equation"]
+
+
+def synthetic_output(num_tokens, block_tokens, seed=0):
+    rng = random.Random(seed)
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+    parts, length = [], 0
+    while length < num_tokens * 4:
+        x0, y0 = rng.randint(0, 800), rng.randint(0, 900)
+        box = [x0, y0, x0 + rng.randint(50, 199), y0 + rng.randint(20, 99)]
+        text = " ".join(rng.choice(words) for _ in range(block_tokens * 4 // 6))
+        if rng.random() < 0.05:
+            text += " \\coloneqq x"
+        parts.append(f"<|ref|>{rng.choice(LABELS)}<|/ref|><|det|>[{box}]<|/det|>\n{text}\n\n\n")
+        length += len(parts[-1])
+    return "".join(parts)
+
+
+def old_postprocess(content, width, height, jdx=0):
+    # re_match, extract_coordinates_and_label and the replace loops of PageWriter.write before process/grounding.py
+    matches = re.findall(r'(<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>)', content, re.DOTALL)
+    matches_images = [m[0] for m in matches if '<|ref|>image<|/ref|>' in m[0]]
+    matches_other = [m[0] for m in matches if '<|ref|>image<|/ref|>' not in m[0]]
+    boxes = []
+    for ref in matches:
+        for x1, y1, x2, y2 in eval(ref[2]):
+            boxes.append((int(x1 / 999 * width), int(y1 / 999 * height), int(x2 / 999 * width), int(y2 / 999 * height)))
+    for idx, a_match_image in enumerate(matches_images):
+        content = content.replace(a_match_image, f'![](images/' + str(jdx) + '_' + str(idx) + '.jpg)\n')
+    for a_match_other in matches_other:
+        content = content.replace(a_match_other, '').replace('\\coloneqq', ':=').replace('\\eqqcolon', '=:').replace('\n\n\n\n', '\n\n').replace('\n\n\n', '\n\n')
+    return content, boxes
+
+
+def new_postprocess(content, width, height, jdx=0):
+    blocks = parse_grounding(content)
+    boxes = [to_pixels(block.boxes, width, height) for block in blocks]
+    return to_markdown(content, blocks, image_link=lambda idx: f'images/{jdx}_{idx}.jpg'), boxes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--block-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    for num_tokens in args.tokens:
+        output = synthetic_output(num_tokens, args.block_tokens)
+        num_blocks = output.count("<|ref|>")
+        timings = {}
+        for name, fn in (("old", old_postprocess), ("grounding", new_postprocess)):
+            start = time.perf_counter()
+            fn(output, 1224, 1584)
+            timings[name] = time.perf_counter() - start
+        print(f"{num_tokens:7d} tokens  {num_blocks:5d} blocks  old {timings['old'] * 1000:9.1f} ms  "
+              f"grounding {timings['grounding'] * 1000:7.1f} ms  ({timings['old'] / timings['grounding']:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Cost of the layouts PDF per page and its size: raster (the page image copied, boxes drawn with PIL,
+re-encoded as a quality 95 JPEG for img2pdf) vs vector (boxes drawn on a copy of the source PDF).
+
+    python benchmarks/bench_layout_pdf.py [--pages 50] [--boxes 15]
+
+The raster figures leave out rendering the page image, which the pipeline does anyway, and img2pdf,
+which only wraps the JPEGs.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from PIL import Image, ImageDraw, ImageFont
+
+from process.layout_overlay import write_layout_pdf
+from process.pdf_render import pixmap_to_image
+
+
+def synthetic_pdf(path, num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((50, 60), f"Section {page_num + 1}", fontsize=20)
+        page.insert_textbox(fitz.Rect(50, 80, 545, 780), "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 60, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def page_refs(num_boxes, seed):
+    rng = random.Random(seed)
+    refs = []
+    for _ in range(num_boxes):
+        x0, y0 = rng.randint(0, 800), rng.randint(0, 900)
+        refs.append((rng.choice(["title", "text", "table", "image"]), [[x0, y0, x0 + rng.randint(50, 199), y0 + rng.randint(20, 99)]]))
+    return refs
+
+
+def raster_layout(image, refs, path):
+    # what draw_bounding_boxes and PageWriter do for one page
+    width, height = image.size
+    img_draw = image.copy()
+    draw = ImageDraw.Draw(img_draw)
+    overlay = Image.new('RGBA', img_draw.size, (0, 0, 0, 0))
+    draw2 = ImageDraw.Draw(overlay)
+    font = ImageFont.load_default()
+    for label, boxes in refs:
+        color = (random.randint(0, 200), random.randint(0, 200), random.randint(0, 255))
+        for x1, y1, x2, y2 in boxes:
+            box = [int(x1 / 999 * width), int(y1 / 999 * height), int(x2 / 999 * width), int(y2 / 999 * height)]
+            draw.rectangle(box, outline=color, width=4 if label == 'title' else 2)
+            draw2.rectangle(box, fill=color + (20,), outline=(0, 0, 0, 0), width=1)
+            draw.text((box[0], max(0, box[1] - 15)), label, font=font, fill=color)
+    img_draw.paste(overlay, (0, 0), overlay)
+    img_draw.convert('RGB').save(path, format='JPEG', quality=95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--boxes", type=int, default=15, help="grounding boxes per page")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "doc.pdf")
+        synthetic_pdf(source, args.pages)
+        refs = [page_refs(args.boxes, seed) for seed in range(args.pages)]
+
+        doc = fitz.open(source)
+        images = [pixmap_to_image(page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)) for page in doc]
+        doc.close()
+        start = time.perf_counter()
+        raster_bytes = 0
+        for page_num, image in enumerate(images):
+            path = os.path.join(tmp, f"{page_num}.jpg")
+            raster_layout(image, refs[page_num], path)
+            raster_bytes += os.path.getsize(path)
+        raster = time.perf_counter() - start
+
+        out_path = os.path.join(tmp, "layouts.pdf")
+        start = time.perf_counter()
+        write_layout_pdf(source, out_path, enumerate(refs))
+        vector = time.perf_counter() - start
+
+        print(f"{args.pages} pages, {args.boxes} boxes/page")
+        print(f"raster {raster / args.pages * 1000:7.2f} ms/page  {raster_bytes / 1e6:7.2f} MB")
+        print(f"vector {vector / args.pages * 1000:7.2f} ms/page  {os.path.getsize(out_path) / 1e6:7.2f} MB  "
+              f"(source {os.path.getsize(source) / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
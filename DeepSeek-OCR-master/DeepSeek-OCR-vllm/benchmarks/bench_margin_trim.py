@@ -0,0 +1,84 @@
+"""
+Average tiles and vision tokens per page with and without margin trimming.
+
+    python benchmarks/bench_margin_trim.py [path/to/doc.pdf | path/to/images/] [--pages 200] [--mode gundam]
+
+Without a path a synthetic corpus of letter pages with text blocks of varying size and margins
+is generated. Token counts come from the tile planner, so no model or tokenizer is needed.
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from process.margin_trim import content_box
+from process.modes import get_mode
+from process.tile_planner import get_tile_planner
+
+
+def synthetic_pdf(num_pages):
+    rng = np.random.default_rng(0)
+    doc = fitz.open()
+    for _ in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        left, top = rng.uniform(36, 160), rng.uniform(36, 180)
+        right, bottom = 612 - rng.uniform(36, 160), 792 - rng.uniform(36, 180)
+        page.insert_textbox(fitz.Rect(left, top, right, bottom),
+                            "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 25, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return fitz.open("pdf", data)
+
+
+def load_pages(path, num_pages, dpi=144):
+    if path and os.path.isdir(path):
+        for image_path in sorted(glob.glob(os.path.join(path, '*')))[:num_pages]:
+            yield Image.open(image_path).convert('RGB')
+        return
+    doc = fitz.open(path) if path else synthetic_pdf(num_pages)
+    matrix = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    for page_num in range(min(num_pages, doc.page_count)):
+        pixmap = doc[page_num].get_pixmap(matrix=matrix, alpha=False)
+        yield Image.open(io.BytesIO(pixmap.tobytes("png"))).convert('RGB')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--mode", default=None)
+    args = parser.parse_args()
+
+    mode = get_mode(args.mode)
+    planner = get_tile_planner()
+    pages = trimmed = 0
+    tiles, tokens = np.zeros(2), np.zeros(2)
+    box_time = 0.0
+    for image in load_pages(args.path, args.pages):
+        start = time.perf_counter()
+        box = content_box(image)
+        box_time += time.perf_counter() - start
+        trimmed_size = (box[2] - box[0], box[3] - box[1]) if box else image.size
+        for i, (width, height) in enumerate((image.size, trimmed_size)):
+            plan = planner.plan(width, height, mode.base_size, mode.image_size, mode.crop_mode)
+            tiles[i] += plan.num_tiles
+            tokens[i] += plan.num_image_tokens
+        pages += 1
+        trimmed += box is not None
+
+    print(f"{pages} pages, {trimmed} trimmed, mode {mode.name}, content box {box_time / pages * 1e3:.2f} ms/page")
+    print(f"tiles / page:         {tiles[0] / pages:7.2f} -> {tiles[1] / pages:7.2f}")
+    print(f"vision tokens / page: {tokens[0] / pages:7.1f} -> {tokens[1] / pages:7.1f}"
+          f"  ({(1 - tokens[1] / tokens[0]) * 100:.1f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Rendering time of a page selection (PAGE_RANGE) of a long PDF against the whole document: the pages
+left out are never rendered (nor preprocessed or decoded), so the cost follows the selection, not
+the length of the document.
+
+    python benchmarks/bench_page_selection.py [--pages 1000] [--select "first 5" "1-50" "last 10"]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from process.modes import get_mode
+from process.page_selection import PageSelection
+from process.pdf_render import PdfRenderPool
+
+
+def synthetic_pdf(path, num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        text = f"Page {page_num + 1}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        page.insert_textbox(fitz.Rect(54, 54, 558, 738), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--select", nargs="+", default=["first 5", "1-50", "last 10", ""])
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long.pdf")
+        synthetic_pdf(path, args.pages)
+        with PdfRenderPool(num_workers=args.workers) as render_pool:
+            for spec in args.select:
+                selection = PageSelection.parse(spec)
+                start = time.perf_counter()
+                pages = render_pool.iter_pages(path, mode=get_mode(), pages=selection.pages(args.pages))
+                count = sum(1 for _ in pages)
+                elapsed = time.perf_counter() - start
+                print(f"{spec or 'all':>10s}  {count:5d} of {args.pages} pages  {elapsed:7.2f} s")
+
+
+if __name__ == "__main__":
+    main()
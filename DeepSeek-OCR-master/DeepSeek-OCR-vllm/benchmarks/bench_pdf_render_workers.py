@@ -0,0 +1,55 @@
+"""
+PDF rasterization pages/s against the number of render worker processes (PdfRenderPool).
+
+    python benchmarks/bench_pdf_render_workers.py [--pages 200] [--workers 1 2 4 8] [--dpi 144]
+
+Pages are consumed as PdfRenderPool.iter_pages yields them, in page order; 1 worker is the serial path.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from process.pdf_render import PdfRenderPool
+
+
+def synthetic_pdf(path, num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        text = f"Page {page_num + 1}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        page.insert_textbox(fitz.Rect(54, 54, 558, 400), text, fontsize=10)
+        for row in range(8):
+            page.draw_circle(fitz.Point(100 + row * 55, 560), 24, color=(0, 0, 0), fill=(row / 8, 0.4, 0.6))
+    doc.save(path)
+    doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--dpi", type=int, default=144)
+    parser.add_argument("--tmp", default="/tmp")
+    args = parser.parse_args()
+
+    path = os.path.join(args.tmp, "bench_render_workers.pdf")
+    synthetic_pdf(path, args.pages)
+    print(f"{os.cpu_count()} cpus")
+    baseline = None
+    for workers in args.workers:
+        with PdfRenderPool(num_workers=workers) as pool:
+            start = time.perf_counter()
+            count = sum(1 for _ in pool.iter_pages(path, dpi=args.dpi))
+            rate = count / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"{workers:3d} workers  {rate:7.1f} pages/s  x{rate / baseline:.2f}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Peak RSS of render + preprocess for growing PDFs: the old render-everything-first flow vs the
+streaming flow run_dpsk_ocr_pdf.py uses (bounded render queue, bounded preprocessing lookahead).
+
+    python benchmarks/bench_pdf_streaming.py [--pages 50 200 800] [--workers 16]
+
+The engine is not involved; preprocessed pages are dropped once produced, as they would be once
+the engine has consumed them. Each measurement runs in a fresh forked process.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from process.pdf_render import iter_pdf_pages, pdf_to_images_high_quality
+from process.preprocess_pool import PreprocessPool
+from process.streaming import prefetch
+from process.tensor_store import preprocess_with_store
+
+
+def synthetic_pdf(path, num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        text = f"Page {page_num + 1}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        page.insert_textbox(fitz.Rect(54, 54, 558, 738), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def run_list(path, workers):
+    images = pdf_to_images_high_quality(path)
+    with PreprocessPool(backend='thread', num_workers=workers) as pool:
+        batch_inputs = list(pool.map(images))
+    return len(batch_inputs)
+
+
+def run_streaming(path, workers):
+    count = 0
+    with PreprocessPool(backend='thread', num_workers=workers) as pool:
+        rendered = {}
+
+        def keys():
+            for idx, image in enumerate(prefetch(iter_pdf_pages(path), workers)):
+                rendered[idx] = image
+                yield idx
+
+        for _ in preprocess_with_store(pool, None, keys(), lambda idx: rendered.pop(idx), lookahead=workers):
+            count += 1
+    return count
+
+
+def measure(fn, path, workers, conn):
+    start = time.perf_counter()
+    pages = fn(path, workers)
+    conn.send((pages, time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--tmp", default="/tmp")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('fork')
+    for num_pages in args.pages:
+        path = os.path.join(args.tmp, f"bench_streaming_{num_pages}.pdf")
+        synthetic_pdf(path, num_pages)
+        for name, fn in (("list", run_list), ("streaming", run_streaming)):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=measure, args=(fn, path, args.workers, child))
+            proc.start()
+            proc.join()
+            if not parent.poll():
+                # typically the OOM killer, for the list flow on large documents
+                print(f"{num_pages:6d} pages  {name:10s} died with exit code {proc.exitcode}")
+                continue
+            pages, elapsed, peak_mb = parent.recv()
+            print(f"{num_pages:6d} pages  {name:10s} peak RSS {peak_mb:9.0f} MB  {pages / elapsed:7.1f} pages/s")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
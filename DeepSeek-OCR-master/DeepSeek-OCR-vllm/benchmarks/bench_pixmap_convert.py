@@ -0,0 +1,64 @@
+"""
+Pages/s for turning rendered PDF pages into PIL images: the old PNG encode/decode round trip vs
+building the image straight from the pixmap samples.
+
+    python benchmarks/bench_pixmap_convert.py [--pages 40] [--dpi 144]
+
+Rendering itself is timed separately, so the conversion cost can be read against it.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from PIL import Image
+
+from process.pdf_render import pixmap_to_image
+
+
+def synthetic_pdf(num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        text = f"Page {page_num + 1}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        page.insert_textbox(fitz.Rect(54, 54, 558, 400), text, fontsize=10)
+        page.draw_rect(fitz.Rect(54, 420, 558, 738), color=(0, 0, 0), fill=(0.9, 0.6, 0.2))
+    return doc
+
+
+def png_roundtrip(pixmap):
+    img = Image.open(io.BytesIO(pixmap.tobytes("png")))
+    img.load()
+    return img
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--dpi", type=int, default=144)
+    args = parser.parse_args()
+
+    doc = synthetic_pdf(args.pages)
+    zoom = args.dpi / 72.0
+    matrix = fitz.Matrix(zoom, zoom)
+
+    start = time.perf_counter()
+    pixmaps = [page.get_pixmap(matrix=matrix, alpha=False) for page in doc]
+    render = time.perf_counter() - start
+    print(f"render      {args.pages / render:8.1f} pages/s")
+
+    for name, convert in (("png", png_roundtrip), ("samples", pixmap_to_image)):
+        start = time.perf_counter()
+        for pixmap in pixmaps:
+            convert(pixmap)
+        elapsed = time.perf_counter() - start
+        print(f"{name:10s}  {args.pages / elapsed:8.1f} pages/s  "
+              f"render+convert {args.pages / (render + elapsed):6.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Thread pool vs process pool preprocessing (tokenize_with_images) on a PDF.
+
+    python benchmarks/bench_preprocess_pool.py [path/to/doc.pdf] [--pages 500] [--workers 32]
+
+Without a path a synthetic text PDF with --pages pages is generated. Pages are rendered
+once up front (144 dpi, as in run_dpsk_ocr_pdf.py) so only preprocessing is timed.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from PIL import Image
+
+from config import NUM_WORKERS
+from process.preprocess_pool import PreprocessPool
+
+
+def synthetic_pdf(num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        text = f"Page {page_num + 1}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        page.insert_textbox(fitz.Rect(54, 54, 558, 738), text, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return fitz.open("pdf", data)
+
+
+def render(doc, num_pages, dpi=144):
+    matrix = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    images = []
+    for page_num in range(min(num_pages, doc.page_count)):
+        pixmap = doc[page_num].get_pixmap(matrix=matrix, alpha=False)
+        images.append(Image.open(io.BytesIO(pixmap.tobytes("png"))).convert('RGB'))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf", nargs="?")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf) if args.pdf else synthetic_pdf(args.pages)
+    images = render(doc, args.pages)
+    print(f"{len(images)} pages rendered, {args.workers} workers")
+
+    for backend in ("thread", "process"):
+        start = time.perf_counter()
+        with PreprocessPool(backend=backend, num_workers=args.workers) as pool:
+            for _ in pool.map(images):
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"{backend:>8}: {elapsed:8.2f}s  {len(images) / elapsed:8.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Per-page overhead of building a DeepseekOCRProcessor for every page vs reusing the shared one.
+
+    python benchmarks/bench_processor_reuse.py [--images 10000] [--size 640]
+
+Pages default to 640x640 (no tiles) so the fixed per-page cost dominates.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from process.image_process import DeepseekOCRProcessor, get_processor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=640)
+    args = parser.parse_args()
+
+    page = Image.new("RGB", (args.size, args.size), "white")
+    get_processor()  # load the tokenizer outside the timed loops
+
+    start = time.perf_counter()
+    for _ in range(args.images):
+        DeepseekOCRProcessor().tokenize_with_images(images=[page], bos=True, eos=True)
+    fresh = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.images):
+        get_processor().tokenize_with_images(images=[page], bos=True, eos=True)
+    shared = time.perf_counter() - start
+
+    print(f"fresh processor per page: {fresh:8.2f}s  {fresh / args.images * 1e3:7.3f} ms/page")
+    print(f"shared processor:         {shared:8.2f}s  {shared / args.images * 1e3:7.3f} ms/page")
+    print(f"saved per page:           {(fresh - shared) / args.images * 1e3:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
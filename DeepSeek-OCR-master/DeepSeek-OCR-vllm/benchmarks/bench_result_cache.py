@@ -0,0 +1,71 @@
+"""
+Overhead of the page result cache: hashing a rendered page, a lookup (hit and miss), storing an
+output, and opening a cache that already holds --entries outputs.
+
+    python benchmarks/bench_result_cache.py [--entries 20000] [--pages 20]
+
+A hit replaces a full decode of the page by the model (seconds of GPU time for a dense page).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from process.modes import get_mode
+from process.pdf_render import pixmap_to_image
+from process.result_cache import PageResultCache
+from process.tensor_store import PageTensorStore
+
+OUTPUT = "<|ref|>text<|/ref|><|det|>[[54, 80, 945, 620]]<|/det|>\n" + "Lorem ipsum dolor sit amet. " * 120
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    mode = get_mode()
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_textbox(fitz.Rect(54, 54, 558, 738), "Lorem ipsum dolor sit amet. " * 200, fontsize=10)
+    image = pixmap_to_image(page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False))
+
+    start = time.perf_counter()
+    for _ in range(args.pages):
+        digest = PageTensorStore.digest_image(image)
+    digest_ms = (time.perf_counter() - start) / args.pages * 1000
+
+    with tempfile.TemporaryDirectory() as root:
+        cache = PageResultCache(root)
+        keys = [PageResultCache.make_key(f"{i:064x}", mode, "p", {}) for i in range(args.entries)]
+        start = time.perf_counter()
+        for key in keys:
+            cache.put(key, OUTPUT)
+        put_ms = (time.perf_counter() - start) / args.entries * 1000
+
+        start = time.perf_counter()
+        cache = PageResultCache(root)
+        open_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in keys[:1000]:
+            cache.get(key)
+        hit_ms = (time.perf_counter() - start) / 1000 * 1000
+        start = time.perf_counter()
+        for _ in range(1000):
+            cache.get(PageResultCache.make_key(digest, mode, "q", {}))
+        miss_ms = (time.perf_counter() - start) / 1000 * 1000
+
+    print(f"digest {image.size[0]}x{image.size[1]} page {digest_ms:6.2f} ms")
+    print(f"put {put_ms:6.3f} ms  hit {hit_ms:6.3f} ms  miss {miss_ms:6.3f} ms")
+    print(f"open with {args.entries} entries {open_s:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
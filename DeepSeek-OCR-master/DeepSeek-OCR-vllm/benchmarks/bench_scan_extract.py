@@ -0,0 +1,82 @@
+"""
+Pages/s for scanned PDF pages with and without extract_scans: rendering with get_pixmap at
+render_zoom vs decoding the embedded JPEG straight from its stream (scan_image), then the same pages
+through tokenize_with_images, whose vision tokens must match.
+
+    python benchmarks/bench_scan_extract.py [--pages 6] [--dpi 200 300 600] [--mode gundam]
+
+Synthetic scans are letter pages holding a single full-page grayscale JPEG of text-like stripes with
+scanner noise, a different image on every page.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from process.image_process import get_processor
+from process.modes import get_mode
+from process.pdf_render import iter_pdf_pages, scan_image
+
+
+def synthetic_scan(dpi, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    y, x = np.indices((height, width))
+    line = dpi // 6
+    ink = ((y % line) < line // 3) & (((x // (dpi // 10)) + (y // line)) % 5 != 0)
+    ink &= (x > dpi) & (x < width - dpi) & (y > dpi) & (y < height - dpi)
+    pixels = np.where(ink, 40, 235) + rng.normal(0, 6, size=(height, width))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--dpi", type=int, nargs="+", default=[200, 300, 600])
+    parser.add_argument("--mode", default=None)
+    parser.add_argument("--tmp", default="/tmp")
+    args = parser.parse_args()
+
+    mode = get_mode(args.mode)
+    path = os.path.join(args.tmp, "bench_scan_extract.pdf")
+    for scan_dpi in args.dpi:
+        doc = fitz.open()
+        for page_num in range(args.pages):
+            # one image per page: MuPDF would otherwise decode a shared image once and cache it
+            page = doc.new_page(width=612, height=792)
+            page.insert_image(page.rect, stream=synthetic_scan(scan_dpi, seed=page_num))
+        extracted = scan_image(doc[0], mode) is not None
+        doc.save(path)
+        doc.close()
+
+        processor = get_processor()
+        rates = []
+        for extract_scans in (False, True):
+            render = preprocess = 0.0
+            start = time.perf_counter()
+            for image in iter_pdf_pages(path, mode=mode, extract_scans=extract_scans):
+                render += time.perf_counter() - start
+                start = time.perf_counter()
+                tokens = processor.tokenize_with_images(images=[image], bos=True, eos=True, mode=mode)[0][5][0]
+                preprocess += time.perf_counter() - start
+                start = time.perf_counter()
+            rates.append(args.pages / (render + preprocess))
+            print(f"{scan_dpi} dpi scan  extract_scans={extract_scans!s:5s} {image.size[0]:5d}x{image.size[1]:<5d} "
+                  f"tokens {tokens:5d}  render {render / args.pages * 1000:6.1f} ms  "
+                  f"preprocess {preprocess / args.pages * 1000:6.1f} ms  {rates[-1]:5.1f} pages/s"
+                  + ("" if extracted or not extract_scans else "  (rendered)"))
+        print(f"{scan_dpi} dpi scan  x{rates[1] / rates[0]:.2f}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Startup cost: module import time and time to the first preprocessed request.
+
+    python benchmarks/bench_startup.py [--repeat 3]
+
+Each measurement runs in a fresh interpreter so nothing is cached between runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+VLLM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import config
+t1 = time.perf_counter()
+import process.image_process as image_process
+t2 = time.perf_counter()
+from PIL import Image
+page = Image.new("RGB", (1224, 1584), "white")
+image_process.get_processor().tokenize_with_images(images=[page], bos=True, eos=True)
+t3 = time.perf_counter()
+print(json.dumps({"import config": t1 - t0, "import image_process": t2 - t1, "first request": t3 - t2}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=VLLM_DIR, check=True,
+                             capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    for key in runs[0]:
+        values = sorted(run[key] for run in runs)
+        print(f"{key:>22}: median {values[len(values) // 2] * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Cost of the text-layer route: ms/page to profile a PDF page and, when its text layer is used,
+build its markdown, and the share of pages that skip the model.
+
+    python benchmarks/bench_text_layer.py [--pdf document.pdf] [--pages 100]
+
+Without --pdf a synthetic document is used in which every fourth page is a scan (a full page image).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from process.pdf_text import text_layer_markdown
+
+
+def synthetic_pdf(num_pages):
+    doc = fitz.open()
+    scan = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 1224, 1584), 0)
+    for page_num in range(num_pages):
+        page = doc.new_page(width=612, height=792)
+        if page_num % 4 == 3:
+            page.insert_image(page.rect, pixmap=scan)
+            continue
+        page.insert_text((54, 60), f"Section {page_num + 1}", fontsize=20)
+        text = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+        page.insert_textbox(fitz.Rect(54, 80, 558, 500), text, fontsize=10)
+        for row in range(5):
+            page.draw_line((54, 520 + row * 20), (414, 520 + row * 20))
+        for x in (54, 234, 414):
+            page.draw_line((x, 520), (x, 600))
+        for row in range(4):
+            page.insert_text((58, 534 + row * 20), f"row {row}", fontsize=10)
+            page.insert_text((238, 534 + row * 20), f"{row * 3.5:.1f}", fontsize=10)
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=None)
+    parser.add_argument("--pages", type=int, default=100)
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf) if args.pdf else synthetic_pdf(args.pages)
+    routed = 0
+    start = time.perf_counter()
+    for page in doc:
+        routed += text_layer_markdown(page) is not None
+    elapsed = time.perf_counter() - start
+    print(f"{doc.page_count} pages  {elapsed / doc.page_count * 1000:6.2f} ms/page  "
+          f"{routed} from the text layer, {doc.page_count - routed} to the model")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 # Base: base_size = 1024, image_size = 1024, crop_mode = False
 # Large: base_size = 1280, image_size = 1280, crop_mode = False
 # Gundam: base_size = 1024, image_size = 640, crop_mode = True
+# The values below are the default mode; a request can pick another one by name (process/modes.py).
 
 BASE_SIZE = 1024
 IMAGE_SIZE = 640
@@ -11,13 +12,38 @@ CROP_MODE = True
 MIN_CROPS= 2
 MAX_CROPS= 6 # max:9; If your GPU memory is small, it is recommended to set it to 6.
 MAX_CONCURRENCY = 100 # If you have limited GPU memory, lower the concurrency count.
+MAX_INFLIGHT_PAGES = 200 # PDF pages between rendering and writing; bounds host memory, keep it above MAX_CONCURRENCY
 NUM_WORKERS = 64 # image pre-process (resize/padding) workers 
+ADAPTIVE_DPI = True # render each PDF page at the size its tile plan needs instead of a fixed 144 dpi
+EXTRACT_SCAN_IMAGES = True # scanned PDF pages (one full-page image) are decoded from the embedded image instead of rendered
+PDF_RENDER_WORKERS = 8 # processes rasterizing PDF pages; 1 renders them in the calling thread
+PREPROCESS_BACKEND = 'thread' # 'thread' or 'process'; process workers return tensors through shared memory
+TENSOR_STORE_PATH = '' # on-disk store of preprocessed pages reused across runs ('' disables it); pairs well with UINT8_TRANSPORT
+TENSOR_STORE_MAX_GB = 50
+RESULT_CACHE_PATH = '' # on-disk cache of the model output per page, keyed by page pixels, mode, prompt and sampling ('' disables it)
+RESULT_CACHE_MAX_GB = 5
+REPEAT_CACHE_PAGES = 10000 # outputs a PDF run keeps in memory, so a page repeated anywhere later in the run is not decoded again
 PRINT_NUM_VIS_TOKENS = False
+UINT8_TRANSPORT = False # send uint8 pixels to the engine and normalize on the GPU (4x less host memory per page)
 SKIP_REPEAT = True
+LAYOUT_PDF = 'vector' # _layouts.pdf: 'vector' draws the boxes on a copy of the input PDF, 'raster' re-encodes every page as a JPEG with them drawn in
+PAGE_RANGE = '' # pages of each PDF to convert: '1-5,8', '10-', 'first 3', 'last 2' ('' for all); the others are never rendered
+RESUME = True # a rerun continues after the last page in each document's checkpoint (<name>_pages next to its output) and skips documents already converted
+MAX_DECODE_PIXELS = 1_000_000_000 # images that would need more decoded pixels than this are rejected (JPEGs decode scaled down)
+SKIP_BLANK_PAGES = True # blank pages get an empty result without going through the model
+BLANK_THUMB_SIZE = 256 # long side of the thumbnail blank detection looks at
+BLANK_INK_THRESHOLD = 48 # gray levels away from the page background that count as ink
+BLANK_MAX_INK_RATIO = 0.0002 # pages with at most this fraction of ink pixels are blank
+TEXT_LAYER_ROUTING = True # PDF pages with a reliable embedded text layer are converted from it instead of going through the model
+TEXT_LAYER_MIN_CHARS = 20 # visible characters a page needs before its text layer is trusted
+TEXT_LAYER_MAX_GRAPHICS = 0.35 # pages with more of their area under images or vector graphics go to the model
+TRIM_MARGINS = False # crop pages to their content before the tile grid is chosen (fewer tiles for wide margins)
+TRIM_PADDING = 0.02 # margin kept around the content, as a fraction of the page's long side
 MODEL_PATH = 'deepseek-ai/DeepSeek-OCR' # change to your model path
 
 # TODO: change INPUT_PATH
 # .pdf: run_dpsk_ocr_pdf.py; 
+# directory, glob or .txt list of PDFs and images: run_dpsk_ocr_pdf.py (one engine for all of them, outputs per document)
 # .jpg, .png, .jpeg: run_dpsk_ocr_image.py; 
 # Omnidocbench images path: run_dpsk_ocr_eval_batch.py
 
@@ -37,6 +63,18 @@ PROMPT = '<image>\n<|grounding|>Convert the document to markdown.'
 # .......
 
 
-from transformers import AutoTokenizer
+from functools import lru_cache
 
-TOKENIZER = AutoTokenizer.from_pretrained(MODEL_PATH, trust_remote_code=True)
+
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    # loaded on first use, so importing config (and everything that imports it) stays cheap
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(MODEL_PATH, trust_remote_code=True)
+
+
+def __getattr__(name):
+    # config.TOKENIZER is kept for existing callers and resolves lazily
+    if name == 'TOKENIZER':
+        return get_tokenizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
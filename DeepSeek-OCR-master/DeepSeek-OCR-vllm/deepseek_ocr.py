@@ -2,12 +2,14 @@
 """Inference-only Deepseek-OCR model compatible with HuggingFace weights."""
 import math
 from collections.abc import Iterable, Mapping, Sequence
+from functools import lru_cache
 from typing import List, Literal, Optional, Set, Tuple, TypedDict, Union
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange, repeat
+from PIL import Image
 from transformers import BatchFeature
 
 from vllm.config import VllmConfig
@@ -27,8 +29,9 @@ from vllm.sequence import IntermediateTensors
 from vllm.transformers_utils.configs.deepseek_vl2 import (DeepseekVLV2Config,
                                                           MlpProjectorConfig,
                                                           VisionEncoderConfig)
-from process.image_process import (
-    DeepseekOCRProcessor, count_tiles)
+from process.image_process import DeepseekOCRProcessor, IMAGE_MEAN, IMAGE_STD, get_processor, iter_image_inputs
+from process.modes import DEFAULT_MODE, get_mode
+from process.tile_planner import get_tile_planner
 from vllm.transformers_utils.tokenizer import cached_tokenizer_from_config
 # from vllm.utils import is_list_of
 
@@ -62,48 +65,17 @@ class DeepseekOCRProcessingInfo(BaseProcessingInfo):
                              *,
                              image_width: int,
                              image_height: int,
-                             cropping: bool = True) -> int:
-        hf_processor = self.get_hf_processor()
-
-
-        # image_size = hf_processor.image_size
-        # patch_size = hf_processor.patch_size
-        # downsample_ratio = hf_processor.downsample_ratio
-
-        image_size = IMAGE_SIZE
-        base_size = BASE_SIZE
-        patch_size = 16
-        downsample_ratio = 4
-
-        if CROP_MODE:
-            if image_width <= 640 and image_height <= 640:
-                crop_ratio = [1, 1]
-            else:
-                # images_crop_raw, crop_ratio = hf_processor.dynamic_preprocess(image)
-
-                # find the closest aspect ratio to the target
-                crop_ratio = count_tiles(image_width, image_height, image_size=IMAGE_SIZE)
-
-                # print('===========')
-                # print('crop_ratio ', crop_ratio)
-                # print('============')
-                
-            num_width_tiles, num_height_tiles = crop_ratio
+                             cropping: bool = True,
+                             mode=None) -> int:
+        # per-request resolution mode (mm_processor_kwargs["mode"]), else the config.py mode
+        if mode is None:
+            mode = DEFAULT_MODE._replace(crop_mode=cropping)
         else:
-            num_width_tiles = num_height_tiles = 1
+            mode = get_mode(mode)
 
-        h = w = math.ceil((base_size // patch_size) / downsample_ratio)
-
-        h2 = w2 = math.ceil((image_size // patch_size) / downsample_ratio)
-
-        global_views_tokens = h * (w + 1)
-        if num_width_tiles >1 or num_height_tiles>1:
-            local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
-        else:
-            local_views_tokens = 0
-
-
-        return global_views_tokens + local_views_tokens + 1
+        # pixel-free and memoized; no need to build the HF processor here
+        return get_tile_planner().num_image_tokens(
+            image_width, image_height, mode.base_size, mode.image_size, mode.crop_mode)
 
     def get_image_size_with_most_features(self) -> ImageSize:
 
@@ -112,6 +84,13 @@ class DeepseekOCRProcessingInfo(BaseProcessingInfo):
         return ImageSize(width=640*2, height=640*2)
 
 
+@lru_cache(maxsize=8)
+def _dummy_image_features(width: int, height: int, num_images: int):
+    # profiling asks for the same dummy inputs on every engine start; preprocess them once
+    images = [Image.new("RGB", (width, height), color=255) for _ in range(num_images)]
+    return get_processor().tokenize_with_images(images=images, bos=True, eos=True, cropping=CROP_MODE)
+
+
 class DeepseekOCRDummyInputsBuilder(
         BaseDummyInputsBuilder[DeepseekOCRProcessingInfo]):
 
@@ -135,9 +114,7 @@ class DeepseekOCRDummyInputsBuilder(
         if '<image>' in PROMPT:
             return {
                 "image":
-                DeepseekOCRProcessor().tokenize_with_images(images = self._get_dummy_images(width=max_image_size.width,
-                                    height=max_image_size.height,
-                                    num_images=num_images), bos=True, eos=True, cropping=CROP_MODE)
+                _dummy_image_features(max_image_size.width, max_image_size.height, num_images)
             }
         else:
             return {
@@ -197,6 +174,7 @@ class DeepseekOCRMultiModalProcessor(
 
         image_token_id = hf_processor.image_token_id
         assert isinstance(image_token_id, int)
+        mode = hf_processor_mm_kwargs.get("mode")
 
         def get_replacement_deepseek_vl2(item_idx: int):
             images = mm_items.get_items(
@@ -217,6 +195,7 @@ class DeepseekOCRMultiModalProcessor(
                     image_height=height,
                     # flag = True,
                     cropping=CROP_MODE,
+                    mode=mode,
                 )
             return [image_token_id] * num_image_tokens
 
@@ -311,6 +290,10 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
                 f"Only 2D tile_tag is supported currently, got: {self.tile_tag}"
             )
 
+        # uint8 pixels (UINT8_TRANSPORT) are normalized on device with these
+        self.register_buffer("pixel_mean", torch.tensor(IMAGE_MEAN, dtype=torch.float32).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer("pixel_std", torch.tensor(IMAGE_STD, dtype=torch.float32).view(1, 3, 1, 1), persistent=False)
+
         if self.text_config.topk_method == "noaux_tc":
             architectures = ["DeepseekV3ForCausalLM"]
         elif not self.text_config.use_mla:
@@ -338,7 +321,7 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         images_crop = kwargs.pop("images_crop", None)
 
 
-        if pixel_values is None or torch.sum(pixel_values).item() == 0:
+        if pixel_values is None:
             return None
 
         if pixel_values is not None:
@@ -354,6 +337,10 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
                 raise ValueError("Incorrect type of image crop. "
                                  f"Got type: {type(images_crop)}")
 
+            # only the processor's stand-in for a prompt without an image: nothing to embed
+            if next(iter_image_inputs(pixel_values, images_crop, images_spatial_crop), None) is None:
+                return None
+
             return [pixel_values, images_crop, images_spatial_crop]
 
 
@@ -361,17 +348,24 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
     
 
 
+    def _to_model_pixels(self, x: torch.Tensor) -> torch.Tensor:
+        if x.dtype == torch.uint8:
+            # same math as ImageTransform (ToTensor + Normalize), done on device
+            x = x.to(torch.float32).div_(255).sub_(self.pixel_mean).div_(self.pixel_std)
+        return x.to(torch.bfloat16)
+
     def _pixel_values_to_embedding(
         self,
-        pixel_values: torch.Tensor,
-        images_crop: torch.Tensor,
-        images_spatial_crop: torch.Tensor,
+        pixel_values: NestedTensors,
+        images_crop: NestedTensors,
+        images_spatial_crop: NestedTensors,
     ) -> NestedTensors:
 
         # Pixel_values (global view): [n_image, batch_size, 3, height, width]
         # images_spatial_crop: [n_image, batch_size, [num_tiles_w, num_tiles_h]]
         # images_crop (local view): [n_image, batch_size, num_pathes, 3, h, w]
         # split the pixel and image_crop, all batch_size = 1
+        # a batch mixing modes or tile counts arrives as lists of per-image tensors instead
 
         images_in_this_batch = []
 
@@ -382,13 +376,15 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
 
 
         with torch.no_grad():
-            for jdx in range(images_spatial_crop.size(0)):
+            for image_ori, patches, crop_shape in iter_image_inputs(pixel_values, images_crop, images_spatial_crop):
                 # with torch.set_grad_enabled(False):
-                patches = images_crop[jdx][0].to(torch.bfloat16) # batch_size = 1
-                image_ori = pixel_values[jdx]
-                crop_shape = images_spatial_crop[jdx][0]
+                image_ori = self._to_model_pixels(image_ori)
 
-                if torch.sum(patches).item() != 0:  # if all values = 0, no crop
+                width_crop_num, height_crop_num = crop_shape
+                # as in tokenize_with_images: local views only for more than one tile; pixel sums
+                # can't tell, an all-black page of uint8 tiles sums to 0 too
+                if width_crop_num > 1 or height_crop_num > 1:
+                    patches = self._to_model_pixels(patches)
                     # P, C, H, W = patches.shape
                     # crop_flag = 1
                     local_features_1 = self.sam_model(patches)
@@ -418,8 +414,6 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
                     _2, hw2, n_dim2 = local_features.shape
                     h2 = w2 = int(hw2 ** 0.5)
 
-                    width_crop_num, height_crop_num = crop_shape[0], crop_shape[1]
-
                     global_features = global_features.view(h, w, n_dim)
 
                     global_features = torch.cat(
@@ -472,7 +466,8 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
 
         # image_input: [pixel_values, images_crop, images_spatial_crop]
     
-        pixel_values = image_input[0].to(torch.bfloat16)
+        # cast (and for uint8 inputs, normalize) per image in _pixel_values_to_embedding
+        pixel_values = image_input[0]
         # print(image_input[1][0].shape)
         # print(type(image_input[1]))
         # exit()
@@ -480,7 +475,7 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         # images_crop = image_input[1].to(torch.bfloat16)
         images_crop = image_input[1]
         # images_crop = image_input[1]
-        images_spatial_crop = image_input[2].to(dtype=torch.long)
+        images_spatial_crop = image_input[2]
 
         # local_start = time.time()
         vision_features = self._pixel_values_to_embedding(
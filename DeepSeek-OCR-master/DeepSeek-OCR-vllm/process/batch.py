@@ -0,0 +1,54 @@
+import glob
+import os
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+DOCUMENT_EXTENSIONS = ('.pdf',) + IMAGE_EXTENSIONS
+LIST_EXTENSIONS = ('.txt', '.lst')  # a manifest: one input path per line, relative to the manifest
+
+
+def is_batch_input(input_path):
+    """Whether input_path names a batch of documents (a directory, a glob or a manifest) rather than one file."""
+    return (os.path.isdir(input_path) or glob.has_magic(input_path)
+            or input_path.lower().endswith(LIST_EXTENSIONS))
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def list_documents(input_path):
+    """
+    The PDFs and images of a batch input, in a stable order: the files under a directory (recursively,
+    sorted), the matches of a glob (sorted), or the paths listed in a manifest (in listed order).
+    Other files are ignored; blank lines and lines starting with # in a manifest are skipped.
+    """
+    if os.path.isdir(input_path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(input_path) for name in names)
+    elif glob.has_magic(input_path):
+        paths = sorted(glob.glob(input_path, recursive=True))
+    else:
+        base = os.path.dirname(input_path)
+        with open(input_path, encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+    return [path for path in paths if path.lower().endswith(DOCUMENT_EXTENSIONS) and os.path.isfile(path)]
+
+
+def output_dirs(paths, output_path):
+    """
+    Output directory of every document of a batch: its path relative to the inputs' common directory,
+    without the extension, under output_path (so each document keeps its own images/ for figure crops).
+    Documents that would share a directory (a.pdf next to a.png) keep their extension instead.
+    """
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    dirs, used = [], set()
+    for path in paths:
+        relative = os.path.relpath(os.path.abspath(path), root)
+        out_dir = os.path.join(output_path, os.path.splitext(relative)[0])
+        if out_dir in used:
+            out_dir = os.path.join(output_path, relative)
+        used.add(out_dir)
+        dirs.append(out_dir)
+    return dirs
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+
+MANIFEST = 'manifest.jsonl'
+
+# manifest status of a finished page
+PAGE_WRITTEN = 'page'  # .mmd and _det.mmd fragments, and a layout image if one was given
+PAGE_BLANK = 'blank'  # same files, holding BLANK_PAGE_MARK
+PAGE_DROPPED = 'dropped'  # no files: cut off by the repeat guard and dropped (SKIP_REPEAT)
+
+
+class PageCheckpoint:
+    """
+    Per-page results of a PDF run, kept on disk as they finish so an interrupted run can be resumed.
+
+    Every finished page leaves its .mmd and _det.mmd fragments (and its layout image) in directory,
+    then a line in manifest.jsonl; the manifest is only appended to once the fragments are on disk,
+    so a page it lists is complete. The first line records the input and the settings the results
+    depend on; a checkpoint made with different ones is discarded instead of resumed.
+
+    Pages finish in page order, so the manifest lists the pages done, in increasing order (every page,
+    or those of a page selection), and a resumed run carries on with the pages from next_page on. Once the document's output is written, mark_complete() drops the fragments
+    and leaves only the manifest, ending in a complete record, so later runs can skip the document.
+    """
+
+    def __init__(self, directory, settings, resume=True):
+        self.directory = directory
+        # compared with the first line of the manifest, so in the form it reads back as
+        self.settings = json.loads(json.dumps(settings))
+        self.pages = []  # (page index, status) in page order
+        self.complete = False
+        self._manifest = None
+        if resume:
+            self.pages, self.complete = self._load()
+        if not self.pages and not self.complete:
+            shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return [], False
+        try:
+            if not lines or json.loads(lines[0]) != self.settings:
+                return [], False
+        except ValueError:
+            return [], False
+        pages = []
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # last line cut short by the interruption
+            if record.get('complete'):
+                return pages, True
+            if pages and record['page'] <= pages[-1][0]:
+                break
+            pages.append((record['page'], record['status']))
+        return pages, False
+
+    @staticmethod
+    def input_settings(pdf_path, **settings):
+        """Settings identifying a run over pdf_path: the file (path, size, mtime) plus the given ones."""
+        stat = os.stat(pdf_path)
+        return {'input': os.path.abspath(pdf_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, **settings}
+
+    @property
+    def next_page(self):
+        """The page after the last one done."""
+        return self.pages[-1][0] + 1 if self.pages else 0
+
+    def path(self, idx, suffix):
+        return os.path.join(self.directory, f'{idx}{suffix}')
+
+    def fragment(self, idx, suffix):
+        with open(self.path(idx, suffix), encoding='utf-8') as f:
+            return f.read()
+
+    def layout_paths(self):
+        return [self.path(idx, '.jpg') for idx, status in self.pages if status != PAGE_DROPPED]
+
+    def add(self, idx, status, mmd=None, mmd_det=None, layout=None):
+        """Record finished page idx; mmd / mmd_det are its text, layout its layout image (PIL) or None."""
+        if status != PAGE_DROPPED:
+            with open(self.path(idx, '.mmd'), 'w', encoding='utf-8') as f:
+                f.write(mmd)
+            with open(self.path(idx, '_det.mmd'), 'w', encoding='utf-8') as f:
+                f.write(mmd_det)
+            if layout is not None:
+                layout.convert('RGB').save(self.path(idx, '.jpg'), format='JPEG', quality=95)
+
+        self._open_manifest()
+        self._manifest.write(json.dumps({'page': idx, 'status': status}) + '\n')
+        self._manifest.flush()
+        os.fsync(self._manifest.fileno())
+        self.pages.append((idx, status))
+
+    def _open_manifest(self):
+        if self._manifest is None:
+            # rewritten from what was loaded, which also drops a line cut short by an interruption;
+            # replaced in one step, so an interruption now can not lose the pages already done
+            manifest_path = os.path.join(self.directory, MANIFEST)
+            with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(json.dumps(self.settings) + '\n')
+                for page, page_status in self.pages:
+                    f.write(json.dumps({'page': page, 'status': page_status}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(manifest_path + '.tmp', manifest_path)
+            self._manifest = open(manifest_path, 'a', encoding='utf-8')
+
+    def assemble(self, mmd_path, mmd_det_path):
+        """Write the .mmd and _det.mmd of the document from the fragments of every finished page."""
+        for out_path, suffix in ((mmd_path, '.mmd'), (mmd_det_path, '_det.mmd')):
+            with open(out_path, 'w', encoding='utf-8') as out:
+                for idx, status in self.pages:
+                    if status != PAGE_DROPPED:
+                        with open(self.path(idx, suffix), encoding='utf-8') as f:
+                            shutil.copyfileobj(f, out)
+
+    def close(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def mark_complete(self):
+        """Drop the fragments once the document's output is written, keeping the manifest as a record of it."""
+        self._open_manifest()
+        self._manifest.write(json.dumps({'complete': True}) + '\n')
+        self._manifest.flush()
+        os.fsync(self._manifest.fileno())
+        self.close()
+        for name in os.listdir(self.directory):
+            if name != MANIFEST:
+                os.remove(os.path.join(self.directory, name))
+        self.complete = True
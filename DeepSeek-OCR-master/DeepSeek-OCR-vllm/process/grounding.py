@@ -0,0 +1,74 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+GROUNDING_PATTERN = re.compile(r'<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>', re.DOTALL)
+_NUM = r'\s*(-?\d+(?:\.\d+)?)\s*'
+BOX_PATTERN = re.compile(r'\[' + ','.join([_NUM] * 4) + r'\]')
+
+# what the runners have always rewritten in the markdown
+LATEX_REPLACEMENTS = {'\\coloneqq': ':=', '\\eqqcolon': '=:'}
+
+
+class GroundingBlock(NamedTuple):
+    label: str
+    boxes: np.ndarray  # (n, 4) x1, y1, x2, y2 in the model's 0-999 coordinates
+    start: int  # span of the <|ref|>...<|/det|> tag in the text
+    end: int
+
+
+def parse_boxes(det_text):
+    """
+    The [x1, y1, x2, y2] boxes of the inside of a <|det|> tag as an (n, 4) float array. Only numbers are
+    read, never evaluated; malformed boxes are left out.
+    """
+    boxes = BOX_PATTERN.findall(det_text)
+    return np.array(boxes, dtype=np.float64) if boxes else np.zeros((0, 4))
+
+
+def parse_grounding(text):
+    """The grounding blocks of a model output, in text order, found in one pass over it."""
+    return [GroundingBlock(match.group(1), parse_boxes(match.group(2)), match.start(), match.end())
+            for match in GROUNDING_PATTERN.finditer(text)]
+
+
+def to_pixels(boxes, width, height):
+    """Boxes in 0-999 coordinates as integer pixel boxes of a width x height image."""
+    return (boxes / 999 * np.array([width, height, width, height])).astype(np.int64)
+
+
+@lru_cache(maxsize=None)
+def _cleanup_pattern(replacements, collapse_newlines):
+    alternatives = [re.escape(old) for old, _ in replacements]
+    if collapse_newlines:
+        alternatives.append(r'\n{3,}')
+    return re.compile('|'.join(alternatives)) if alternatives else None
+
+
+def to_markdown(text, blocks=None, image_link=None, replacements=LATEX_REPLACEMENTS, collapse_newlines=True):
+    """
+    The markdown of a model output: grounding tags removed, except that with image_link (k -> path)
+    the k-th image block becomes a link to its crop; then replacements applied and runs of blank lines
+    collapsed to one. Built from the spans of blocks (parse_grounding(text) when not given) in one
+    pass over the text and one over the result, however many blocks there are.
+    """
+    if blocks is None:
+        blocks = parse_grounding(text)
+    parts = []
+    position = 0
+    num_images = 0
+    for block in blocks:
+        parts.append(text[position:block.start])
+        if block.label == 'image' and image_link is not None:
+            parts.append(f'![]({image_link(num_images)})\n')
+            num_images += 1
+        position = block.end
+    parts.append(text[position:])
+    markdown = ''.join(parts)
+
+    pattern = _cleanup_pattern(tuple(replacements.items()), collapse_newlines)
+    if pattern is None:
+        return markdown
+    return pattern.sub(lambda m: '\n\n' if m.group().startswith('\n') else replacements[m.group()], markdown)
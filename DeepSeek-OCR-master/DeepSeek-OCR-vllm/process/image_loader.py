@@ -0,0 +1,114 @@
+import math
+import threading
+
+from PIL import Image, ImageOps
+
+from config import MAX_DECODE_PIXELS
+from process.modes import get_mode
+from process.tile_planner import get_tile_planner
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def view_scale(width, height, mode=None):
+    """
+    Scale at which a width x height image just covers every resize tokenize_with_images makes
+    of it in mode: the tile canvas and the global view. Above 1 when the views upscale it.
+    """
+    mode = get_mode(mode)
+    if mode.image_size <= 640 and not mode.crop_mode:
+        # tiny / small stretch the image to image_size x image_size, so both sides must reach it
+        return mode.image_size / min(width, height)
+    plan = get_tile_planner().plan(width, height, mode.base_size, mode.image_size, mode.crop_mode)
+    scale = mode.base_size / max(width, height)
+    if plan.num_tiles:
+        scale = max(scale, plan.canvas_size[0] / width, plan.canvas_size[1] / height)
+    return scale
+
+
+def needed_size(width, height, mode=None):
+    """
+    Smallest (width, height), at the page's aspect ratio, that still covers every resize
+    tokenize_with_images makes of a width x height image in mode: the tile canvas and the global view.
+    """
+    scale = min(view_scale(width, height, mode), 1.0)
+    return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+
+def _crop_ratio(width, height, mode):
+    return get_tile_planner().plan(width, height, mode.base_size, mode.image_size, mode.crop_mode).crop_ratio
+
+
+def _reduction(width, height, need_w, need_h, crop_ratio, mode, factors):
+    """Largest factor that keeps the image at least need_w x need_h and on the same tile grid."""
+    for factor in factors:
+        w, h = math.ceil(width / factor), math.ceil(height / factor)
+        if w >= need_w and h >= need_h and _crop_ratio(w, h, mode) == crop_ratio:
+            return factor
+    return 1
+
+
+def reduction_factor(width, height, mode=None, factors=(8, 4, 2)):
+    """Largest of factors a width x height image can be shrunk by and still meet needed_size on the same tile grid."""
+    mode = get_mode(mode)
+    need_w, need_h = needed_size(width, height, mode)
+    return _reduction(width, height, need_w, need_h, _crop_ratio(width, height, mode), mode, factors)
+
+
+_open_lock = threading.Lock()
+
+
+def _open(path):
+    """
+    Image.open without PIL's decompression bomb check, which looks at the declared size: a huge JPEG
+    still decodes small in draft mode, and load_image enforces MAX_DECODE_PIXELS on what it actually
+    decodes. The check is only off while this file's header is read; everywhere else it stays on.
+    """
+    with _open_lock:
+        limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+def load_image(path, mode=None, exif_transpose=True):
+    """
+    Open an image at the lowest resolution the tile plan of mode needs, as RGB.
+
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale (draft mode), so memory stays bounded by the
+    needed size even for gigapixel scans. Other formats are decoded in full (up to MAX_DECODE_PIXELS)
+    and then shrunk with Image.reduce. Reductions that would move the page onto another tile grid are
+    skipped, so the tokens per page match the full-resolution decode.
+    """
+    mode = get_mode(mode)
+    image = _open(path)
+    orientation = image.getexif().get(0x0112, 1) if exif_transpose else 1
+    transposed = orientation in _TRANSPOSED_ORIENTATIONS
+
+    def upright(size):
+        # sizes as tokenize_with_images will see them, after exif_transpose
+        return size[::-1] if transposed else size
+
+    width, height = upright(image.size)
+    need_w, need_h = needed_size(width, height, mode)
+    crop_ratio = _crop_ratio(width, height, mode)
+
+    if image.format == 'JPEG':
+        scale = _reduction(width, height, need_w, need_h, crop_ratio, mode, (8, 4, 2))
+        if scale > 1:
+            # draft only takes a scale whose result, rounded down, covers the requested size
+            image.draft('RGB', upright((width // scale, height // scale)))
+    if image.size[0] * image.size[1] > MAX_DECODE_PIXELS:
+        image.close()
+        raise ValueError(f"{path}: {width}x{height} image can not be decoded below MAX_DECODE_PIXELS "
+                         f"({MAX_DECODE_PIXELS})")
+
+    w, h = upright(image.size)
+    factor = _reduction(w, h, need_w, need_h, crop_ratio, mode, range(min(w // need_w, h // need_h), 1, -1))
+    if factor > 1:
+        image = image.reduce(factor)
+    if exif_transpose:
+        image = ImageOps.exif_transpose(image)
+    return image.convert('RGB')
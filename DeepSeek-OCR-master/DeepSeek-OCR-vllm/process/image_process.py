@@ -1,61 +1,32 @@
-import math
+import threading
 from typing import List, Tuple
 
+import numpy as np
 import torch
 import torchvision.transforms as T
 from PIL import Image, ImageOps
 from transformers import AutoProcessor, BatchFeature, LlamaTokenizerFast
 from transformers.processing_utils import ProcessorMixin
-from config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, MIN_CROPS, MAX_CROPS, PROMPT, TOKENIZER
-
-def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
-    best_ratio_diff = float('inf')
-    best_ratio = (1, 1)
-    area = width * height
-    for ratio in target_ratios:
-        target_aspect_ratio = ratio[0] / ratio[1]
-        ratio_diff = abs(aspect_ratio - target_aspect_ratio)
-        if ratio_diff < best_ratio_diff:
-            best_ratio_diff = ratio_diff
-            best_ratio = ratio
-        elif ratio_diff == best_ratio_diff:
-            if area > 0.5 * image_size * image_size * ratio[0] * ratio[1]:
-                best_ratio = ratio
-    # print(f'width: {width}, height: {height}, best_ratio: {best_ratio}')
-    return best_ratio
+from config import MIN_CROPS, MAX_CROPS, PROMPT, UINT8_TRANSPORT, get_tokenizer
+from process.modes import get_mode
+from process.tile_planner import count_image_tokens, get_tile_planner
 
+IMAGE_MEAN = (0.5, 0.5, 0.5)
+IMAGE_STD = (0.5, 0.5, 0.5)
 
-def count_tiles(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
 
+# count_tiles and dynamic_preprocess are the original per-tile PIL path; tokenize_with_images no longer
+# uses them, they are kept as the reference its tiles are tested against (tests/test_image_process.py)
+def count_tiles(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
     # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
-
-    return target_aspect_ratio
+    return get_tile_planner(min_num, max_num).best_ratio(orig_width, orig_height, image_size)
 
 
 def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
     orig_width, orig_height = image.size
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
 
     # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+    target_aspect_ratio = count_tiles(orig_width, orig_height, min_num=min_num, max_num=max_num, image_size=image_size)
 
     # print(target_aspect_ratio)
     # calculate the target width and height
@@ -83,6 +54,53 @@ def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=6
     return processed_images, target_aspect_ratio
 
 
+def image_to_tiles(image, image_size=640):
+    """
+    Split an RGB image whose sides are multiples of image_size into a uint8 tensor
+    [num_tiles, 3, image_size, image_size], tiles in row-major order (same order as dynamic_preprocess).
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    width, height = image.size
+    num_width_tiles, num_height_tiles = width // image_size, height // image_size
+
+    # one PIL -> tensor conversion for the whole canvas, then a view + a single copy into tile layout
+    canvas = torch.from_numpy(np.array(image, dtype=np.uint8))
+    tiles = canvas.view(num_height_tiles, image_size, num_width_tiles, image_size, 3)
+    tiles = tiles.permute(0, 2, 4, 1, 3).reshape(num_height_tiles * num_width_tiles, 3, image_size, image_size)
+    return tiles
+
+
+def contain_size(size, box):
+    """Size ImageOps.contain / ImageOps.pad resize an image of the given size to, to fit inside box."""
+    width, height = size
+    if width / height > box[0] / box[1]:
+        return box[0], round(height / width * box[0])
+    if width / height < box[0] / box[1]:
+        return round(width / height * box[1]), box[1]
+    return box
+
+
+def global_view(image, base_size, color, source=None):
+    """
+    ImageOps.pad(image, (base_size, base_size), color=color), optionally resampling from source
+    instead of image. source must be image resized to any size at least as large as the contained
+    view (e.g. the tile canvas): a full-frame resize of a resize is the same mapping, so only the
+    filtering differs. Against resampling the original, text pages derived from their tile canvas
+    differ by under 1 gray level on average and under 32 at the sharpest glyph edges.
+    """
+    size = contain_size(image.size, (base_size, base_size))
+    resized = (image if source is None else source).resize(size)
+    if size == (base_size, base_size):
+        return resized
+    view = Image.new(image.mode, (base_size, base_size), color)
+    if size[0] != base_size:
+        view.paste(resized, (round((base_size - size[0]) * 0.5), 0))
+    else:
+        view.paste(resized, (0, round((base_size - size[1]) * 0.5)))
+    return view
+
+
 
 
 
@@ -103,10 +121,26 @@ class ImageTransform:
 
         self.transform = T.Compose(transform_pipelines)
 
+        self._mean = torch.tensor(mean, dtype=torch.float32)[:, None, None]
+        self._std = torch.tensor(std, dtype=torch.float32)[:, None, None]
+
     def __call__(self, pil_img: Image.Image):
         x = self.transform(pil_img)
         return x
 
+    def to_uint8(self, pil_img: Image.Image):
+        """[3, H, W] uint8 tensor of an RGB image, without rescaling or normalization."""
+        if pil_img.mode != 'RGB':
+            pil_img = pil_img.convert('RGB')
+        return torch.from_numpy(np.array(pil_img, dtype=np.uint8)).permute(2, 0, 1)
+
+    def from_uint8(self, x: torch.Tensor):
+        """Apply the same ToTensor (+ Normalize) math to a uint8 [..., 3, H, W] tensor in one batched op."""
+        x = x.to(dtype=torch.float32).div(255)
+        if self.normalize:
+            x = x.sub_(self._mean).div_(self._std)
+        return x
+
 
 class DeepseekOCRProcessor(ProcessorMixin):
     tokenizer_class = ("LlamaTokenizer", "LlamaTokenizerFast")
@@ -114,12 +148,12 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
     def __init__(
         self,
-        tokenizer: LlamaTokenizerFast = TOKENIZER,
+        tokenizer: LlamaTokenizerFast = None,
         candidate_resolutions: Tuple[Tuple[int, int]] = [[1024, 1024]],
         patch_size: int = 16,
         downsample_ratio: int = 4,
-        image_mean: Tuple[float, float, float] = (0.5, 0.5, 0.5),
-        image_std: Tuple[float, float, float] = (0.5, 0.5, 0.5),
+        image_mean: Tuple[float, float, float] = IMAGE_MEAN,
+        image_std: Tuple[float, float, float] = IMAGE_STD,
         normalize: bool = True,
         image_token: str = "<image>",
         pad_token: str = "<｜▁pad▁｜>",
@@ -127,12 +161,16 @@ class DeepseekOCRProcessor(ProcessorMixin):
         sft_format: str = "deepseek",
         mask_prompt: bool = True,
         ignore_id: int = -100,
+        uint8_transport: bool = UINT8_TRANSPORT,
+        mode=None,
         **kwargs,
     ):
 
         # self.candidate_resolutions = candidate_resolutions # placeholder no use
-        self.image_size = IMAGE_SIZE
-        self.base_size = BASE_SIZE
+        # default resolution mode; tokenize_with_images can override it per request
+        self.mode = get_mode(mode)
+        self.image_size = self.mode.image_size
+        self.base_size = self.mode.base_size
         # self.patch_size = patch_size
         self.patch_size = 16 
         self.image_mean = image_mean
@@ -142,9 +180,18 @@ class DeepseekOCRProcessor(ProcessorMixin):
         self.downsample_ratio = 4
 
         self.image_transform = ImageTransform(mean=image_mean, std=image_std, normalize=normalize)
+        # emit uint8 pixel_values / images_crop; DeepseekOCRForCausalLM normalizes them on device
+        self.uint8_transport = uint8_transport
+        self.pixel_dtype = torch.uint8 if uint8_transport else torch.float32
 
 
+        if tokenizer is None:
+            tokenizer = get_tokenizer()
         self.tokenizer = tokenizer
+        self._encode_lock = threading.Lock()
+        # inference fast path caches (see tokenize_with_images)
+        self._prompt_cache = {}
+        self._image_block_cache = {}
         # self.tokenizer = add_special_token(tokenizer)
         self.tokenizer.padding_side = 'left'  # must set this，padding side with make a difference in batch inference
 
@@ -226,7 +273,9 @@ class DeepseekOCRProcessor(ProcessorMixin):
         return self.tokenizer.pad_token_id
 
     def encode(self, text: str, bos: bool = True, eos: bool = False):
-        t = self.tokenizer.encode(text, add_special_tokens=False)
+        # the (Rust) fast tokenizer is not safe to drive from several threads at once
+        with self._encode_lock:
+            t = self.tokenizer.encode(text, add_special_tokens=False)
 
         if bos:
             t = [self.bos_id] + t
@@ -301,6 +350,7 @@ class DeepseekOCRProcessor(ProcessorMixin):
         prompt: str,
         images: List,
         inference_mode: bool = True,
+        mode=None,
         **kwargs,
     ):
         """
@@ -308,6 +358,7 @@ class DeepseekOCRProcessor(ProcessorMixin):
         Args:
             prompt (str): the formatted prompt;
             images (List[ImageType]): the list of images;
+            mode (str): resolution mode the images were tokenized with (see process/modes.py);
             inference_mode (bool): if True, then remove the last eos token;
             **kwargs:
 
@@ -327,6 +378,28 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
         return prepare
 
+    def _encode_prompt_pieces(self, prompt: str):
+        """Token ids of the text around each <image> tag, encoded once per prompt string."""
+        pieces = self._prompt_cache.get(prompt)
+        if pieces is None:
+            pieces = tuple(torch.tensor(self.encode(text_sep, bos=False, eos=False), dtype=torch.long)
+                           for text_sep in prompt.split(self.image_token))
+            if len(self._prompt_cache) >= 256:
+                self._prompt_cache.clear()
+            self._prompt_cache[prompt] = pieces
+        return pieces
+
+    def _image_token_block(self, crop_ratio, base_size: int, image_size: int):
+        """<image> ids and their seq mask for one image, cached per (crop grid, mode)."""
+        key = (tuple(crop_ratio), base_size, image_size)
+        block = self._image_block_cache.get(key)
+        if block is None:
+            num_tokens = count_image_tokens(crop_ratio, base_size=base_size, image_size=image_size)
+            block = (torch.full((num_tokens,), self.image_token_id, dtype=torch.long),
+                     torch.ones(num_tokens, dtype=torch.bool))
+            self._image_block_cache[key] = block
+        return block
+
     def tokenize_with_images(
         self,
         # conversation: str,
@@ -334,23 +407,39 @@ class DeepseekOCRProcessor(ProcessorMixin):
         bos: bool = True,
         eos: bool = True,
         cropping: bool = True,
+        mode=None,
+        prompt=None,
     ):
-        """Tokenize text with <image> tags."""
+        """Tokenize text with <image> tags.
+
+        mode (name or ResolutionMode) selects base/tile sizes and cropping for this request; without it
+        the processor's mode is used with the given cropping flag. prompt defaults to config.PROMPT.
+        """
+
+        if mode is None:
+            mode = self.mode._replace(crop_mode=cropping)
+        else:
+            mode = get_mode(mode)
+        base_size, image_size, cropping = mode.base_size, mode.image_size, mode.crop_mode
 
         # print(conversation)
-        conversation = PROMPT
+        conversation = PROMPT if prompt is None else prompt
         assert conversation.count(self.image_token) == len(images)
-        text_splits = conversation.split(self.image_token)
-        images_list, images_crop_list, images_seq_mask, images_spatial_crop = [], [], [], []
+        text_pieces = self._encode_prompt_pieces(conversation)
+        images_list, images_crop_list, images_spatial_crop = [], [], []
         image_shapes = []
         num_image_tokens = []
-        tokenized_str = []
+        # inference only: input_ids / images_seq_mask are assembled from cached tensor pieces,
+        # no per-token Python lists and no target ids
+        ids_pieces, mask_pieces = [], []
+        if bos:
+            ids_pieces.append(torch.tensor([self.bos_id], dtype=torch.long))
+            mask_pieces.append(torch.zeros(1, dtype=torch.bool))
         # print('image: ', len(images))
-        for text_sep, image in zip(text_splits, images):
+        for text_piece, image in zip(text_pieces, images):
             """encode text_sep"""
-            tokenized_sep = self.encode(text_sep, bos=False, eos=False)
-            tokenized_str += tokenized_sep
-            images_seq_mask += [False] * len(tokenized_sep)
+            ids_pieces.append(text_piece)
+            mask_pieces.append(torch.zeros(len(text_piece), dtype=torch.bool))
 
             """select best resolution for anyres"""
             # if cropping:
@@ -360,32 +449,35 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
             image_shapes.append(image.size)
 
-            if image.size[0] <= 640 and image.size[1] <= 640:
-                crop_ratio = [1, 1]
-            else:
-                if cropping:
-                    # print('image-size: ', image.size)
-                    # best_width, best_height = select_best_resolution(image.size, self.candidate_resolutions)
-                    # print('image ', image.size)
-                    # print('open_size:', image.size)
-                    images_crop_raw, crop_ratio = dynamic_preprocess(image, image_size=IMAGE_SIZE)
-                    # print('crop_ratio: ', crop_ratio)
-                else:
-                    # best_width, best_height = self.image_size, self.image_size
-                    crop_ratio = [1, 1]
+            # crop grid and tile boxes come from the pixel-free planner
+            plan = get_tile_planner().plan(image.size[0], image.size[1], base_size, image_size, cropping)
+            crop_ratio = plan.crop_ratio
+            # one full-resolution resample per page: when the tile canvas is a downscale of the page,
+            # the global view is derived from it instead of from the original
+            canvas = None
+            if plan.num_tiles:
+                canvas = image.resize(plan.canvas_size)
+                images_crop_raw = image_to_tiles(canvas, image_size)
+                global_size = contain_size(image.size, (base_size, base_size))
+                if (canvas.size[0] * canvas.size[1] >= image.size[0] * image.size[1]
+                        or canvas.size[0] < global_size[0] or canvas.size[1] < global_size[1]):
+                    canvas = None
             # print(image.size, (best_width, best_height)) # check the select_best_resolutions func
 
             # print(crop_ratio)
             """process the global view"""
 
             # if cropping
-            if self.image_size <= 640 and not cropping:
+            if image_size <= 640 and not cropping:
                 # print('directly resize')
-                image = image.resize((self.image_size, self.image_size))
+                image = image.resize((image_size, image_size))
 
-            global_view = ImageOps.pad(image, (self.base_size, self.base_size),
-                                    color=tuple(int(x * 255) for x in self.image_transform.mean))
-            images_list.append(self.image_transform(global_view))
+            global_image = global_view(image, base_size, tuple(int(x * 255) for x in self.image_transform.mean),
+                                       source=canvas)
+            if self.uint8_transport:
+                images_list.append(self.image_transform.to_uint8(global_image))
+            else:
+                images_list.append(self.image_transform(global_image))
 
             """record height / width crop num"""
             # width_crop_num, height_crop_num = best_width // self.image_size, best_height // self.image_size
@@ -403,8 +495,10 @@ class DeepseekOCRProcessor(ProcessorMixin):
                 #     for j in range(0, best_width, self.image_size):
                 #         images_crop_list.append(
                 #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
-                for i in range(len(images_crop_raw)):
-                    images_crop_list.append(self.image_transform(images_crop_raw[i]))
+                if self.uint8_transport:
+                    images_crop_list.append(images_crop_raw)
+                else:
+                    images_crop_list.append(self.image_transform.from_uint8(images_crop_raw))
 
             # """process the global view"""
             # global_view = ImageOps.pad(image, (self.image_size, self.image_size),
@@ -421,77 +515,35 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
             # """add image tokens"""
             """add image tokens"""
-            num_queries = math.ceil((self.image_size // self.patch_size) / self.downsample_ratio)
-            num_queries_base = math.ceil((self.base_size // self.patch_size) / self.downsample_ratio)
-
-
-            tokenized_image = ([self.image_token_id] * num_queries_base + [self.image_token_id]) * num_queries_base
-            tokenized_image += [self.image_token_id]
-            if num_width_tiles > 1 or num_height_tiles > 1:
-                tokenized_image += ([self.image_token_id] * (num_queries * num_width_tiles) + [self.image_token_id]) * (
-                            num_queries * num_height_tiles)
-            tokenized_str += tokenized_image
-            images_seq_mask += [True] * len(tokenized_image)
-            num_image_tokens.append(len(tokenized_image))
+            image_ids, image_mask = self._image_token_block(crop_ratio, base_size, image_size)
+            ids_pieces.append(image_ids)
+            mask_pieces.append(image_mask)
+            num_image_tokens.append(len(image_ids))
 
         """process the last text split"""
-        tokenized_sep = self.encode(text_splits[-1], bos=False, eos=False)
-        tokenized_str += tokenized_sep
-        images_seq_mask += [False] * len(tokenized_sep)
-
-        """add the bos and eos tokens"""
-        if bos:
-            tokenized_str = [self.bos_id] + tokenized_str
-            images_seq_mask = [False] + images_seq_mask
-        if eos:
-            tokenized_str = tokenized_str + [self.eos_id]
-            images_seq_mask = images_seq_mask + [False]
-
-        assert len(tokenized_str) == len(
-            images_seq_mask), f"tokenize_with_images func: tokenized_str's length {len(tokenized_str)} is not equal to imags_seq_mask's length {len(images_seq_mask)}"
-        
-
+        ids_pieces.append(text_pieces[-1])
+        mask_pieces.append(torch.zeros(len(text_pieces[-1]), dtype=torch.bool))
 
-        masked_tokenized_str = []
-        for token_index in tokenized_str:
-            if token_index != self.image_token_id:
-                masked_tokenized_str.append(token_index)
-            else:
-                masked_tokenized_str.append(self.ignore_id)
-
-        assert len(tokenized_str) == len(images_seq_mask) == len(masked_tokenized_str), \
-            (f"tokenized_str's length {len(tokenized_str)}, input_ids' length {len(masked_tokenized_str)}, "
-             f"imags_seq_mask's length {len(images_seq_mask)}, are not equal")
-
-        input_ids = torch.LongTensor(tokenized_str)
-        target_ids = torch.LongTensor(masked_tokenized_str)
-        images_seq_mask = torch.tensor(images_seq_mask, dtype=torch.bool)
-
-        # set input_ids < 0 | input_ids == self.image_token_id as ignore_id
-        target_ids[(input_ids < 0) |
-                   (input_ids == self.image_token_id)] = self.ignore_id
+        # the eos token is not added: inference mode always removed it again
+        input_ids = torch.cat(ids_pieces)
+        images_seq_mask = torch.cat(mask_pieces)
         input_ids[input_ids < 0] = self.pad_id
 
-        inference_mode = True
-
-        if inference_mode:
-            # Remove the ending eos token
-            assert input_ids[-1] == self.eos_id
-            input_ids = input_ids[:-1]
-            target_ids = target_ids[:-1]
-            images_seq_mask = images_seq_mask[:-1]
-
         if len(images_list) == 0:
-            pixel_values = torch.zeros((1, 3, self.base_size, self.base_size))
+            pixel_values = torch.zeros((1, 3, base_size, base_size), dtype=self.pixel_dtype)
             images_spatial_crop = torch.zeros((1, 1), dtype=torch.long)
-            images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
+            images_crop = torch.zeros((1, 3, image_size, image_size), dtype=self.pixel_dtype).unsqueeze(0)
         else:
             pixel_values = torch.stack(images_list, dim=0)
             images_spatial_crop = torch.tensor(images_spatial_crop, dtype=torch.long)
             if images_crop_list:
-                images_crop = torch.stack(images_crop_list, dim=0).unsqueeze(0)
+                # a single page already holds its tiles in one tensor, so skip the extra copy
+                if len(images_crop_list) == 1:
+                    images_crop = images_crop_list[0].unsqueeze(0)
+                else:
+                    images_crop = torch.cat(images_crop_list, dim=0).unsqueeze(0)
             else:
-                images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
+                images_crop = torch.zeros((1, 3, image_size, image_size), dtype=self.pixel_dtype).unsqueeze(0)
 
         input_ids = input_ids.unsqueeze(0)
 
@@ -499,4 +551,38 @@ class DeepseekOCRProcessor(ProcessorMixin):
         return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes]]
 
 
+def iter_image_inputs(pixel_values, images_crop, images_spatial_crop):
+    """
+    The (global view, local views, (num_width_tiles, num_height_tiles)) of each image of a model batch.
+
+    vLLM stacks the per-image fields into one tensor when they all have the same shape and passes a
+    list (NestedTensors) otherwise, e.g. when a batch mixes resolution modes or tile counts; both are
+    read the same way here. The processor's all-zero stand-in for a prompt without an image has a
+    [0] spatial crop and is left out.
+    """
+    for image_ori, patches, crop_shape in zip(pixel_values, images_crop, images_spatial_crop):
+        crop_shape = torch.as_tensor(crop_shape, dtype=torch.long).reshape(-1)
+        if not crop_shape.any():
+            continue
+        yield image_ori, patches[0], (int(crop_shape[0]), int(crop_shape[1]))  # batch_size = 1
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_processor():
+    """
+    The shared processor, built on first use (this is what loads the tokenizer). tokenize_with_images
+    keeps no per-call state on the instance, so preprocessing threads can all use this one; the
+    per-page path then does no ProcessorMixin construction or tokenizer mutation.
+    """
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = DeepseekOCRProcessor()
+    return _processor
+
+
 AutoProcessor.register("DeepseekVLV2Processor", DeepseekOCRProcessor)
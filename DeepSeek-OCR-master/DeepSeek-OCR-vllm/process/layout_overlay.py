@@ -0,0 +1,78 @@
+import random
+
+import fitz
+
+LABEL_FONTSIZE = 7
+FILL_OPACITY = 20 / 255  # the alpha of the raster overlay
+
+
+def _box_rect(box, page_rect):
+    x1, y1, x2, y2 = box
+    return fitz.Rect(x1 / 999 * page_rect.width, y1 / 999 * page_rect.height,
+                     x2 / 999 * page_rect.width, y2 / 999 * page_rect.height)
+
+
+def draw_layout(page, refs):
+    """
+    Draw grounding boxes on a fitz page as vector graphics: an outline, a light fill and the label
+    above the box, as the raster layout images have them.
+
+    refs: (label, boxes) pairs, boxes in the model's 0-999 coordinates over the page as rendered
+    (rotation applied), so they land where they were detected on rotated pages too.
+    """
+    if not refs:
+        return
+    page_rect = page.rect
+    derotate = page.derotation_matrix
+    shape = page.new_shape()
+    for label, boxes in refs:
+        color = (random.randint(0, 200) / 255, random.randint(0, 200) / 255, random.randint(0, 255) / 255)
+        for box in boxes:
+            rect = _box_rect(box, page_rect)
+            if rect.is_empty:
+                continue
+            shape.draw_rect(rect * derotate)
+            shape.finish(color=color, fill=color, fill_opacity=FILL_OPACITY, width=2 if label == 'title' else 1)
+
+            # label above the box's top left corner, on a white background
+            width = fitz.get_text_length(label, fontsize=LABEL_FONTSIZE)
+            top = max(0, rect.y0 - LABEL_FONTSIZE * 1.2)
+            shape.draw_rect(fitz.Rect(rect.x0, top, rect.x0 + width, top + LABEL_FONTSIZE * 1.2) * derotate)
+            shape.finish(color=None, fill=(1, 1, 1))
+            shape.insert_text(fitz.Point(rect.x0, top + LABEL_FONTSIZE) * derotate, label,
+                              fontsize=LABEL_FONTSIZE, color=color, rotate=page.rotation)
+    shape.commit()
+
+
+def _page_labels(kept):
+    """Page label rules numbering the pages of a copy holding pages kept (0-based, in order) as in the original."""
+    labels = []
+    for position, idx in enumerate(kept):
+        if position == 0 or idx != kept[position - 1] + 1:
+            labels.append({'startpage': position, 'prefix': '', 'style': 'D', 'firstpagenum': idx + 1})
+    return labels
+
+
+def write_layout_pdf(source_path, out_path, pages):
+    """
+    Write the layouts PDF as a copy of source_path with the grounding boxes drawn over its pages.
+
+    pages: (page index, refs) pairs in page order, see draw_layout; pages it leaves out are left out
+    of the copy, whose pages are then labelled with their page numbers in the input. Pages are drawn
+    on one at a time, and the page images are never re-encoded.
+    """
+    document = fitz.open(source_path)
+    try:
+        kept = []
+        for idx, refs in pages:
+            draw_layout(document[idx], refs)
+            kept.append(idx)
+        if not kept:
+            return
+        if len(kept) < document.page_count:
+            document.select(kept)
+            document.set_page_labels(_page_labels(kept))
+        # garbage collection drops what only the removed pages used
+        document.save(out_path, garbage=1 if len(kept) < document.page_count else 0, deflate=True)
+    finally:
+        document.close()
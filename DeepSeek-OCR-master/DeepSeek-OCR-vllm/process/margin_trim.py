@@ -0,0 +1,72 @@
+import math
+import re
+
+import numpy as np
+
+from config import TRIM_PADDING
+from process.grounding import BOX_PATTERN
+from process.page_filter import BLANK_MARGIN, ink_mask
+
+# a thumbnail row / column needs this many ink pixels to count as content (drops dust specks)
+MIN_INK_PIXELS = 2
+# a crop keeping more than this fraction of both sides is not worth changing the page for
+MAX_KEEP = 0.95
+
+_DET_PATTERN = re.compile(r'(<\|det\|>)(.*?)(<\|/det\|>)', re.DOTALL)
+
+
+def _span(counts, offset, length):
+    """Content extent along one axis of the thumbnail; content reaching the ignored border extends to the edge."""
+    idx = np.flatnonzero(counts >= MIN_INK_PIXELS)
+    if idx.size == 0:
+        return None
+    start, end = idx[0], idx[-1] + 1
+    start = 0 if start == 0 else offset + start
+    end = length if end == len(counts) else offset + end
+    return start, end
+
+
+def content_box(image, padding=TRIM_PADDING):
+    """
+    Bounding box (x0, y0, x1, y1) of the page content in image pixels, padded by padding * long side,
+    or None when trimming would not save anything (full-bleed or blank pages).
+    """
+    mask = ink_mask(image)
+    h, w = mask.shape
+    dy, dx = int(h * BLANK_MARGIN), int(w * BLANK_MARGIN)
+    # scanner edges sit in the border, so only ink inside it decides which rows / columns have content
+    inner = mask[dy:h - dy, dx:w - dx]
+    rows = _span(inner.sum(axis=1), dy, h)
+    cols = _span(inner.sum(axis=0), dx, w)
+    if rows is None or cols is None:
+        return None
+
+    width, height = image.size
+    sx, sy = width / w, height / h
+    pad = padding * max(width, height)
+    x0 = max(0, math.floor(cols[0] * sx - pad))
+    y0 = max(0, math.floor(rows[0] * sy - pad))
+    x1 = min(width, math.ceil(cols[1] * sx + pad))
+    y1 = min(height, math.ceil(rows[1] * sy + pad))
+    if x1 - x0 > MAX_KEEP * width and y1 - y0 > MAX_KEEP * height:
+        return None
+    return x0, y0, x1, y1
+
+
+def remap_det_boxes(text, box, page_size):
+    """
+    Rewrite the <|det|> coordinates of a model output for a page cropped to box (0-999 over
+    the crop) into the 0-999 frame of the full page. Without a box the text is returned as is.
+    """
+    if box is None:
+        return text
+    x0, y0, x1, y1 = box
+    width, height = page_size
+    sx, sy = (x1 - x0) / width, (y1 - y0) / height
+    ox, oy = x0 / width * 999, y0 / height * 999
+
+    def remap(match):
+        a, b, c, d = (float(v) for v in match.groups())
+        return f'[{round(ox + a * sx)}, {round(oy + b * sy)}, {round(ox + c * sx)}, {round(oy + d * sy)}]'
+
+    return _DET_PATTERN.sub(lambda m: m.group(1) + BOX_PATTERN.sub(remap, m.group(2)) + m.group(3), text)
@@ -0,0 +1,52 @@
+from typing import NamedTuple, Optional, Union
+
+from config import BASE_SIZE, IMAGE_SIZE, CROP_MODE
+
+
+class ResolutionMode(NamedTuple):
+    name: str
+    base_size: int  # global view side
+    image_size: int  # local view (tile) side
+    crop_mode: bool  # tile pages larger than 640x640
+
+
+RESOLUTION_MODES = {
+    'tiny': ResolutionMode('tiny', 512, 512, False),
+    'small': ResolutionMode('small', 640, 640, False),
+    'base': ResolutionMode('base', 1024, 1024, False),
+    'large': ResolutionMode('large', 1280, 1280, False),
+    'gundam': ResolutionMode('gundam', 1024, 640, True),
+}
+
+
+def _default_mode():
+    # the mode configured in config.py, named after its preset when it matches one
+    for mode in RESOLUTION_MODES.values():
+        if (mode.base_size, mode.image_size, mode.crop_mode) == (BASE_SIZE, IMAGE_SIZE, CROP_MODE):
+            return mode
+    return ResolutionMode('custom', BASE_SIZE, IMAGE_SIZE, CROP_MODE)
+
+
+DEFAULT_MODE = _default_mode()
+
+
+def get_mode(mode: Optional[Union[str, ResolutionMode]] = None) -> ResolutionMode:
+    """
+    Resolve a per-request mode: None -> the config.py mode, a name -> its preset,
+    a ResolutionMode -> itself.
+    """
+    if mode is None:
+        return DEFAULT_MODE
+    if isinstance(mode, ResolutionMode):
+        return mode
+    name = str(mode).lower()
+    if name == DEFAULT_MODE.name:
+        return DEFAULT_MODE
+    if name not in RESOLUTION_MODES:
+        raise ValueError(f"Unknown resolution mode: {mode}; expected one of {sorted(RESOLUTION_MODES)}")
+    return RESOLUTION_MODES[name]
+
+
+def mm_processor_kwargs(mode: Optional[Union[str, ResolutionMode]] = None):
+    """Per-request kwargs that make the engine count vision tokens for this mode."""
+    return {"mode": get_mode(mode).name}
@@ -0,0 +1,57 @@
+import numpy as np
+
+from config import BLANK_INK_THRESHOLD, BLANK_MAX_INK_RATIO, BLANK_THUMB_SIZE
+
+# written in place of the OCR output of a skipped blank page (invisible when the markdown is rendered)
+BLANK_PAGE_MARK = '<!-- blank page -->'
+
+# the prompts that read a page's text (document, OCR this image, Free OCR); for these a blank page has
+# nothing to give, while e.g. describing an image or locating something in it still goes to the model
+READING_PROMPTS = ('Convert the document to markdown', 'OCR')
+
+# scanner shadows and punch holes live along the edges; ignore this fraction of each side
+BLANK_MARGIN = 0.04
+
+
+def _gray_thumbnail(image, size):
+    if image.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+        image = image.convert('RGB')
+    factor = max(1, max(image.size) // size)
+    if factor > 1:
+        image = image.reduce(factor)
+    return np.asarray(image.convert('L'), dtype=np.int16)
+
+
+def _interior(array):
+    h, w = array.shape
+    dy, dx = int(h * BLANK_MARGIN), int(w * BLANK_MARGIN)
+    return array[dy:h - dy, dx:w - dx]
+
+
+def ink_mask(image, size=BLANK_THUMB_SIZE, threshold=BLANK_INK_THRESHOLD):
+    """
+    Boolean mask over a ~size px gray thumbnail of the pixels that differ from the page
+    background (the median gray level away from the border) by more than threshold.
+    """
+    gray = _gray_thumbnail(image, size)
+    interior = _interior(gray)
+    background = int(np.median(interior if interior.size else gray))
+    return np.abs(gray - background) > threshold
+
+
+def ink_ratio(image, size=BLANK_THUMB_SIZE, threshold=BLANK_INK_THRESHOLD):
+    """Fraction of ink pixels (see ink_mask), ignoring a thin border."""
+    mask = _interior(ink_mask(image, size, threshold))
+    if mask.size == 0:
+        return 0.0
+    return float(np.count_nonzero(mask)) / mask.size
+
+
+def skips_blank_pages(prompt):
+    """True when blank pages can be left out for prompt: an image prompt that only reads text (READING_PROMPTS)."""
+    return '<image>' in prompt and any(marker in prompt for marker in READING_PROMPTS)
+
+
+def is_blank_page(image, max_ink_ratio=BLANK_MAX_INK_RATIO, size=BLANK_THUMB_SIZE, threshold=BLANK_INK_THRESHOLD):
+    """True for pages with (almost) nothing on them: separator sheets, empty back sides."""
+    return ink_ratio(image, size, threshold) <= max_ink_ratio
@@ -0,0 +1,89 @@
+import re
+
+_RANGE = re.compile(r'(\d+)\s*(-\s*(\d*))?')
+_ENDS = re.compile(r'(first|last)\s*:?\s*(\d+)', re.IGNORECASE)
+
+
+class PageSelection:
+    """
+    The pages of a document to convert, from a spec such as '1-5,8', '10-', 'first 3' or 'last 2, 1'.
+
+    Parts are separated by commas: a page number, a range of page numbers ('a-b', or 'a-' up to the
+    last page), or the first or last n pages. Page numbers start at 1 and pages past the end of a
+    document are ignored, so one selection applies to documents of any length. An empty spec selects
+    every page.
+
+    Only the parts are kept; the pages are produced lazily per document, in page order and each once,
+    so '1-100000' costs the same as '1-5'.
+    """
+
+    def __init__(self, parts=None):
+        # (kind, a, b) for 'range' (1-based, b None for open ended), 'first' and 'last'; None is every page
+        self.parts = None if parts is None else tuple(parts)
+
+    @classmethod
+    def parse(cls, spec):
+        if spec is None or not str(spec).strip() or str(spec).strip().lower() == 'all':
+            return cls()
+        parts = []
+        for part in str(spec).split(','):
+            part = part.strip()
+            ends = _ENDS.fullmatch(part)
+            numbers = _RANGE.fullmatch(part)
+            if ends:
+                parts.append((ends.group(1).lower(), int(ends.group(2)), None))
+            elif numbers and int(numbers.group(1)) >= 1:
+                first = int(numbers.group(1))
+                last = first if numbers.group(2) is None else (int(numbers.group(3)) if numbers.group(3) else None)
+                if last is not None and last < first:
+                    raise ValueError(f'page range {part!r} ends before it starts')
+                parts.append(('range', first, last))
+            else:
+                raise ValueError(f"invalid page selection {part!r} in {spec!r}: expected 'n', 'a-b', 'a-', "
+                                 f"'first n' or 'last n' (page numbers start at 1)")
+        return cls(parts)
+
+    @property
+    def all(self):
+        return self.parts is None
+
+    def ranges(self, page_count):
+        """The selected pages of a page_count page document as sorted, disjoint 0-based ranges."""
+        if self.parts is None:
+            return [range(page_count)] if page_count else []
+        spans = []
+        for kind, a, b in self.parts:
+            if kind == 'first':
+                start, stop = 0, a
+            elif kind == 'last':
+                start, stop = page_count - a, page_count
+            else:
+                start, stop = a - 1, page_count if b is None else b
+            start, stop = max(start, 0), min(stop, page_count)
+            if start < stop:
+                spans.append((start, stop))
+
+        merged = []
+        for start, stop in sorted(spans):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return [range(start, stop) for start, stop in merged]
+
+    def pages(self, page_count, start=0):
+        """The selected 0-based page indices from start on, in order."""
+        for pages in self.ranges(page_count):
+            yield from pages[max(start - pages.start, 0):]
+
+    def count(self, page_count):
+        return sum(len(pages) for pages in self.ranges(page_count))
+
+    def __str__(self):
+        if self.parts is None:
+            return ''
+        return ','.join(f'{kind} {a}' if kind != 'range' else str(a) if b == a else f'{a}-{"" if b is None else b}'
+                         for kind, a, b in self.parts)
+
+    def __repr__(self):
+        return f'PageSelection({str(self)!r})'
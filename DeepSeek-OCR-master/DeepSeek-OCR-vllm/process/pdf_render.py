@@ -0,0 +1,312 @@
+import io
+import math
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from multiprocessing import get_context, resource_tracker, shared_memory
+from typing import NamedTuple, Tuple
+
+import fitz
+from PIL import Image
+
+from config import MAX_DECODE_PIXELS, PDF_RENDER_WORKERS
+from process.image_loader import reduction_factor, view_scale
+from process.modes import get_mode
+from process.streaming import ReorderBuffer
+from process.tile_planner import NO_CROP_MAX_SIDE, get_tile_planner
+
+
+class PageLayout(NamedTuple):
+    """How the raw samples of a rendered page map to a PIL image."""
+    mode: str
+    raw_mode: str
+    size: Tuple[int, int]
+    stride: int
+
+
+def _image_pixmap(pixmap):
+    """Convert the pixmap to a colorspace PIL can take as is; returns (pixmap, layout)."""
+    colorspace_n = pixmap.colorspace.n if pixmap.colorspace else 0
+    if not (colorspace_n == 3 or (colorspace_n == 1 and not pixmap.alpha)):
+        pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+
+    if pixmap.alpha:
+        # MuPDF alpha is premultiplied
+        mode, raw_mode = 'RGBA', 'RGBa'
+    else:
+        mode = raw_mode = 'RGB' if pixmap.n == 3 else 'L'
+    return pixmap, PageLayout(mode, raw_mode, (pixmap.width, pixmap.height), pixmap.stride)
+
+
+def _samples_to_image(samples, layout, image_format):
+    img = Image.frombuffer(layout.mode, layout.size, samples, "raw", layout.raw_mode, layout.stride, 1)
+    if img.readonly:
+        # the image maps the samples directly; detach it before they are freed
+        img = img.copy()
+
+    if image_format.upper() != "PNG" and img.mode == 'RGBA':
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    return img
+
+
+def pixmap_to_image(pixmap, image_format="PNG"):
+    """
+    Build a PIL image straight from the pixmap samples, without a PNG encode/decode round trip.
+
+    Gray pixmaps become 'L' and RGB ones 'RGB'; any other colorspace (CMYK, gray + alpha, ...) is
+    converted to RGB by MuPDF first. Pixmap alpha is premultiplied and is unpacked as such; for
+    formats other than PNG the page is flattened onto white, as the PNG path did.
+    """
+    pixmap, layout = _image_pixmap(pixmap)
+    return _samples_to_image(pixmap.samples_mv, layout, image_format)
+
+
+def _pixmap_size(page_rect, zoom):
+    irect = (page_rect * fitz.Matrix(zoom, zoom)).irect
+    return irect.width, irect.height
+
+
+def render_zoom(page_rect, mode=None, dpi=144):
+    """
+    Zoom at which a page renders at the size its tile plan in mode needs: just covering the global
+    view and the tile canvas, instead of whatever dpi gives. Small pages render larger, posters and
+    A3 pages smaller.
+
+    The tile grid is the one the page gets when rendered at dpi, so the vision tokens per page
+    are unchanged; when no size on that grid covers the views (pages too small to be tiled), the
+    largest untiled size is used.
+    """
+    mode = get_mode(mode)
+    planner = get_tile_planner()
+
+    def crop_ratio(zoom):
+        width, height = _pixmap_size(page_rect, zoom)
+        return planner.plan(width, height, mode.base_size, mode.image_size, mode.crop_mode).crop_ratio
+
+    nominal = dpi / 72.0
+    target = crop_ratio(nominal)
+    zoom = view_scale(*_pixmap_size(page_rect, nominal), mode) * nominal
+    if mode.crop_mode and target == (1, 1):
+        # pages are only left untiled while both sides stay within NO_CROP_MAX_SIDE
+        zoom = min(zoom, (NO_CROP_MAX_SIDE - 1) / max(page_rect.width, page_rect.height))
+    if crop_ratio(zoom) != target:
+        return nominal
+    return zoom
+
+
+def _scan_xref(page):
+    """xref of the one image a scanned page consists of, 0 when the page has to be rendered."""
+    if page.rotation or page.first_annot or page.first_widget or page.get_cdrawings():
+        return 0
+    # get_image_info(xrefs=True) hashes the decoded image to find its xref, the resources name it for free
+    infos, images = page.get_image_info(), page.get_images()
+    if len(infos) != 1 or len(images) != 1:
+        return 0
+    a, b, c, d, _, _ = infos[0]['transform']
+    # upright and not mirrored
+    if b or c or a <= 0 or d <= 0:
+        return 0
+    # placed on the visible page (CropBox) exactly: not running off it, where it would be cut in a
+    # rendering, and not stretched, where the decoded pixels would have another aspect than the page
+    bbox, width, height = fitz.Rect(infos[0]['bbox']), infos[0]['width'], infos[0]['height']
+    tolerance = 0.01 * max(page.rect.width, page.rect.height)
+    if any(abs(u - v) > tolerance for u, v in zip(bbox, page.rect)):
+        return 0
+    if abs(width / height - bbox.width / bbox.height) > 0.01 * bbox.width / bbox.height:
+        return 0
+    # text drawn over the scan; an invisible OCR layer does not show in a rendering either
+    if any(span['type'] != 3 and span['opacity'] > 0 for span in page.get_texttrace()):
+        return 0
+    xref = images[0][0]
+    document = page.parent
+    # inline images, and images that are masked or have their samples remapped, are left to MuPDF
+    if xref <= 0 or any(document.xref_get_key(xref, key)[0] != 'null' for key in ('SMask', 'Mask', 'Decode', 'ImageMask')):
+        return 0
+    return xref
+
+
+def _scan_reduction(size, page_rect, mode, dpi):
+    if mode is not None:
+        return reduction_factor(*size, mode)
+    # no tile plan to go by: not below the size rendering at dpi would give
+    need_w, need_h = _pixmap_size(page_rect, dpi / 72.0)
+    for factor in (8, 4, 2):
+        if math.ceil(size[0] / factor) >= need_w and math.ceil(size[1] / factor) >= need_h:
+            return factor
+    return 1
+
+
+def scan_image(page, mode=None, dpi=144):
+    """
+    For a scanned page (a single upright JPEG covering the page, with nothing drawn over it), the
+    embedded JPEG decoded straight from its stream, as RGB; None for any other page.
+
+    The JPEG is decoded at the smallest DCT scale that still covers the tile plan of mode (or dpi,
+    without a mode), skipping MuPDF's resampling and compositing. Other streams (JBIG2, CCITT, Flate)
+    render faster than PIL converts them and are left to rendering.
+    """
+    xref = _scan_xref(page)
+    if not xref:
+        return None
+    document = page.parent
+    if document.xref_get_key(xref, 'Filter')[1] not in ('/DCTDecode', '[/DCTDecode]'):
+        return None
+    image = Image.open(io.BytesIO(document.xref_stream_raw(xref)))
+    # CMYK JPEGs (often stored inverted) are left to MuPDF
+    if image.mode not in ('L', 'RGB') or image.width * image.height > MAX_DECODE_PIXELS:
+        return None
+    scale = _scan_reduction(image.size, page.rect, mode, dpi)
+    if scale > 1:
+        image.draft('RGB', (image.width // scale, image.height // scale))
+    return image.convert('RGB')
+
+
+def _render_page(page, dpi, mode, extract_scans):
+    """Scanned pages as their decoded embedded image (a PIL image), any other page as a pixmap."""
+    if extract_scans:
+        image = scan_image(page, mode, dpi)
+        if image is not None:
+            return image
+    zoom = dpi / 72.0 if mode is None else render_zoom(page.rect, mode, dpi)
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+
+def iter_pdf_pages(pdf_path, dpi=144, image_format="PNG", mode=None, extract_scans=False, pages=None):
+    """
+    Render the pages of a PDF one at a time, in page order or in the order of the 0-based indices of
+    pages (any iterable, e.g. PageSelection.pages); only the page being rendered is in memory. With a resolution mode, every page is rendered at its own render_zoom instead of at dpi;
+    with extract_scans, scanned pages are taken from their embedded image (scan_image) instead.
+    """
+    pdf_document = fitz.open(pdf_path)
+    try:
+        Image.MAX_IMAGE_PIXELS = None
+
+        for page_num in range(pdf_document.page_count) if pages is None else pages:
+            page = _render_page(pdf_document[page_num], dpi, mode, extract_scans)
+            yield page if isinstance(page, Image.Image) else pixmap_to_image(page, image_format)
+    finally:
+        pdf_document.close()
+
+
+def pdf_to_images_high_quality(pdf_path, dpi=144, image_format="PNG", mode=None, extract_scans=False):
+    """
+    pdf2images
+    """
+    return list(iter_pdf_pages(pdf_path, dpi, image_format, mode, extract_scans))
+
+
+_worker_document = None  # (pdf_path, open document) of the render worker process
+
+
+def _render_in_worker(pdf_path, page_nums, dpi, mode, extract_scans):
+    global _worker_document
+    # every worker keeps its own handle on the document; MuPDF documents can not be shared across processes
+    if _worker_document is None or _worker_document[0] != pdf_path:
+        if _worker_document is not None:
+            _worker_document[1].close()
+        _worker_document = (pdf_path, fitz.open(pdf_path))
+    document = _worker_document[1]
+
+    pages = []
+    for page_num in page_nums:
+        page = _render_page(document[page_num], dpi, mode, extract_scans)
+        if isinstance(page, Image.Image):
+            samples = page.tobytes()
+            layout = PageLayout(page.mode, page.mode, page.size, len(samples) // page.size[1])
+        else:
+            page, layout = _image_pixmap(page)
+            samples = page.samples_mv
+        # the samples go back through shared memory, only the block name is pickled
+        shm = shared_memory.SharedMemory(create=True, size=max(len(samples), 1))
+        shm.buf[:len(samples)] = samples
+        # the parent unlinks the block once it has read it
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        shm.close()
+        pages.append((shm.name, layout))
+    return pages
+
+
+def _page_from_shared(name, layout, image_format):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        img = _samples_to_image(shm.buf, layout, image_format)
+    finally:
+        shm.close()
+        shm.unlink()
+    return img
+
+
+def _release_pages(pages):
+    for name, _ in pages:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+class PdfRenderPool:
+    """
+    Rasterizes PDF pages on a pool of worker processes. Each task is a short run of pages,
+    rendered by a worker through its own fitz handle on the document; finished runs go through
+    a ReorderBuffer so iter_pages() still yields pages in the order they were asked for.
+
+    At most 2 * num_workers runs are rendered or waiting to be yielded at any time, so a slow
+    consumer holds back rendering. With num_workers <= 1 pages are rendered in the calling thread.
+    """
+
+    def __init__(self, num_workers=PDF_RENDER_WORKERS, pages_per_task=2):
+        self.num_workers = num_workers
+        self.pages_per_task = pages_per_task
+        self.executor = None
+
+    def __enter__(self):
+        if self.num_workers > 1:
+            # fork, and fork now: same reasons as PreprocessPool (LLM built at import time, render threads later)
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=get_context('fork'))
+            self.executor.submit(int).result()
+        return self
+
+    def __exit__(self, *exc):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def iter_pages(self, pdf_path, dpi=144, image_format="PNG", mode=None, extract_scans=False, pages=None):
+        if self.executor is None:
+            yield from iter_pdf_pages(pdf_path, dpi, image_format, mode, extract_scans, pages)
+            return
+
+        if pages is None:
+            with fitz.open(pdf_path) as pdf_document:
+                pages = range(pdf_document.page_count)
+        # pages_per_task pages at a time, pulled from pages as tasks are submitted
+        pages = iter(pages)
+        tasks = iter(lambda: tuple(islice(pages, self.pages_per_task)), ())
+        window = 2 * self.num_workers
+        pending = {}  # future -> run index
+        runs = ReorderBuffer()
+        submitted = 0
+        try:
+            while True:
+                while len(pending) + len(runs) < window:
+                    page_nums = next(tasks, None)
+                    if page_nums is None:
+                        break
+                    pending[self.executor.submit(_render_in_worker, pdf_path, page_nums,
+                                                 dpi, mode, extract_scans)] = submitted
+                    submitted += 1
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    images = [_page_from_shared(name, layout, image_format) for name, layout in future.result()]
+                    for _, images in runs.put(pending.pop(future), images):
+                        yield from images
+        finally:
+            for future in pending:
+                if not future.cancel():
+                    # already rendering: drop its shared blocks once it is done
+                    future.add_done_callback(lambda f: f.exception() is None and _release_pages(f.result()))
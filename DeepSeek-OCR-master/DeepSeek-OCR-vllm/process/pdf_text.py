@@ -0,0 +1,211 @@
+import math
+from collections import Counter
+from typing import NamedTuple
+
+import fitz
+import numpy as np
+
+from config import TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MAX_GRAPHICS
+
+MAX_BAD_CHAR_RATIO = 0.01  # replacement / private use characters: fonts without a unicode mapping
+MAX_MATH_CHAR_RATIO = 0.01  # math set in math fonts extracts flat, the model writes it as LaTeX
+MAX_INVISIBLE_RATIO = 0.1  # invisible text is the OCR layer of a scanned page
+MIN_FIGURE_AREA = 0.01  # images below this fraction of the page (logos, icons) are not emitted as figures
+COVERAGE_GRID = 64
+
+_MATH_FONTS = ('cmmi', 'cmsy', 'cmex', 'msam', 'msbm', 'math', 'symbol', 'stix', 'esint', 'rsfs')
+_BULLETS = '•◦▪▫‣⁃●○■□'
+
+
+class TextLayerProfile(NamedTuple):
+    """What the text layer of a page looks like; decides whether it can stand in for OCR."""
+    chars: int  # visible characters
+    bad_chars: int  # visible characters without a usable unicode value
+    math_chars: int  # visible characters set in math fonts
+    invisible_chars: int
+    graphics_area: float  # fraction of the page under images and vector graphics
+
+
+def _coverage(rects, page_rect):
+    grid = np.zeros((COVERAGE_GRID, COVERAGE_GRID), dtype=bool)
+    sx, sy = COVERAGE_GRID / page_rect.width, COVERAGE_GRID / page_rect.height
+    for rect in rects:
+        rect = fitz.Rect(rect) & page_rect
+        if rect.is_empty:
+            continue
+        grid[int(rect.y0 * sy):math.ceil(rect.y1 * sy), int(rect.x0 * sx):math.ceil(rect.x1 * sx)] = True
+    return float(grid.mean())
+
+
+def _is_bad_char(code):
+    return code == 0xFFFD or 0xE000 <= code <= 0xF8FF or code < 0x20
+
+
+def _graphics_rects(page, frame):
+    page_area = abs(frame)
+    rects = [info['bbox'] for info in page.get_image_info()]
+    for drawing in page.get_cdrawings():
+        rect = fitz.Rect(drawing['rect'])
+        # rules and underlines are not graphics, full page fills are backgrounds
+        if rect.width < 4 or rect.height < 4 or abs(rect) > 0.9 * page_area:
+            continue
+        rects.append(rect)
+    return rects
+
+
+def text_layer_profile(page):
+    """Character, font and coverage statistics of the embedded text layer of a fitz page."""
+    chars = bad_chars = math_chars = invisible_chars = 0
+    for span in page.get_texttrace():
+        span_chars = [char for char in span['chars'] if not chr(char[0]).isspace()]
+        if span['type'] == 3 or span['opacity'] == 0:
+            invisible_chars += len(span_chars)
+            continue
+        chars += len(span_chars)
+        bad_chars += sum(_is_bad_char(char[0]) for char in span_chars)
+        if any(hint in span['font'].lower() for hint in _MATH_FONTS):
+            math_chars += sum(chr(char[0]) not in _BULLETS for char in span_chars)
+
+    # image and drawing boxes are in unrotated page coordinates
+    frame = fitz.Rect(0, 0, page.cropbox.width, page.cropbox.height)
+    return TextLayerProfile(chars, bad_chars, math_chars, invisible_chars,
+                            _coverage(_graphics_rects(page, frame), frame))
+
+
+def use_text_layer(profile):
+    """Whether a page with this profile can be converted from its text layer instead of going to the model."""
+    if profile.chars < TEXT_LAYER_MIN_CHARS:
+        return False
+    if profile.bad_chars > MAX_BAD_CHAR_RATIO * profile.chars:
+        return False
+    if profile.math_chars > MAX_MATH_CHAR_RATIO * profile.chars:
+        return False
+    if profile.invisible_chars > MAX_INVISIBLE_RATIO * (profile.chars + profile.invisible_chars):
+        return False
+    # image-heavy pages (scans, figures, charts) are left to the model
+    return profile.graphics_area <= TEXT_LAYER_MAX_GRAPHICS
+
+
+def _join_lines(lines):
+    text = ''
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] in _BULLETS:
+            text += ('\n' if text else '') + '- ' + line[1:].strip()
+        elif text.endswith('-') and line[0].islower():
+            # word hyphenated across the line break
+            text = text[:-1] + line
+        else:
+            text += (' ' if text else '') + line
+    return text
+
+
+def _table_html(rows):
+    cells = ''.join('<tr>' + ''.join(f'<td>{cell.replace(chr(10), " ")}</td>' for cell in row if cell is not None) + '</tr>'
+                    for row in rows)
+    return f'<table>{cells}</table>'
+
+
+def _find_tables(page):
+    # table detection is by far the slowest step, only run it where rules cross
+    horizontal, vertical = [], []
+    for drawing in page.get_cdrawings():
+        rect = fitz.Rect(drawing['rect'])
+        if rect.height < 2 and rect.width > 10:
+            horizontal.append(rect)
+        elif rect.width < 2 and rect.height > 10:
+            vertical.append(rect)
+    if len(horizontal) < 2 or len(vertical) < 2:
+        return []
+    # rules are degenerate rects, Rect union would drop them
+    rules = horizontal + vertical
+    clip = fitz.Rect(min(r.x0 for r in rules) - 2, min(r.y0 for r in rules) - 2,
+                     max(r.x1 for r in rules) + 2, max(r.y1 for r in rules) + 2)
+    return page.find_tables(clip=clip).tables
+
+
+def _reading_order(items, page_width):
+    """Top to bottom, with side by side columns read left column first between full width blocks."""
+    middle = page_width / 2
+    ordered = []
+    band = []
+
+    def flush():
+        band.sort(key=lambda item: (item[0].x0 >= middle, item[0].y0))
+        ordered.extend(band)
+        band.clear()
+
+    for item in sorted(items, key=lambda item: (item[0].y0, item[0].x0)):
+        rect = item[0]
+        if rect.x0 < middle - 10 and rect.x1 > middle + 10:
+            flush()
+            ordered.append(item)
+        else:
+            band.append(item)
+    flush()
+    return ordered
+
+
+def page_markdown(page):
+    """
+    Markdown for a page built from its text layer, in the model's grounding output format:
+    every block is preceded by <|ref|>label<|/ref|><|det|>[[x0, y0, x1, y1]]<|/det|> with
+    coordinates in 0-999 over the rendered page, so it is written out like an OCR result.
+    """
+    rotation = page.rotation_matrix
+    page_rect = page.rect
+    items = []  # (rect on the rendered page, label, text)
+
+    tables = _find_tables(page)
+    table_rects = [fitz.Rect(table.bbox) for table in tables]
+    for table, rect in zip(tables, table_rects):
+        items.append((rect * rotation, 'table', _table_html(table.extract())))
+
+    blocks = [block for block in page.get_text('dict', flags=fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES)['blocks'] if block['type'] == 0]
+    sizes = Counter()
+    for block in blocks:
+        for line in block['lines']:
+            for span in line['spans']:
+                sizes[round(span['size'], 1)] += len(span['text'].strip())
+    body_size = sizes.most_common(1)[0][0] if sizes else 0
+    title_size = max(sizes, default=0)
+
+    for block in blocks:
+        rect = fitz.Rect(block['bbox'])
+        if any(table_rect.contains(fitz.Point((rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2))
+               for table_rect in table_rects):
+            continue
+        spans = [span for line in block['lines'] for span in line['spans'] if span['text'].strip()]
+        text = _join_lines(''.join(span['text'] for span in line['spans']) for line in block['lines'])
+        if not spans or not text:
+            continue
+        size = max(span['size'] for span in spans)
+        bold = all(span['flags'] & fitz.TEXT_FONT_BOLD for span in spans)
+        if size >= 1.5 * body_size and size >= title_size - 0.5:
+            items.append((rect * rotation, 'title', '# ' + text))
+        elif size >= 1.15 * body_size or (bold and len(text) < 120 and '\n' not in text):
+            items.append((rect * rotation, 'sub_title', '## ' + text))
+        else:
+            items.append((rect * rotation, 'text', text))
+
+    page_area = abs(page_rect)
+    for info in page.get_image_info():
+        rect = fitz.Rect(info['bbox']) * rotation & page_rect
+        if abs(rect) >= MIN_FIGURE_AREA * page_area:
+            items.append((rect, 'image', ''))
+
+    parts = []
+    for rect, label, text in _reading_order(items, page_rect.width):
+        box = [round(rect.x0 / page_rect.width * 999), round(rect.y0 / page_rect.height * 999),
+               round(rect.x1 / page_rect.width * 999), round(rect.y1 / page_rect.height * 999)]
+        parts.append(f'<|ref|>{label}<|/ref|><|det|>[[{", ".join(str(max(0, min(999, v))) for v in box)}]]<|/det|>\n{text}')
+    return '\n\n'.join(parts)
+
+
+def text_layer_markdown(page):
+    """page_markdown(page) when the page has a reliable text layer, else None (the page needs OCR)."""
+    if not use_text_layer(text_layer_profile(page)):
+        return None
+    return page_markdown(page)
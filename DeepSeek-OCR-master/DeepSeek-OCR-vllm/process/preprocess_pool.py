@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, resource_tracker, shared_memory
+from typing import NamedTuple, Tuple
+
+import numpy as np
+import torch
+
+from config import NUM_WORKERS, PREPROCESS_BACKEND
+from process.image_process import get_processor
+from process.modes import get_mode
+
+# posix shared memory blocks are files here; attaching maps the file instead of copying it
+SHM_DIR = '/dev/shm'
+
+_TORCH_DTYPES = {
+    np.dtype(np.uint8): torch.uint8,
+    np.dtype(np.float32): torch.float32,
+    np.dtype(np.int64): torch.int64,
+    np.dtype(np.bool_): torch.bool,
+}
+
+
+class SharedTensor(NamedTuple):
+    """Handle of a tensor written into a multiprocessing.shared_memory block."""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def tensor_to_shared(tensor: torch.Tensor) -> SharedTensor:
+    array = tensor.contiguous().numpy()
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    # the consumer process unlinks the block once it has mapped it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return SharedTensor(shm.name, tuple(array.shape), array.dtype.str)
+
+
+def tensor_from_shared(handle: SharedTensor) -> torch.Tensor:
+    """Map a shared block as a tensor (no copy) and unlink its name; the memory lives as long as the tensor."""
+    path = os.path.join(SHM_DIR, handle.name.lstrip('/'))
+    dtype = np.dtype(handle.dtype)
+    numel = int(np.prod(handle.shape, dtype=np.int64))
+    try:
+        data = torch.from_file(path, shared=True, size=max(numel * dtype.itemsize, 1), dtype=torch.uint8)
+    finally:
+        os.unlink(path)
+    return data[:numel * dtype.itemsize].view(_TORCH_DTYPES[dtype]).view(handle.shape)
+
+
+def release_shared(handle: SharedTensor):
+    """Unlink a block that will never be mapped (e.g. results left over at shutdown)."""
+    try:
+        os.unlink(os.path.join(SHM_DIR, handle.name.lstrip('/')))
+    except FileNotFoundError:
+        pass
+
+
+_worker_processor = None
+
+
+def _init_process_worker():
+    global _worker_processor
+    # one processor per worker process, and no intra-op threads fighting the other workers
+    torch.set_num_threads(1)
+    _worker_processor = get_processor()
+
+
+def _preprocess_in_worker(image, mode):
+    (input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop,
+     num_image_tokens, image_shapes) = _worker_processor.tokenize_with_images(
+        images=[image], bos=True, eos=True, mode=mode)[0]
+    # the large tensors go through shared memory, only their handles are pickled
+    return [input_ids, tensor_to_shared(pixel_values), tensor_to_shared(images_crop), images_seq_mask,
+            images_spatial_crop, num_image_tokens, image_shapes]
+
+
+def _preprocess_in_thread(image, mode):
+    return get_processor().tokenize_with_images(images=[image], bos=True, eos=True, mode=mode)[0]
+
+
+class PreprocessPool:
+    """
+    Runs tokenize_with_images over many images, either on a thread pool ('thread') or on a
+    process pool ('process'). The process backend sidesteps the GIL held by PIL resizing and
+    tensor conversion; workers hand pixel_values / images_crop back through shared memory.
+
+    map() yields the multi_modal_data "image" payload for each image, in input order.
+    """
+
+    def __init__(self, backend=PREPROCESS_BACKEND, num_workers=NUM_WORKERS, mode=None):
+        if backend not in ('thread', 'process'):
+            raise ValueError(f"Unknown preprocess backend: {backend}")
+        self.backend = backend
+        self.num_workers = num_workers
+        self.mode = get_mode(mode)
+        self.executor = None
+        self._pending = set()
+
+    def __enter__(self):
+        if self.backend == 'process':
+            # fork: the runner scripts build the LLM at import time, spawn would re-run that in every worker
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=get_context('fork'),
+                                                initializer=_init_process_worker)
+            # fork all workers now, before the caller starts threads of its own (e.g. a render thread)
+            self.executor.submit(int).result()
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        return self
+
+    def __exit__(self, *exc):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        # shared blocks of results nobody collected would otherwise outlive the process
+        for future in self._pending:
+            if not future.cancelled() and future.exception() is None and self.backend == 'process':
+                item = future.result()
+                release_shared(item[1])
+                release_shared(item[2])
+        self._pending.clear()
+
+    def submit(self, image):
+        if self.backend == 'process':
+            future = self.executor.submit(_preprocess_in_worker, image, self.mode)
+        else:
+            future = self.executor.submit(_preprocess_in_thread, image, self.mode)
+        self._pending.add(future)
+        return future
+
+    def result(self, future):
+        self._pending.discard(future)
+        item = future.result()
+        if self.backend == 'process':
+            item[1] = tensor_from_shared(item[1])
+            item[2] = tensor_from_shared(item[2])
+        return [item]
+
+    def map(self, images):
+        futures = [self.submit(image) for image in images]
+        for future in futures:
+            yield self.result(future)
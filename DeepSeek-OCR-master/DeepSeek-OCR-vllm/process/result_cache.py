@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import MIN_CROPS, MAX_CROPS, MODEL_PATH, REPEAT_CACHE_PAGES, RESULT_CACHE_PATH, RESULT_CACHE_MAX_GB
+from process.tensor_store import PREPROCESS_VERSION
+
+# bump whenever the model, its preprocessing or decoding changes what it outputs for the same page;
+# entries written by other versions are dropped when the cache is opened
+RESULT_CACHE_VERSION = 1
+
+
+class PageResultCache:
+    """
+    Content-addressed on-disk cache of the raw model output of a page.
+
+    Each entry is one text file, keyed by a hash of the page image and of everything else that
+    changes the output (model, mode, prompt, sampling settings, tile planner bounds, preprocessing
+    version). The cache is bounded by size with least-recently-used eviction, like PageTensorStore.
+    """
+
+    def __init__(self, root=RESULT_CACHE_PATH, max_bytes=int(RESULT_CACHE_MAX_GB * 1024 ** 3),
+                 version=RESULT_CACHE_VERSION):
+        self.max_bytes = max_bytes
+        self.root = os.path.join(root, f'v{version}')
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+
+        # outputs of other versions can never be hit again
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name != f'v{version}' and name.startswith('v') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+        # key -> [last use, bytes]; built once, kept up to date on get/put
+        self._index = {}
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.'):
+                    os.remove(entry.path)  # interrupted write
+                elif entry.is_file():
+                    stat = entry.stat()
+                    self._index[entry.name] = [stat.st_mtime, stat.st_size]
+        self.total_bytes = sum(size for _, size in self._index.values())
+
+    @staticmethod
+    def make_key(image_digest, mode, prompt, sampling, model=MODEL_PATH, min_crops=MIN_CROPS, max_crops=MAX_CROPS,
+                 preprocess_version=PREPROCESS_VERSION):
+        """
+        image_digest: hex digest of the page (PageTensorStore.digest_image / digest_file).
+        sampling: the sampling settings that change the output, see sampling_settings.
+        min_crops, max_crops, preprocess_version: as for PageTensorStore, what the model is shown depends on them.
+        """
+        settings = json.dumps([model, list(mode), prompt, sampling, min_crops, max_crops, preprocess_version],
+                              sort_keys=True, default=str).encode('utf-8')
+        return f'{image_digest}-{hashlib.sha256(settings).hexdigest()[:16]}'
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """The cached model output for key, or None."""
+        if key not in self._index:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index[key][0] = time.time()
+        os.utime(path)
+        return text
+
+    def put(self, key, text):
+        """Cache the model output text of a page."""
+        if key in self._index:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write a hidden file and rename it, so readers never see a partial entry
+        tmp_path = os.path.join(os.path.dirname(path), f'.{key}.{uuid.uuid4().hex}')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._index[key] = [time.time(), size]
+            self.total_bytes += size
+        self.evict()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache is below 90% of max_bytes."""
+        if self.total_bytes <= self.max_bytes:
+            return
+        with self._lock:
+            oldest_first = sorted(self._index, key=lambda key: self._index[key][0])
+        target = int(self.max_bytes * 0.9)
+        for key in oldest_first:
+            if self.total_bytes <= target:
+                break
+            self.discard(key)
+
+    def clear(self):
+        for key in list(self._index):
+            self.discard(key)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+
+class RepeatedPages:
+    """
+    Identical pages of one run, sent to the model once.
+
+    Pages are grouped by result key (PageResultCache.make_key): a repeat of a page still being decoded
+    waits for that output, and the outputs of the last max_recent distinct pages are kept in memory, so
+    a page repeated long after its first copy was written (terms, separator sheets) is not decoded again
+    either. Works without the on-disk PageResultCache.
+    """
+
+    def __init__(self, max_recent=REPEAT_CACHE_PAGES):
+        self.max_recent = max_recent
+        self.waiting = {}  # result key -> pages waiting for its output
+        self.recent = OrderedDict()  # result key -> output, least recently used first
+
+    def get(self, key):
+        """The output of an earlier page with this key, or None."""
+        text = self.recent.get(key)
+        if text is not None:
+            self.recent.move_to_end(key)
+        return text
+
+    def add(self, key, page):
+        """Queue page for the output of key; True for the first page, which has to be sent to the model."""
+        if key in self.waiting:
+            self.waiting[key].append(page)
+            return False
+        self.waiting[key] = [page]
+        return True
+
+    def done(self, key, text):
+        """The pages waiting for the output text of key, which is kept for later repeats."""
+        if self.max_recent > 0:
+            self.recent[key] = text
+            self.recent.move_to_end(key)
+            while len(self.recent) > self.max_recent:
+                self.recent.popitem(last=False)
+        return self.waiting.pop(key)
+
+    @property
+    def pending(self):
+        """True while some page waits for an output."""
+        return bool(self.waiting)
+
+
+_SAMPLING_FIELDS = ('temperature', 'top_p', 'top_k', 'max_tokens', 'repetition_penalty', 'seed', 'stop',
+                    'include_stop_str_in_output', 'skip_special_tokens')
+
+
+def sampling_settings(sampling_params, logits_processors=()):
+    """The parts of a SamplingParams and its logits processors that change the output, for make_key."""
+    settings = {field: getattr(sampling_params, field, None) for field in _SAMPLING_FIELDS}
+    settings['logits_processors'] = [
+        [type(processor).__name__,
+         {name: sorted(value) if isinstance(value, set) else value for name, value in vars(processor).items()}]
+        for processor in logits_processors if processor is not None]
+    return settings
@@ -0,0 +1,121 @@
+import itertools
+import queue
+import threading
+
+_DONE = object()
+
+
+def prefetch(iterable, maxsize):
+    """
+    Iterate iterable on a background thread, at most maxsize items ahead of the consumer.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put(_DONE)
+        except BaseException as e:
+            items.put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # consumer stopped early: let the producer finish instead of blocking on a full queue
+        stop.set()
+
+
+class ReorderBuffer:
+    """
+    Takes (index, item) pairs in any order and releases them in index order, without gaps: start,
+    start + 1, ..., or the indices of order (an iterable) when given. next_index is None once order
+    is exhausted.
+    """
+
+    def __init__(self, start=0, order=None):
+        self._order = itertools.count(start) if order is None else iter(order)
+        self.next_index = next(self._order, None)
+        self._held = {}
+
+    def put(self, index, item):
+        """Add an item; returns the (index, item) pairs that became releasable, in order."""
+        self._held[index] = item
+        released = []
+        while self.next_index in self._held:
+            released.append((self.next_index, self._held.pop(self.next_index)))
+            self.next_index = next(self._order, None)
+        return released
+
+    def __len__(self):
+        return len(self._held)
+
+
+def hold_back(items, is_full):
+    """
+    Iterate items, but while is_full() yield None instead of pulling the next one. The Nones travel
+    down the pipeline (preprocess_with_store, iter_engine_outputs) and let the engine run, so pages
+    finished without the model can not pile up behind a page still being decoded.
+    """
+    items = iter(items)
+    while True:
+        while is_full():
+            yield None
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        yield item
+
+
+def iter_engine_outputs(engine, requests, sampling_params, max_inflight, can_admit=None):
+    """
+    Feed (request_id, inputs) pairs from the requests iterator into a vLLM LLMEngine and yield the
+    RequestOutput of each request as it finishes (completion order, not submission order).
+
+    At most max_inflight requests are in the engine at once, and new ones are only pulled while
+    can_admit() is true, so a slow downstream stage holds back rendering and preprocessing instead of
+    letting pages pile up. An idle engine always admits one request, so the pipeline cannot stall.
+    requests may yield None (see hold_back) to have the engine run before it is pulled from again.
+    """
+    inflight = 0
+    exhausted = False
+    while True:
+        while not exhausted and inflight < max_inflight and (inflight == 0 or can_admit is None or can_admit()):
+            try:
+                request = next(requests)
+            except StopIteration:
+                exhausted = True
+                break
+            if request is None:
+                break
+            request_id, inputs = request
+            engine.add_request(request_id, inputs, sampling_params)
+            inflight += 1
+
+        if not engine.has_unfinished_requests():
+            if exhausted:
+                return
+            continue
+
+        for output in engine.step():
+            if output.finished:
+                inflight -= 1
+                yield output
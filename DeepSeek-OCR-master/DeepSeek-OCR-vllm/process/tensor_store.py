@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+import torch
+
+from config import MIN_CROPS, MAX_CROPS, TENSOR_STORE_PATH, TENSOR_STORE_MAX_GB
+
+# bump whenever tokenize_with_images produces different tensors for the same image, mode and prompt;
+# entries written by other versions are dropped when the store is opened
+PREPROCESS_VERSION = 2
+
+_TENSOR_FIELDS = ('input_ids', 'pixel_values', 'images_crop', 'images_seq_mask', 'images_spatial_crop')
+
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class PageTensorStore:
+    """
+    Content-addressed on-disk store of preprocessed pages (tokenize_with_images output).
+
+    Each entry is a directory of .npy files plus a small meta.json, keyed by a hash of the
+    image bytes and of everything else that changes the tensors (mode, prompt, pixel dtype, tile
+    planner bounds; the preprocessing version is the store's subdirectory).
+    Hits are memory-mapped, so reading a page costs page faults rather than a decode + resize.
+    The store is bounded by size with least-recently-used eviction.
+    """
+
+    def __init__(self, root=TENSOR_STORE_PATH, max_bytes=int(TENSOR_STORE_MAX_GB * 1024 ** 3),
+                 version=PREPROCESS_VERSION):
+        self.max_bytes = max_bytes
+        self.root = os.path.join(root, f'v{version}')
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+
+        # entries of other preprocessing versions can never be hit again
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name != f'v{version}' and name.startswith('v') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+        # key -> [last use, bytes]; built once, kept up to date on get/put
+        self._index = {}
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.'):
+                    shutil.rmtree(entry.path, ignore_errors=True)  # interrupted write
+                elif entry.is_dir():
+                    self._index[entry.name] = [entry.stat().st_mtime, _dir_size(entry.path)]
+        self.total_bytes = sum(size for _, size in self._index.values())
+
+    @staticmethod
+    def make_key(image_digest, mode, prompt, uint8_transport, min_crops=MIN_CROPS, max_crops=MAX_CROPS):
+        """
+        image_digest: hex digest of the image content (see digest_file / digest_image).
+        min_crops, max_crops: the tile planner bounds, which pick the tile grid of cropping modes.
+        """
+        settings = f'{tuple(mode)}|{prompt}|{int(uint8_transport)}|{min_crops}|{max_crops}'.encode('utf-8')
+        return f'{image_digest}-{hashlib.sha256(settings).hexdigest()[:16]}'
+
+    @staticmethod
+    def digest_file(path):
+        """Hash of an image file's bytes; lets a hit skip decoding the file at all."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def digest_image(image):
+        """Hash of decoded pixels, for images that have no file of their own (e.g. rendered PDF pages)."""
+        digest = hashlib.sha256(f'{image.mode}{image.size}'.encode('utf-8'))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """The stored tokenize_with_images output for key, memory-mapped, or None."""
+        path = self._path(key)
+        if key not in self._index or not os.path.isdir(path):
+            return None
+        try:
+            # copy-on-write maps: no read happens until the tensors are touched, and nothing is written back
+            tensors = [torch.from_numpy(np.load(os.path.join(path, f'{field}.npy'), mmap_mode='c'))
+                       for field in _TENSOR_FIELDS]
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index[key][0] = time.time()
+        os.utime(path)
+
+        input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop = tensors
+        image_shapes = [tuple(shape) for shape in meta['image_shapes']]
+        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop,
+                 meta['num_image_tokens'], image_shapes]]
+
+    def put(self, key, features):
+        """Store a tokenize_with_images output ([[input_ids, ..., image_shapes]])."""
+        if key in self._index:
+            return
+        (input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop,
+         num_image_tokens, image_shapes) = features[0]
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write into a hidden directory and rename, so readers never see a partial entry
+        tmp_path = os.path.join(os.path.dirname(path), f'.{key}.{uuid.uuid4().hex}')
+        os.makedirs(tmp_path)
+        try:
+            for field, tensor in zip(_TENSOR_FIELDS, (input_ids, pixel_values, images_crop,
+                                                      images_seq_mask, images_spatial_crop)):
+                np.save(os.path.join(tmp_path, f'{field}.npy'), tensor.contiguous().numpy())
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'num_image_tokens': list(num_image_tokens),
+                           'image_shapes': [list(shape) for shape in image_shapes]}, f)
+            size = _dir_size(tmp_path)
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+            return
+
+        with self._lock:
+            self._index[key] = [time.time(), size]
+            self.total_bytes += size
+        self.evict()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+        shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def evict(self):
+        """Drop least recently used entries until the store is below 90% of max_bytes."""
+        if self.total_bytes <= self.max_bytes:
+            return
+        with self._lock:
+            oldest_first = sorted(self._index, key=lambda key: self._index[key][0])
+        target = int(self.max_bytes * 0.9)
+        for key in oldest_first:
+            if self.total_bytes <= target:
+                break
+            self.discard(key)
+
+    def clear(self):
+        for key in list(self._index):
+            self.discard(key)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+
+def preprocess_with_store(pool, store, keys, load_image, lookahead=None):
+    """
+    Yield the tokenize_with_images output for every key, in order. Hits come memory-mapped from the
+    store; misses are loaded with load_image(index), preprocessed on the pool and written to the store.
+    Without a store every page is a miss.
+
+    keys may be a lazy iterable. With lookahead, at most that many pages are loaded / preprocessed
+    ahead of the consumer; without it, every miss is submitted up front. A None key (see hold_back)
+    hands over every page in flight, then is passed on as None.
+    """
+    window = deque()
+
+    def finish():
+        key, item, future = window.popleft()
+        if item is None:
+            item = pool.result(future)
+            if store is not None:
+                store.put(key, item)
+        return item
+
+    idx = 0
+    for key in keys:
+        if key is None:
+            while window:
+                yield finish()
+            yield None
+            continue
+        item = store.get(key) if store is not None else None
+        window.append((key, item, None if item is not None else pool.submit(load_image(idx))))
+        idx += 1
+        if lookahead is not None and len(window) >= lookahead:
+            yield finish()
+    while window:
+        yield finish()
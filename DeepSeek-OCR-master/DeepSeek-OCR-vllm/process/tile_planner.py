@@ -0,0 +1,111 @@
+import math
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+from config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, MIN_CROPS, MAX_CROPS
+
+PATCH_SIZE = 16
+DOWNSAMPLE_RATIO = 4
+# pages whose both sides fit in this many pixels are never tiled
+NO_CROP_MAX_SIDE = 640
+
+
+def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
+    best_ratio_diff = float('inf')
+    best_ratio = (1, 1)
+    area = width * height
+    for ratio in target_ratios:
+        target_aspect_ratio = ratio[0] / ratio[1]
+        ratio_diff = abs(aspect_ratio - target_aspect_ratio)
+        if ratio_diff < best_ratio_diff:
+            best_ratio_diff = ratio_diff
+            best_ratio = ratio
+        elif ratio_diff == best_ratio_diff:
+            if area > 0.5 * image_size * image_size * ratio[0] * ratio[1]:
+                best_ratio = ratio
+    # print(f'width: {width}, height: {height}, best_ratio: {best_ratio}')
+    return best_ratio
+
+
+def num_queries(size, patch_size=PATCH_SIZE, downsample_ratio=DOWNSAMPLE_RATIO):
+    """Side length (in vision tokens) of a size x size view."""
+    return math.ceil((size // patch_size) / downsample_ratio)
+
+
+def count_image_tokens(crop_ratio, base_size=BASE_SIZE, image_size=IMAGE_SIZE):
+    """Number of <image> tokens for a global view plus a (num_width_tiles, num_height_tiles) grid."""
+    num_width_tiles, num_height_tiles = crop_ratio
+
+    h = w = num_queries(base_size)
+    h2 = w2 = num_queries(image_size)
+
+    global_views_tokens = h * (w + 1)
+    if num_width_tiles > 1 or num_height_tiles > 1:
+        local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
+    else:
+        local_views_tokens = 0
+
+    return global_views_tokens + local_views_tokens + 1
+
+
+class TilePlan(NamedTuple):
+    crop_ratio: Tuple[int, int]  # (num_width_tiles, num_height_tiles)
+    canvas_size: Tuple[int, int]  # size the page is resized to before tiling, (0, 0) if not tiled
+    tile_boxes: Tuple[Tuple[int, int, int, int], ...]  # crop boxes on the canvas, row-major
+    num_image_tokens: int
+
+    @property
+    def num_tiles(self):
+        return len(self.tile_boxes)
+
+
+class TilePlanner:
+    """
+    Pixel-free crop planning: picks the crop grid, tile boxes and vision-token count from the
+    page size alone. The candidate grids for (min_crops, max_crops) are built once and plans
+    are memoized, so asking how expensive a page is costs a dict lookup.
+    """
+
+    def __init__(self, min_crops=MIN_CROPS, max_crops=MAX_CROPS, cache_size=4096):
+        self.min_crops = min_crops
+        self.max_crops = max_crops
+
+        target_ratios = set(
+            (i, j) for n in range(min_crops, max_crops + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
+            i * j <= max_crops and i * j >= min_crops)
+        self.target_ratios = tuple(sorted(target_ratios, key=lambda x: x[0] * x[1]))
+
+        self.best_ratio = lru_cache(maxsize=cache_size)(self._best_ratio)
+        self.plan = lru_cache(maxsize=cache_size)(self._plan)
+
+    def _best_ratio(self, width, height, image_size=IMAGE_SIZE):
+        """Closest crop grid (num_width_tiles, num_height_tiles) for a width x height page."""
+        return find_closest_aspect_ratio(width / height, self.target_ratios, width, height, image_size)
+
+    def _plan(self, width, height, base_size=BASE_SIZE, image_size=IMAGE_SIZE, cropping=CROP_MODE):
+        if not cropping or (width <= NO_CROP_MAX_SIDE and height <= NO_CROP_MAX_SIDE):
+            crop_ratio = (1, 1)
+        else:
+            crop_ratio = self.best_ratio(width, height, image_size)
+
+        num_width_tiles, num_height_tiles = crop_ratio
+        if num_width_tiles > 1 or num_height_tiles > 1:
+            canvas_size = (image_size * num_width_tiles, image_size * num_height_tiles)
+            tile_boxes = tuple(
+                (col * image_size, row * image_size, (col + 1) * image_size, (row + 1) * image_size)
+                for row in range(num_height_tiles) for col in range(num_width_tiles))
+        else:
+            canvas_size = (0, 0)
+            tile_boxes = ()
+
+        return TilePlan(crop_ratio, canvas_size, tile_boxes,
+                        count_image_tokens(crop_ratio, base_size=base_size, image_size=image_size))
+
+    def num_image_tokens(self, width, height, base_size=BASE_SIZE, image_size=IMAGE_SIZE, cropping=CROP_MODE):
+        return self.plan(width, height, base_size, image_size, cropping).num_image_tokens
+
+
+@lru_cache(maxsize=None)
+def get_tile_planner(min_crops=MIN_CROPS, max_crops=MAX_CROPS):
+    """Shared planner per (min_crops, max_crops)."""
+    return TilePlanner(min_crops, max_crops)
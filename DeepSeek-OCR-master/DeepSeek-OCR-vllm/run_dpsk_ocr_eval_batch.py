@@ -7,8 +7,7 @@ if torch.version.cuda == '11.8':
 os.environ['VLLM_USE_V1'] = '0'
 os.environ["CUDA_VISIBLE_DEVICES"] = '0'
 
-from config import MODEL_PATH, INPUT_PATH, OUTPUT_PATH, PROMPT, MAX_CONCURRENCY, CROP_MODE, NUM_WORKERS
-from concurrent.futures import ThreadPoolExecutor
+from config import MODEL_PATH, INPUT_PATH, OUTPUT_PATH, PROMPT, MAX_CONCURRENCY, TENSOR_STORE_PATH, RESULT_CACHE_PATH, UINT8_TRANSPORT, SKIP_BLANK_PAGES
 import glob
 from PIL import Image
 from deepseek_ocr import DeepseekOCRForCausalLM
@@ -17,7 +16,13 @@ from vllm.model_executor.models.registry import ModelRegistry
 
 from vllm import LLM, SamplingParams
 from process.ngram_norepeat import NoRepeatNGramLogitsProcessor
-from process.image_process import DeepseekOCRProcessor
+from process.preprocess_pool import PreprocessPool
+from process.modes import get_mode, mm_processor_kwargs
+from process.tensor_store import PageTensorStore, preprocess_with_store
+from process.result_cache import PageResultCache, sampling_settings
+from process.page_filter import BLANK_PAGE_MARK, is_blank_page, skips_blank_pages
+from process.image_loader import load_image
+from process.grounding import to_markdown
 ModelRegistry.register_model("DeepseekOCRForCausalLM", DeepseekOCRForCausalLM)
 
 
@@ -50,6 +55,10 @@ class Colors:
     BLUE = '\033[34m'
     RESET = '\033[0m' 
 
+
+CENTER_TAGS = {'<center>': '', '</center>': ''}  # dropped from the .md along with the grounding tags
+
+
 def clean_formula(text):
 
     formula_pattern = r'\\\[(.*?)\\\]'
@@ -67,27 +76,6 @@ def clean_formula(text):
     
     return cleaned_text
 
-def re_match(text):
-    pattern = r'(<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>)'
-    matches = re.findall(pattern, text, re.DOTALL)
-
-
-    # mathes_image = []
-    mathes_other = []
-    for a_match in matches:
-        mathes_other.append(a_match[0])
-    return matches, mathes_other
-
-def process_single_image(image):
-    """single image"""
-    prompt_in = prompt
-    cache_item = {
-        "prompt": prompt_in,
-        "multi_modal_data": {"image": DeepseekOCRProcessor().tokenize_with_images(images = [image], bos=True, eos=True, cropping=CROP_MODE)},
-    }
-    return cache_item
-
-
 if __name__ == "__main__":
 
     # INPUT_PATH = OmniDocBench images path
@@ -99,12 +87,7 @@ if __name__ == "__main__":
     print(f'{Colors.RED}glob images.....{Colors.RESET}')
 
     images_path = glob.glob(f'{INPUT_PATH}/*')
-
-    images = []
-
-    for image_path in images_path:
-        image = Image.open(image_path).convert('RGB')
-        images.append(image)
+    ocr_paths = images_path
 
     prompt = PROMPT
 
@@ -122,12 +105,68 @@ if __name__ == "__main__":
     #     ]
     #     batch_inputs.extend(cache_list)
 
-    with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:  
-        batch_inputs = list(tqdm(
-            executor.map(process_single_image, images),
-            total=len(images),
-            desc="Pre-processed images"
-        ))
+    store = PageTensorStore() if TENSOR_STORE_PATH else None
+    result_cache = PageResultCache() if RESULT_CACHE_PATH else None
+
+    # identical images are decoded once, and images with a cached output not at all
+    digests = [PageTensorStore.digest_file(image_path) for image_path in ocr_paths]
+    cache_sampling = sampling_settings(sampling_params, logits_processors)
+    result_keys = [PageResultCache.make_key(digest, get_mode(), prompt, cache_sampling) for digest in digests]
+    results = {}  # result key -> model output
+    if result_cache is not None:
+        for key in set(result_keys):
+            cached = result_cache.get(key)
+            if cached is not None:
+                results[key] = cached
+    todo = []  # one index into ocr_paths per output still to decode
+    todo_keys = set()
+    for i, key in enumerate(result_keys):
+        if key not in results and key not in todo_keys:
+            todo_keys.add(key)
+            todo.append(i)
+    if len(todo) < len(ocr_paths):
+        cached = sum(key in results for key in result_keys)
+        print(f'{Colors.GREEN}{cached} images from the result cache, '
+              f'{len(ocr_paths) - cached - len(todo)} repeated images decoded once{Colors.RESET}')
+
+    # blank pages never reach the model, when the prompt only reads their text; they are found on the
+    # decode preprocessing uses anyway, so every image is decoded once
+    skip_blank_pages = SKIP_BLANK_PAGES and skips_blank_pages(prompt)
+    blank_keys = set()  # result keys of blank images
+
+    with PreprocessPool() as pool:
+        sent = []  # index into ocr_paths of every image sent to the model, in order
+        images = {}  # position in sent -> decoded image, until it is preprocessed
+
+        def keys():
+            for i in todo:
+                # images already in the tensor store are neither decoded nor preprocessed again (blank
+                # images never get there)
+                if store is not None:
+                    key = PageTensorStore.make_key(digests[i], pool.mode, prompt, UINT8_TRANSPORT)
+                    if key in store:
+                        sent.append(i)
+                        yield key
+                        continue
+                else:
+                    key = ocr_paths[i]
+                image = load_image(ocr_paths[i], pool.mode, exif_transpose=False)
+                if skip_blank_pages and is_blank_page(image):
+                    blank_keys.add(result_keys[i])
+                    continue
+                images[len(sent)] = image
+                sent.append(i)
+                yield key
+
+        features = preprocess_with_store(pool, store, keys(), images.pop)
+        batch_inputs = [
+            {"prompt": prompt, "multi_modal_data": {"image": image_features},
+             "mm_processor_kwargs": mm_processor_kwargs(pool.mode)}
+            for image_features in tqdm(features, total=len(todo), desc="Pre-processed images")
+        ]
+    if blank_keys:
+        blank = sum(key in blank_keys for key in result_keys)
+        print(f'{Colors.YELLOW}{blank} blank images skipped{Colors.RESET}')
 
 
     
@@ -135,25 +174,37 @@ if __name__ == "__main__":
     outputs_list = llm.generate(
         batch_inputs,
         sampling_params=sampling_params
-    )
+    ) if batch_inputs else []
+
+    for i, output in zip(sent, outputs_list):
+        results[result_keys[i]] = output.outputs[0].text
+        if result_cache is not None:
+            result_cache.put(result_keys[i], output.outputs[0].text)
 
 
     output_path = OUTPUT_PATH
 
     os.makedirs(output_path, exist_ok=True)
 
-    for output, image in zip(outputs_list, images_path):
+    for key, image in zip(result_keys, ocr_paths):
+
+        if key in blank_keys:
+            # empty result for blank images; the raw output carries the flag
+            with open(output_path + image.split('/')[-1].replace('.jpg', '_det.md'), 'w', encoding='utf-8') as afile:
+                afile.write(BLANK_PAGE_MARK)
+            with open(output_path + image.split('/')[-1].replace('.jpg', '.md'), 'w', encoding='utf-8') as afile:
+                afile.write('')
+            continue
 
-        content = output.outputs[0].text
+        content = results[key]
         mmd_det_path = output_path + image.split('/')[-1].replace('.jpg', '_det.md')
 
         with open(mmd_det_path, 'w', encoding='utf-8') as afile:
             afile.write(content)
 
         content = clean_formula(content)
-        matches_ref, mathes_other = re_match(content)
-        for idx, a_match_other in enumerate(tqdm(mathes_other, desc="other")):
-            content = content.replace(a_match_other, '').replace('\n\n\n\n', '\n\n').replace('\n\n\n', '\n\n').replace('<center>', '').replace('</center>', '')
+        # every grounding block is dropped, figures included
+        content = to_markdown(content, replacements=CENTER_TAGS)
         
         mmd_path = output_path + image.split('/')[-1].replace('.jpg', '.md')
 
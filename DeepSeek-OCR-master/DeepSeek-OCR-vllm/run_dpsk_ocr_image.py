@@ -1,5 +1,4 @@
 import asyncio
-import re
 import os
 
 import torch
@@ -16,23 +15,30 @@ import time
 from deepseek_ocr import DeepseekOCRForCausalLM
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import numpy as np
-from tqdm import tqdm
 from process.ngram_norepeat import NoRepeatNGramLogitsProcessor
-from process.image_process import DeepseekOCRProcessor
-from config import MODEL_PATH, INPUT_PATH, OUTPUT_PATH, PROMPT, CROP_MODE
+from process.image_process import get_processor
+from process.modes import get_mode, mm_processor_kwargs
+from process.image_loader import load_image as load_scaled_image
+from process.page_filter import BLANK_PAGE_MARK, is_blank_page, skips_blank_pages
+from process.margin_trim import content_box, remap_det_boxes
+from process.grounding import parse_grounding, to_markdown, to_pixels
+from process.result_cache import PageResultCache, sampling_settings
+from process.tensor_store import PageTensorStore
+from config import MODEL_PATH, INPUT_PATH, OUTPUT_PATH, PROMPT, SKIP_BLANK_PAGES, TRIM_MARGINS, RESULT_CACHE_PATH
 
 
 
 ModelRegistry.register_model("DeepseekOCRForCausalLM", DeepseekOCRForCausalLM)
 
-def load_image(image_path):
+def load_image(image_path, mode=None):
 
     try:
-        image = Image.open(image_path)
-        
-        corrected_image = ImageOps.exif_transpose(image)
-
-        return corrected_image
+        if mode is None:
+            # full resolution, EXIF orientation applied
+            with Image.open(image_path) as image:
+                return ImageOps.exif_transpose(image).convert('RGB')
+        # decoded at the resolution the tile plan of mode needs, EXIF orientation applied
+        return load_scaled_image(image_path, mode)
         
     except Exception as e:
         print(f"error: {e}")
@@ -42,35 +48,7 @@ def load_image(image_path):
             return None
 
 
-def re_match(text):
-    pattern = r'(<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>)'
-    matches = re.findall(pattern, text, re.DOTALL)
-
-
-    mathes_image = []
-    mathes_other = []
-    for a_match in matches:
-        if '<|ref|>image<|/ref|>' in a_match[0]:
-            mathes_image.append(a_match[0])
-        else:
-            mathes_other.append(a_match[0])
-    return matches, mathes_image, mathes_other
-
-
-def extract_coordinates_and_label(ref_text, image_width, image_height):
-
-
-    try:
-        label_type = ref_text[1]
-        cor_list = eval(ref_text[2])
-    except Exception as e:
-        print(e)
-        return None
-
-    return (label_type, cor_list)
-
-
-def draw_bounding_boxes(image, refs):
+def draw_bounding_boxes(image, blocks):
 
     image_width, image_height = image.size
     img_draw = image.copy()
@@ -84,24 +62,17 @@ def draw_bounding_boxes(image, refs):
 
     img_idx = 0
     
-    for i, ref in enumerate(refs):
+    for i, block in enumerate(blocks):
         try:
-            result = extract_coordinates_and_label(ref, image_width, image_height)
-            if result:
-                label_type, points_list = result
+            if len(block.boxes):
+                label_type = block.label
                 
                 color = (np.random.randint(0, 200), np.random.randint(0, 200), np.random.randint(0, 255))
 
                 color_a = color + (20, )
-                for points in points_list:
+                for points in to_pixels(block.boxes, image_width, image_height).tolist():
                     x1, y1, x2, y2 = points
 
-                    x1 = int(x1 / 999 * image_width)
-                    y1 = int(y1 / 999 * image_height)
-
-                    x2 = int(x2 / 999 * image_width)
-                    y2 = int(y2 / 999 * image_height)
-
                     if label_type == 'image':
                         try:
                             cropped = image.crop((x1, y1, x2, y2))
@@ -137,14 +108,26 @@ def draw_bounding_boxes(image, refs):
     return img_draw
 
 
-def process_image_with_refs(image, ref_texts):
-    result_image = draw_bounding_boxes(image, ref_texts)
+def process_image_with_refs(image, blocks):
+    result_image = draw_bounding_boxes(image, blocks)
     return result_image
 
 
 
 
-async def stream_generate(image=None, prompt=''):
+logits_processors = [NoRepeatNGramLogitsProcessor(ngram_size=30, window_size=90, whitelist_token_ids= {128821, 128822})] #whitelist: <td>, </td> 
+
+sampling_params = SamplingParams(
+    temperature=0.0,
+    max_tokens=8192,
+    logits_processors=logits_processors,
+    skip_special_tokens=False,
+    # ignore_eos=False,
+    
+)
+
+
+async def stream_generate(image=None, prompt='', mode=None):
 
 
     engine_args = AsyncEngineArgs(
@@ -159,17 +142,6 @@ async def stream_generate(image=None, prompt=''):
     )
     engine = AsyncLLMEngine.from_engine_args(engine_args)
     
-    logits_processors = [NoRepeatNGramLogitsProcessor(ngram_size=30, window_size=90, whitelist_token_ids= {128821, 128822})] #whitelist: <td>, </td> 
-
-    sampling_params = SamplingParams(
-        temperature=0.0,
-        max_tokens=8192,
-        logits_processors=logits_processors,
-        skip_special_tokens=False,
-        # ignore_eos=False,
-        
-    )
-    
     request_id = f"request-{int(time.time())}"
 
     printed_length = 0  
@@ -177,7 +149,8 @@ async def stream_generate(image=None, prompt=''):
     if image and '<image>' in prompt:
         request = {
             "prompt": prompt,
-            "multi_modal_data": {"image": image}
+            "multi_modal_data": {"image": image},
+            "mm_processor_kwargs": mm_processor_kwargs(mode),
         }
     elif prompt:
         request = {
@@ -206,18 +179,44 @@ if __name__ == "__main__":
     os.makedirs(OUTPUT_PATH, exist_ok=True)
     os.makedirs(f'{OUTPUT_PATH}/images', exist_ok=True)
 
-    image = load_image(INPUT_PATH).convert('RGB')
+    mode = get_mode()
 
-    
-    if '<image>' in PROMPT:
+    # margins are found on the full-size image, like the PDF runner does, and the tile plan made after trimming;
+    # otherwise the image is decoded only as large as tokenize_with_images needs (the saved outputs are full size)
+    image = load_image(INPUT_PATH, None if TRIM_MARGINS else mode).convert('RGB')
 
-        image_features = DeepseekOCRProcessor().tokenize_with_images(images = [image], bos=True, eos=True, cropping=CROP_MODE)
+    prompt = PROMPT
+
+    if SKIP_BLANK_PAGES and skips_blank_pages(prompt) and is_blank_page(image):
+        # nothing to read, skip the model
+        print('blank image, skipped')
+        result_out = BLANK_PAGE_MARK
     else:
-        image_features = ''
+        # crop to the content before the tile grid is chosen; <|det|> boxes are mapped back to the full image
+        trim_box = content_box(image) if TRIM_MARGINS and '<image>' in PROMPT else None
+
+        ocr_image = image.crop(trim_box) if trim_box else image
+        # an image seen before with the same mode, prompt and sampling is not decoded again
+        result_cache = PageResultCache() if RESULT_CACHE_PATH and '<image>' in PROMPT else None
+        result_key = None if result_cache is None else PageResultCache.make_key(
+            PageTensorStore.digest_image(ocr_image), mode, prompt, sampling_settings(sampling_params, logits_processors))
+        result_out = result_cache.get(result_key) if result_cache is not None else None
+
+        if result_out is not None:
+            print(result_out)
+        else:
+            if '<image>' in PROMPT:
 
-    prompt = PROMPT
+                image_features = get_processor().tokenize_with_images(
+                    images = [ocr_image], bos=True, eos=True, mode=mode)
+            else:
+                image_features = ''
 
-    result_out = asyncio.run(stream_generate(image_features, prompt))
+            result_out = asyncio.run(stream_generate(image_features, prompt, mode))
+            if result_cache is not None:
+                result_cache.put(result_key, result_out)
+
+        result_out = remap_det_boxes(result_out, trim_box, image.size)
 
 
     save_results = 1
@@ -225,23 +224,19 @@ if __name__ == "__main__":
     if save_results and '<image>' in prompt:
         print('='*15 + 'save results:' + '='*15)
 
-        image_draw = image.copy()
+        # <|det|> boxes are in 0-999 coordinates, so figures are cropped and boxes drawn on the full-resolution
+        # image; the reduced decode is only what the model was given
+        image_draw = image.copy() if TRIM_MARGINS else load_image(INPUT_PATH).convert('RGB')
 
         outputs = result_out
 
         with open(f'{OUTPUT_PATH}/result_ori.mmd', 'w', encoding = 'utf-8') as afile:
             afile.write(outputs)
 
-        matches_ref, matches_images, mathes_other = re_match(outputs)
-        # print(matches_ref)
-        result = process_image_with_refs(image_draw, matches_ref)
-
-
-        for idx, a_match_image in enumerate(tqdm(matches_images, desc="image")):
-            outputs = outputs.replace(a_match_image, f'![](images/' + str(idx) + '.jpg)\n')
+        blocks = parse_grounding(outputs)
+        result = process_image_with_refs(image_draw, blocks)
 
-        for idx, a_match_other in enumerate(tqdm(mathes_other, desc="other")):
-            outputs = outputs.replace(a_match_other, '').replace('\\coloneqq', ':=').replace('\\eqqcolon', '=:')
+        outputs = to_markdown(outputs, blocks, image_link=lambda idx: f'images/{idx}.jpg', collapse_newlines=False)
 
         # if 'structural formula' in conversation[0]['content']:
         #     outputs = '<smiles>' + outputs + '</smiles>'
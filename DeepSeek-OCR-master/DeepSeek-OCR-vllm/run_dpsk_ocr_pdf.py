@@ -1,11 +1,8 @@
 import os
 import fitz
 import img2pdf
-import io
-import re
 from tqdm import tqdm
 import torch
-from concurrent.futures import ThreadPoolExecutor
  
 
 if torch.version.cuda == '11.8':
@@ -14,9 +11,9 @@ os.environ['VLLM_USE_V1'] = '0'
 os.environ["CUDA_VISIBLE_DEVICES"] = '0'
 
 
-from config import MODEL_PATH, INPUT_PATH, OUTPUT_PATH, PROMPT, SKIP_REPEAT, MAX_CONCURRENCY, NUM_WORKERS, CROP_MODE
+from config import MODEL_PATH, INPUT_PATH, OUTPUT_PATH, PROMPT, SKIP_REPEAT, PAGE_RANGE, RESUME, LAYOUT_PDF, MAX_CONCURRENCY, MAX_INFLIGHT_PAGES, NUM_WORKERS, TENSOR_STORE_PATH, RESULT_CACHE_PATH, UINT8_TRANSPORT, SKIP_BLANK_PAGES, TRIM_MARGINS, TEXT_LAYER_ROUTING, ADAPTIVE_DPI, EXTRACT_SCAN_IMAGES, MIN_CROPS, MAX_CROPS
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 import numpy as np
 from deepseek_ocr import DeepseekOCRForCausalLM
 
@@ -24,10 +21,27 @@ from vllm.model_executor.models.registry import ModelRegistry
 
 from vllm import LLM, SamplingParams
 from process.ngram_norepeat import NoRepeatNGramLogitsProcessor
-from process.image_process import DeepseekOCRProcessor
+from process.preprocess_pool import PreprocessPool
+from process.modes import get_mode, mm_processor_kwargs
+from process.checkpoint import PAGE_BLANK, PAGE_DROPPED, PAGE_WRITTEN, PageCheckpoint
+from process.page_selection import PageSelection
+from process.tensor_store import PREPROCESS_VERSION, PageTensorStore, preprocess_with_store
+from process.result_cache import PageResultCache, RepeatedPages, sampling_settings
+from process.page_filter import BLANK_PAGE_MARK, is_blank_page, skips_blank_pages
+from process.margin_trim import content_box, remap_det_boxes
+from process.pdf_render import PdfRenderPool
+from process.layout_overlay import write_layout_pdf
+from process.grounding import parse_grounding, to_markdown, to_pixels
+from process.batch import is_batch_input, is_image, list_documents, output_dirs
+from process.image_loader import load_image
+from process.pdf_text import text_layer_markdown
+from process.streaming import ReorderBuffer, hold_back, iter_engine_outputs, prefetch
 
 ModelRegistry.register_model("DeepseekOCRForCausalLM", DeepseekOCRForCausalLM)
 
+# parsed before the model is loaded, so a mistyped PAGE_RANGE fails right away
+page_selection = PageSelection.parse(PAGE_RANGE)
+
 
 llm = LLM(
     model=MODEL_PATH,
@@ -61,94 +75,112 @@ class Colors:
     BLUE = '\033[34m'
     RESET = '\033[0m' 
 
-def pdf_to_images_high_quality(pdf_path, dpi=144, image_format="PNG"):
-    """
-    pdf2images
-    """
-    images = []
-    
-    pdf_document = fitz.open(pdf_path)
-    
-    zoom = dpi / 72.0
-    matrix = fitz.Matrix(zoom, zoom)
-    
-    for page_num in range(pdf_document.page_count):
-        page = pdf_document[page_num]
-
-        pixmap = page.get_pixmap(matrix=matrix, alpha=False)
-        Image.MAX_IMAGE_PIXELS = None
-
-        if image_format.upper() == "PNG":
-            img_data = pixmap.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-        else:
-            img_data = pixmap.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-        
-        images.append(img)
-    
-    pdf_document.close()
-    return images
-
-def pil_to_pdf_img2pdf(pil_images, output_path):
+def jpegs_to_pdf(jpeg_paths, output_path):
 
-    if not pil_images:
+    if not jpeg_paths:
         return
-    
-    image_bytes_list = []
-    
-    for img in pil_images:
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='JPEG', quality=95)
-        img_bytes = img_buffer.getvalue()
-        image_bytes_list.append(img_bytes)
-    
+
     try:
-        pdf_bytes = img2pdf.convert(image_bytes_list)
+        # img2pdf embeds the JPEG streams as they are, no re-encoding
         with open(output_path, "wb") as f:
-            f.write(pdf_bytes)
+            img2pdf.convert(jpeg_paths, outputstream=f)
 
     except Exception as e:
         print(f"error: {e}")
 
 
+class PageWriter:
+    """
+    Takes finished pages in page order and checkpoints each one as it arrives: its .mmd and _det.mmd
+    fragments (and, for a raster layouts PDF, its layout image) go to disk right away, so nothing
+    accumulates in memory across the document and an interrupted run can resume after the last page
+    written. The .mmd files and the layouts PDF are assembled from the checkpoint on exit; after a
+    complete run only its manifest is kept, marking the document as done.
+
+    With LAYOUT_PDF = 'vector' the layouts PDF is a copy of source_path with the boxes drawn over it.
+    With page_numbers, every page of the .mmd files starts with a <!-- page n --> comment giving its
+    page number in the input, for runs that convert a selection of the pages.
+    """
+
+    def __init__(self, mmd_path, mmd_det_path, pdf_out_path, checkpoint, source_path=None, output_dir=OUTPUT_PATH,
+                 page_numbers=False):
+        self.mmd_path = mmd_path
+        self.mmd_det_path = mmd_det_path
+        self.pdf_out_path = pdf_out_path
+        self.checkpoint = checkpoint
+        self.raster_layouts = LAYOUT_PDF == 'raster' or source_path is None
+        self.source_path = source_path
+        self.output_dir = output_dir  # figure crops go to its images/
+        self.page_numbers = page_numbers
+        # image crops are numbered by jdx, which carries on from the pages already done
+        self.jdx = sum(status != PAGE_DROPPED for _, status in checkpoint.pages)
+        self.blank_count = 0
+
+    def write(self, page_idx, img, content):
+        """content: model output mapped to the page frame, or None for a blank page."""
+        page_num = f'\n<--- Page Split --->'
+        page_mark = f'<!-- page {page_idx + 1} -->\n' if self.page_numbers else ''
+
+        if content is None:
+            # empty result, flagged so it can be told apart from a page the model found nothing on
+            blank = page_mark + BLANK_PAGE_MARK + f'\n{page_num}\n'
+            self.checkpoint.add(page_idx, PAGE_BLANK, blank, blank,
+                                img if self.raster_layouts else None)
+            self.blank_count += 1
+            self.jdx += 1
+            return
+
+        jdx = self.jdx
 
-def re_match(text):
-    pattern = r'(<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>)'
-    matches = re.findall(pattern, text, re.DOTALL)
+        if '<｜end▁of▁sentence｜>' in content: # repeat no eos
+            content = content.replace('<｜end▁of▁sentence｜>', '')
+        else:
+            if SKIP_REPEAT:
+                self.checkpoint.add(page_idx, PAGE_DROPPED)
+                return
 
+        mmd_det = page_mark + content + f'\n{page_num}\n'
 
-    mathes_image = []
-    mathes_other = []
-    for a_match in matches:
-        if '<|ref|>image<|/ref|>' in a_match[0]:
-            mathes_image.append(a_match[0])
+        blocks = parse_grounding(content)
+        if self.raster_layouts:
+            image_draw = img.copy()
+            result_image = process_image_with_refs(image_draw, blocks, jdx, self.output_dir)
         else:
-            mathes_other.append(a_match[0])
-    return matches, mathes_image, mathes_other
+            # the boxes are drawn on the source PDF on exit, only the figure crops come from the pixels
+            save_image_crops(img, blocks, jdx, self.output_dir)
+            result_image = None
 
+        content = to_markdown(content, blocks, image_link=lambda idx: f'images/{jdx}_{idx}.jpg')
 
-def extract_coordinates_and_label(ref_text, image_width, image_height):
+        self.checkpoint.add(page_idx, PAGE_WRITTEN, page_mark + content + f'\n{page_num}\n', mmd_det, result_image)
 
+        self.jdx += 1
 
-    try:
-        label_type = ref_text[1]
-        cor_list = eval(ref_text[2])
-    except Exception as e:
-        print(e)
-        return None
+    def _page_refs(self):
+        for idx, status in self.checkpoint.pages:
+            if status == PAGE_DROPPED:
+                continue
+            blocks = parse_grounding(self.checkpoint.fragment(idx, '_det.mmd'))
+            yield idx, [(block.label, block.boxes) for block in blocks if len(block.boxes)]
 
-    return (label_type, cor_list)
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, *exc):
+        # partial results are assembled too; the checkpoint stays for the run that resumes them
+        self.checkpoint.assemble(self.mmd_path, self.mmd_det_path)
+        if self.raster_layouts:
+            jpegs_to_pdf(self.checkpoint.layout_paths(), self.pdf_out_path)
+        else:
+            write_layout_pdf(self.source_path, self.pdf_out_path, self._page_refs())
+        if exc_type is None:
+            self.checkpoint.mark_complete()
+        else:
+            self.checkpoint.close()
+            print(f'{Colors.YELLOW}{len(self.checkpoint.pages)} pages checkpointed in {self.checkpoint.directory}{Colors.RESET}')
 
-def draw_bounding_boxes(image, refs, jdx):
+
+def draw_bounding_boxes(image, blocks, jdx, output_dir=OUTPUT_PATH):
 
     image_width, image_height = image.size
     img_draw = image.copy()
@@ -162,28 +194,21 @@ def draw_bounding_boxes(image, refs, jdx):
 
     img_idx = 0
     
-    for i, ref in enumerate(refs):
+    for i, block in enumerate(blocks):
         try:
-            result = extract_coordinates_and_label(ref, image_width, image_height)
-            if result:
-                label_type, points_list = result
+            if len(block.boxes):
+                label_type = block.label
                 
                 color = (np.random.randint(0, 200), np.random.randint(0, 200), np.random.randint(0, 255))
 
                 color_a = color + (20, )
-                for points in points_list:
+                for points in to_pixels(block.boxes, image_width, image_height).tolist():
                     x1, y1, x2, y2 = points
 
-                    x1 = int(x1 / 999 * image_width)
-                    y1 = int(y1 / 999 * image_height)
-
-                    x2 = int(x2 / 999 * image_width)
-                    y2 = int(y2 / 999 * image_height)
-
                     if label_type == 'image':
                         try:
                             cropped = image.crop((x1, y1, x2, y2))
-                            cropped.save(f"{OUTPUT_PATH}/images/{jdx}_{img_idx}.jpg")
+                            cropped.save(f"{output_dir}/images/{jdx}_{img_idx}.jpg")
                         except Exception as e:
                             print(e)
                             pass
@@ -215,116 +240,280 @@ def draw_bounding_boxes(image, refs, jdx):
     return img_draw
 
 
-def process_image_with_refs(image, ref_texts, jdx):
-    result_image = draw_bounding_boxes(image, ref_texts, jdx)
+def save_image_crops(image, blocks, jdx, output_dir=OUTPUT_PATH):
+    """The figure crops draw_bounding_boxes saves, without drawing the layout image."""
+    image_width, image_height = image.size
+    img_idx = 0
+    for block in blocks:
+        if block.label != 'image':
+            continue
+        for x1, y1, x2, y2 in to_pixels(block.boxes, image_width, image_height).tolist():
+            try:
+                image.crop((x1, y1, x2, y2)).save(f"{output_dir}/images/{jdx}_{img_idx}.jpg")
+            except Exception as e:
+                print(e)
+            img_idx += 1
+
+
+def process_image_with_refs(image, blocks, jdx, output_dir=OUTPUT_PATH):
+    result_image = draw_bounding_boxes(image, blocks, jdx, output_dir)
     return result_image
 
 
-def process_single_image(image):
-    """single image"""
-    prompt_in = prompt
-    cache_item = {
-        "prompt": prompt_in,
-        "multi_modal_data": {"image": DeepseekOCRProcessor().tokenize_with_images(images = [image], bos=True, eos=True, cropping=CROP_MODE)},
-    }
-    return cache_item
+class Document:
+    """
+    One input of a run (a PDF, or an image as a one page document) with its own page checkpoint, writer
+    and reorder buffer. Pages of all documents share the engine; a document's pages are written as they
+    finish and its output files are assembled as soon as its last page is written.
+
+    Only the pages of page_selection are rendered and converted; the others never leave the PDF.
+    """
+
+    def __init__(self, num, path, output_dir):
+        self.num = num
+        self.path = path
+        self.is_image = is_image(path)
+        if self.is_image:
+            self.page_count = 1
+        else:
+            with fitz.open(path) as pdf_document:
+                self.page_count = pdf_document.page_count
+
+        os.makedirs(f'{output_dir}/images', exist_ok=True)
+        stem = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+        # pages already done by an interrupted run with the same input and settings are not redone,
+        # and neither are documents such a run completed, as long as their output is still there;
+        # the settings are everything that changes a page's result
+        settings = PageCheckpoint.input_settings(
+            path, model=MODEL_PATH, prompt=PROMPT, mode=get_mode(), min_crops=MIN_CROPS, max_crops=MAX_CROPS,
+            preprocess_version=PREPROCESS_VERSION, sampling=sampling_settings(sampling_params, logits_processors),
+            skip_repeat=SKIP_REPEAT, skip_blank_pages=SKIP_BLANK_PAGES and skips_blank_pages(PROMPT),
+            text_layer_routing=TEXT_LAYER_ROUTING, trim_margins=TRIM_MARGINS, adaptive_dpi=ADAPTIVE_DPI,
+            extract_scan_images=EXTRACT_SCAN_IMAGES, layout_pdf=LAYOUT_PDF, pages=str(page_selection))
+        self.checkpoint = PageCheckpoint(stem + '_pages', settings, resume=RESUME)
+        if self.checkpoint.complete and not os.path.exists(stem + '.mmd'):
+            self.checkpoint = PageCheckpoint(stem + '_pages', settings, resume=False)
+        self.first_page = self.checkpoint.next_page
+        # pages are written in the order of the selection, skipping the ones left out
+        self.finished = ReorderBuffer(order=self.pages())
+        self.writer = PageWriter(stem + '.mmd', stem + '_det.mmd', stem + '_layouts.pdf', self.checkpoint,
+                                 None if self.is_image else path, output_dir, page_numbers=not page_selection.all)
+        # born-digital pages are converted from their text layer, only the rest is sent to the model
+        self.text_document = None
+
+    def pages(self):
+        """Indices of the selected pages still to do, in page order."""
+        return page_selection.pages(self.page_count, self.first_page)
+
+    def iter_pages(self, render_pool, render_mode):
+        """(page index, page image) of the pages still to do, in page order."""
+        if self.is_image:
+            if next(self.pages(), None) == 0:
+                if render_mode:
+                    yield 0, load_image(self.path, render_mode)
+                else:
+                    with Image.open(self.path) as image:
+                        page = ImageOps.exif_transpose(image).convert('RGB')
+                    yield 0, page
+            return
+        images = render_pool.iter_pages(self.path, mode=render_mode, extract_scans=EXTRACT_SCAN_IMAGES,
+                                        pages=self.pages())
+        yield from zip(self.pages(), images)
+
+    def open_text_layer(self):
+        if TEXT_LAYER_ROUTING and not self.is_image:
+            self.text_document = fitz.open(self.path)
+
+    @property
+    def done(self):
+        return self.finished.next_index is None
+
+    def close(self, *exc):
+        if self.text_document is not None:
+            self.text_document.close()
+        self.writer.__exit__(*(exc or (None, None, None)))
 
 
 if __name__ == "__main__":
 
     os.makedirs(OUTPUT_PATH, exist_ok=True)
-    os.makedirs(f'{OUTPUT_PATH}/images', exist_ok=True)
     
     print(f'{Colors.RED}PDF loading .....{Colors.RESET}')
 
-
-    images = pdf_to_images_high_quality(INPUT_PATH)
-
-
     prompt = PROMPT
 
-    # batch_inputs = []
-
-    with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:  
-        batch_inputs = list(tqdm(
-            executor.map(process_single_image, images),
-            total=len(images),
-            desc="Pre-processed images"
-        ))
-
-
-    # for image in tqdm(images):
-
-    #     prompt_in = prompt
-    #     cache_list = [
-    #         {
-    #             "prompt": prompt_in,
-    #             "multi_modal_data": {"image": DeepseekOCRProcessor().tokenize_with_images(images = [image], bos=True, eos=True, cropping=CROP_MODE)},
-    #         }
-    #     ]
-    #     batch_inputs.extend(cache_list)
-
-
-    outputs_list = llm.generate(
-        batch_inputs,
-        sampling_params=sampling_params
-    )
-
-
-    output_path = OUTPUT_PATH
-
-    os.makedirs(output_path, exist_ok=True)
-
-
-    mmd_det_path = output_path + '/' + INPUT_PATH.split('/')[-1].replace('.pdf', '_det.mmd')
-    mmd_path = output_path + '/' + INPUT_PATH.split('/')[-1].replace('pdf', 'mmd')
-    pdf_out_path = output_path + '/' + INPUT_PATH.split('/')[-1].replace('.pdf', '_layouts.pdf')
-    contents_det = ''
-    contents = ''
-    draw_images = []
-    jdx = 0
-    for output, img in zip(outputs_list, images):
-        content = output.outputs[0].text
-
-        if '<｜end▁of▁sentence｜>' in content: # repeat no eos
-            content = content.replace('<｜end▁of▁sentence｜>', '')
-        else:
-            if SKIP_REPEAT:
-                continue
-
-        
-        page_num = f'\n<--- Page Split --->'
-
-        contents_det += content + f'\n{page_num}\n'
-
-        image_draw = img.copy()
-
-        matches_ref, matches_images, mathes_other = re_match(content)
-        # print(matches_ref)
-        result_image = process_image_with_refs(image_draw, matches_ref, jdx)
-
-
-        draw_images.append(result_image)
-
-
-        for idx, a_match_image in enumerate(matches_images):
-            content = content.replace(a_match_image, f'![](images/' + str(jdx) + '_' + str(idx) + '.jpg)\n')
-
-        for idx, a_match_other in enumerate(mathes_other):
-            content = content.replace(a_match_other, '').replace('\\coloneqq', ':=').replace('\\eqqcolon', '=:').replace('\n\n\n\n', '\n\n').replace('\n\n\n', '\n\n')
-
-
-        contents += content + f'\n{page_num}\n'
-
-
-        jdx += 1
-
-    with open(mmd_det_path, 'w', encoding='utf-8') as afile:
-        afile.write(contents_det)
-
-    with open(mmd_path, 'w', encoding='utf-8') as afile:
-        afile.write(contents)
-
-
-    pil_to_pdf_img2pdf(draw_images, pdf_out_path)
-
+    store = PageTensorStore() if TENSOR_STORE_PATH else None
+    result_cache = PageResultCache() if RESULT_CACHE_PATH else None
+    cache_sampling = sampling_settings(sampling_params, logits_processors)
+    skip_blank_pages = SKIP_BLANK_PAGES and skips_blank_pages(prompt)
+
+    # a directory, glob or manifest of PDFs and images goes through one engine, pages of all documents
+    # together; every document gets its own output directory under OUTPUT_PATH
+    batch = is_batch_input(INPUT_PATH)
+    if batch:
+        input_paths = list_documents(INPUT_PATH)
+        input_output_dirs = output_dirs(input_paths, OUTPUT_PATH)
+        print(f'{Colors.GREEN}{len(input_paths)} documents{Colors.RESET}')
+    else:
+        input_paths, input_output_dirs = [INPUT_PATH], [OUTPUT_PATH]
+
+    # render -> blank filter / margin trim -> preprocess -> engine -> reorder -> write, one page at a time.
+    # live holds every page between rendering and writing, so MAX_INFLIGHT_PAGES bounds memory: no page is
+    # rendered, nor request admitted, while it is full.
+    live = {}  # (document number, page index) -> (page image, margin trim box)
+    sent = {}  # preprocessing order -> (result key, image sent to the model)
+    # (document, page index) of the pages by result key: identical pages, in one document or across a
+    # batch, are sent to the model once, also when they are further apart than MAX_INFLIGHT_PAGES
+    repeats = RepeatedPages()
+    documents = {}  # document number -> Document, until its output is written
+    stats = {'documents': 0, 'already_done': 0, 'text_layer_pages': 0, 'blank_pages': 0, 'cached_pages': 0, 'duplicate_pages': 0}
+
+    # the render pool forks first, before the preprocess pool and the render thread exist
+    with PdfRenderPool() as render_pool, PreprocessPool() as pool:
+
+        def document_pages():
+            # on the render thread: documents are opened one after another, each announced before its pages
+            # trimmed pages get the tile plan of their content box, not of the page rendering was sized for
+            render_mode = pool.mode if ADAPTIVE_DPI and not TRIM_MARGINS else None
+            for num, (path, output_dir) in enumerate(zip(input_paths, input_output_dirs)):
+                try:
+                    document = Document(num, path, output_dir)
+                except Exception as e:
+                    if not batch:
+                        raise
+                    # one unreadable file does not stop the batch
+                    print(f'{Colors.RED}{path}: {e}{Colors.RESET}')
+                    continue
+                if document.checkpoint.complete:
+                    stats['already_done'] += 1
+                    continue
+                if document.first_page:
+                    print(f'{Colors.GREEN}{path}: resuming after page {document.first_page}{Colors.RESET}')
+                selected = page_selection.count(document.page_count)
+                if selected < document.page_count:
+                    print(f'{Colors.GREEN}{path}: {selected} of {document.page_count} pages selected{Colors.RESET}')
+                yield document, None, None
+                for idx, image in document.iter_pages(render_pool, render_mode):
+                    yield document, idx, image
+
+        def close_document(document):
+            document.close()
+            del documents[document.num]
+            stats['documents'] += 1
+            stats['blank_pages'] += document.writer.blank_count
+
+        def finish(document, idx, text):
+            for page_idx, page_text in document.finished.put(idx, text):
+                img, trim_box = live.pop((document.num, page_idx))
+                document.writer.write(page_idx, img, None if page_text is None else remap_det_boxes(page_text, trim_box, img.size))
+            if document.done:
+                close_document(document)
+
+        def live_full():
+            # pages finished without the model (blank, text layer, cached) wait in live behind the pages
+            # still decoding, so rendering waits for room too, not only engine admission
+            return len(live) >= MAX_INFLIGHT_PAGES and repeats.pending
+
+        def ocr_keys():
+            num_sent = 0
+            for page in hold_back(prefetch(document_pages(), NUM_WORKERS), live_full):
+                if page is None:
+                    yield None  # the engine runs until written pages make room
+                    continue
+                document, idx, image = page
+                if image is None:
+                    documents[document.num] = document
+                    document.open_text_layer()
+                    # resumed documents may have nothing left to do
+                    if document.done:
+                        close_document(document)
+                    continue
+
+                key = (document.num, idx)
+                if skip_blank_pages and is_blank_page(image):
+                    # blank pages never reach the model
+                    live[key] = (image, None)
+                    finish(document, idx, None)
+                    continue
+
+                page_text = text_layer_markdown(document.text_document[idx]) if document.text_document is not None else None
+                if page_text is not None:
+                    live[key] = (image, None)
+                    stats['text_layer_pages'] += 1
+                    # complete by construction, not a generation cut off by the repeat guard
+                    finish(document, idx, page_text + '<｜end▁of▁sentence｜>')
+                    continue
+
+                # crop to the content before the tile grid is chosen; <|det|> boxes are mapped back when written
+                trim_box = content_box(image) if TRIM_MARGINS else None
+                live[key] = (image, trim_box)
+                ocr_image = image.crop(trim_box) if trim_box else image
+                # the cached output is in the frame of the image sent, and is mapped back per page like any other
+                digest = PageTensorStore.digest_image(ocr_image)
+                result_key = PageResultCache.make_key(digest, pool.mode, prompt, cache_sampling)
+                repeated = repeats.get(result_key)
+                if repeated is not None:
+                    stats['duplicate_pages'] += 1
+                    finish(document, idx, repeated)
+                    continue
+                cached = result_cache.get(result_key) if result_cache is not None else None
+                if cached is not None:
+                    stats['cached_pages'] += 1
+                    finish(document, idx, cached)
+                    continue
+                if not repeats.add(result_key, (document, idx)):
+                    stats['duplicate_pages'] += 1
+                    continue
+
+                sent[num_sent] = (result_key, ocr_image)
+                num_sent += 1
+                # pages already in the tensor store skip preprocessing
+                if store is not None:
+                    yield PageTensorStore.make_key(digest, pool.mode, prompt, UINT8_TRANSPORT)
+                else:
+                    yield key
+
+        def make_request(i, image_features):
+            # one request per distinct page, so the result key is a unique request id
+            result_key, _ = sent.pop(i)
+            return (result_key,
+                    {"prompt": prompt, "multi_modal_data": {"image": image_features},
+                     "mm_processor_kwargs": mm_processor_kwargs(pool.mode)})
+
+        def engine_requests():
+            features = preprocess_with_store(pool, store, ocr_keys(), lambda i: sent[i][1], lookahead=NUM_WORKERS)
+            num_requests = 0
+            for image_features in features:
+                if image_features is None:
+                    yield None
+                    continue
+                yield make_request(num_requests, image_features)
+                num_requests += 1
+
+        outputs = iter_engine_outputs(llm.llm_engine, engine_requests(), sampling_params, MAX_CONCURRENCY,
+                                      can_admit=lambda: len(live) < MAX_INFLIGHT_PAGES)
+        try:
+            for output in tqdm(outputs, desc="OCR pages"):
+                text = output.outputs[0].text
+                if result_cache is not None:
+                    result_cache.put(output.request_id, text)
+                for document, idx in repeats.done(output.request_id, text):
+                    finish(document, idx, text)
+        except BaseException as e:
+            # documents still open keep their checkpoint, and get partial outputs
+            for document in list(documents.values()):
+                document.close(type(e), e, e.__traceback__)
+            raise
+
+    if batch:
+        print(f'{Colors.GREEN}{stats["documents"]} documents written{Colors.RESET}')
+    if stats['already_done']:
+        print(f'{Colors.GREEN}{stats["already_done"]} documents already converted by an earlier run '
+              f'(RESUME = False converts them again){Colors.RESET}')
+    if stats['text_layer_pages']:
+        print(f'{Colors.GREEN}{stats["text_layer_pages"]} pages taken from the text layer{Colors.RESET}')
+    if stats['cached_pages'] or stats['duplicate_pages']:
+        print(f'{Colors.GREEN}{stats["cached_pages"]} pages from the result cache, '
+              f'{stats["duplicate_pages"]} repeated pages decoded once{Colors.RESET}')
+    if stats['blank_pages']:
+        print(f'{Colors.YELLOW}{stats["blank_pages"]} blank pages skipped{Colors.RESET}')
@@ -0,0 +1,33 @@
+"""Shared pytest configuration."""
+
+import os
+import sys
+
+import pytest
+
+# The vLLM runner modules import each other as top-level modules (``config``, ``process.*``).
+VLLM_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "DeepSeek-OCR-master", "DeepSeek-OCR-vllm")
+if VLLM_DIR not in sys.path:
+    sys.path.insert(0, VLLM_DIR)
+
+
+# word-level vocabulary covering the special tokens and the default prompts
+TINY_VOCAB = [
+    "<unk>", "<｜begin▁of▁sentence｜>", "<｜end▁of▁sentence｜>", "<｜▁pad▁｜>", "<image>",
+    "<|grounding|>", "Convert", "the", "document", "to", "markdown.", "Free", "OCR.",
+]
+
+
+@pytest.fixture(scope="session")
+def tiny_tokenizer():
+    """A small local LlamaTokenizerFast, so processor tests do not need the model download."""
+    tokenizers = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+
+    model = tokenizers.models.WordLevel({w: i for i, w in enumerate(TINY_VOCAB)}, unk_token="<unk>")
+    backend = tokenizers.Tokenizer(model)
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.WhitespaceSplit()
+    return transformers.LlamaTokenizerFast(
+        tokenizer_object=backend, bos_token="<｜begin▁of▁sentence｜>", eos_token="<｜end▁of▁sentence｜>",
+        pad_token="<｜▁pad▁｜>", unk_token="<unk>")
@@ -0,0 +1,34 @@
+"""Tests for batch input discovery."""
+
+import os
+
+from process.batch import is_batch_input, list_documents, output_dirs
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def test_batch_inputs(tmp_path):
+    """Test directories, globs and manifests list their PDFs and images; other files are ignored."""
+    for name in ("b.pdf", "a.PNG", "sub/c.pdf", "sub/d.jpeg", "notes.md", "sub/e.docx"):
+        _touch(str(tmp_path / name))
+    manifest = tmp_path / "jobs.txt"
+    manifest.write_text("sub/c.pdf\n# skipped\n\nb.pdf\nmissing.pdf\n")
+
+    assert not is_batch_input(str(tmp_path / "b.pdf"))
+    assert all(is_batch_input(str(path)) for path in (tmp_path, tmp_path / "*.pdf", manifest))
+    assert [os.path.relpath(path, tmp_path) for path in list_documents(str(tmp_path))] == \
+        ["a.PNG", "b.pdf", os.path.join("sub", "c.pdf"), os.path.join("sub", "d.jpeg")]
+    assert [os.path.relpath(path, tmp_path) for path in list_documents(str(tmp_path / "**" / "*.pdf"))] == \
+        ["b.pdf", os.path.join("sub", "c.pdf")]
+    assert [os.path.relpath(path, tmp_path) for path in list_documents(str(manifest))] == \
+        [os.path.join("sub", "c.pdf"), "b.pdf"]
+
+
+def test_output_dirs():
+    """Test every document gets its own output directory, mirroring the input tree."""
+    paths = ["/in/a.pdf", "/in/a.png", "/in/x/a.pdf", "/in/x/b.jpg"]
+    assert output_dirs(paths, "/out") == ["/out/a", "/out/a.png", "/out/x/a", "/out/x/b"]
+    assert output_dirs([], "/out") == []
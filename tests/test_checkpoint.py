@@ -0,0 +1,94 @@
+"""Tests for the per-page checkpoint of PDF runs."""
+
+import json
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from process.checkpoint import MANIFEST, PAGE_BLANK, PAGE_DROPPED, PAGE_WRITTEN, PageCheckpoint
+
+SETTINGS = {"input": "/docs/a.pdf", "size": 10, "mode": ["gundam", 1024, 640, True]}
+
+
+def _layout():
+    return Image.new("RGB", (40, 60), "white")
+
+
+def _run(directory, pages, settings=SETTINGS):
+    checkpoint = PageCheckpoint(str(directory), settings)
+    for idx in range(checkpoint.next_page, pages):
+        if idx % 3 == 1:
+            checkpoint.add(idx, PAGE_DROPPED)
+        else:
+            checkpoint.add(idx, PAGE_WRITTEN, f"page {idx}\n", f"det {idx}\n", _layout())
+    checkpoint.close()
+    return checkpoint
+
+
+def test_resume_continues_after_last_page(tmp_path):
+    """Test a reopened checkpoint resumes after its last page and assembles the same files as one run."""
+    directory = tmp_path / "doc_pages"
+    assert _run(directory, 4).next_page == 4
+
+    checkpoint = PageCheckpoint(str(directory), dict(SETTINGS, mode=("gundam", 1024, 640, True)))
+    assert checkpoint.next_page == 4
+    checkpoint.add(4, PAGE_BLANK, "blank\n", "blank\n", _layout())
+    checkpoint.assemble(str(tmp_path / "doc.mmd"), str(tmp_path / "doc_det.mmd"))
+
+    assert (tmp_path / "doc.mmd").read_text() == "page 0\npage 2\npage 3\nblank\n"
+    assert (tmp_path / "doc_det.mmd").read_text() == "det 0\ndet 2\ndet 3\nblank\n"
+    assert [os.path.basename(path) for path in checkpoint.layout_paths()] == ["0.jpg", "2.jpg", "3.jpg", "4.jpg"]
+    checkpoint.mark_complete()
+    assert os.listdir(directory) == [MANIFEST]
+
+
+def test_complete_document(tmp_path):
+    """Test a completed checkpoint is recognized as done, and is discarded when resume is off."""
+    directory = tmp_path / "doc_pages"
+    _run(directory, 3).mark_complete()
+    checkpoint = PageCheckpoint(str(directory), SETTINGS)
+    assert checkpoint.complete and checkpoint.next_page == 3
+    assert not PageCheckpoint(str(directory), SETTINGS, resume=False).complete
+
+
+def test_other_settings_start_over(tmp_path):
+    """Test a checkpoint of another input or other settings, or with resume off, is discarded."""
+    directory = tmp_path / "doc_pages"
+    _run(directory, 3)
+    assert PageCheckpoint(str(directory), dict(SETTINGS, size=11)).next_page == 0
+    assert not (directory / "0.mmd").exists()
+
+    _run(directory, 3)
+    assert PageCheckpoint(str(directory), SETTINGS, resume=False).next_page == 0
+
+
+def test_interrupted_manifest(tmp_path):
+    """Test a manifest line cut short by an interruption, and anything after it, is not trusted."""
+    directory = tmp_path / "doc_pages"
+    _run(directory, 5)
+    manifest = directory / MANIFEST
+    lines = manifest.read_text().splitlines()
+    manifest.write_text("\n".join(lines[:3] + ['{"page": 2, "sta'] + lines[4:]) + "\n")
+
+    checkpoint = _run(directory, 6)
+    assert checkpoint.pages[-1] == (5, PAGE_WRITTEN)
+    records = [json.loads(line) for line in manifest.read_text().splitlines()[1:]]
+    assert [record["page"] for record in records] == list(range(6))
+
+
+def test_selected_pages(tmp_path):
+    """Test a checkpoint of a page selection resumes after the last selected page done."""
+    directory = tmp_path / "doc_pages"
+    checkpoint = PageCheckpoint(str(directory), SETTINGS)
+    for idx in (2, 3, 9):
+        checkpoint.add(idx, PAGE_WRITTEN, f"page {idx}\n", f"det {idx}\n")
+    checkpoint.close()
+
+    checkpoint = PageCheckpoint(str(directory), SETTINGS)
+    assert checkpoint.pages == [(2, PAGE_WRITTEN), (3, PAGE_WRITTEN), (9, PAGE_WRITTEN)]
+    assert checkpoint.next_page == 10
+    checkpoint.add(12, PAGE_BLANK, "blank\n", "blank\n")
+    checkpoint.assemble(str(tmp_path / "doc.mmd"), str(tmp_path / "doc_det.mmd"))
+    assert (tmp_path / "doc.mmd").read_text() == "page 2\npage 3\npage 9\nblank\n"
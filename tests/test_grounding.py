@@ -0,0 +1,68 @@
+"""Tests for the grounding parser."""
+
+import re
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from process.grounding import parse_boxes, parse_grounding, to_markdown, to_pixels
+
+OUTPUT = ("<|ref|>title<|/ref|><|det|>[[100, 50, 900, 120]]<|/det|>\n# Title\n\n"
+          "<|ref|>image<|/ref|><|det|>[[100, 200, 500, 600], [510, 200, 900, 600]]<|/det|>\n\n\n\n"
+          "<|ref|>text<|/ref|><|det|>[[100, 650, 900, 700]]<|/det|>\nLet $x \\coloneqq 1$.\n\n\n"
+          "<|ref|>image<|/ref|><|det|>[[100, 750, 300, 950]]<|/det|>\nend")
+
+
+def _old_markdown(content, jdx):
+    # what PageWriter.write did with re_match and str.replace
+    matches = re.findall(r'(<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>)', content, re.DOTALL)
+    images = [m[0] for m in matches if '<|ref|>image<|/ref|>' in m[0]]
+    others = [m[0] for m in matches if '<|ref|>image<|/ref|>' not in m[0]]
+    for idx, match in enumerate(images):
+        content = content.replace(match, f'![](images/{jdx}_{idx}.jpg)\n')
+    for match in others:
+        content = content.replace(match, '').replace('\\coloneqq', ':=').replace('\\eqqcolon', '=:').replace('\n\n\n\n', '\n\n').replace('\n\n\n', '\n\n')
+    return content
+
+
+def test_parse_grounding():
+    """Test blocks come out in text order with their label, boxes and span."""
+    blocks = parse_grounding(OUTPUT)
+    assert [block.label for block in blocks] == ["title", "image", "text", "image"]
+    assert blocks[1].boxes.tolist() == [[100, 200, 500, 600], [510, 200, 900, 600]]
+    assert OUTPUT[blocks[0].start:blocks[0].end] == "<|ref|>title<|/ref|><|det|>[[100, 50, 900, 120]]<|/det|>"
+    assert parse_grounding("Free OCR output") == []
+
+
+def test_parse_boxes_never_evaluates():
+    """Test boxes are read as numbers only: malformed ones are skipped and code is not run."""
+    assert parse_boxes("[[1, 2, 3, 4], [5, 6]]").tolist() == [[1, 2, 3, 4]]
+    assert parse_boxes("[[0.5, 2, 3.25, 4]]").tolist() == [[0.5, 2, 3.25, 4]]
+    assert parse_boxes("__import__('os').system('true')").shape == (0, 4)
+    block, = parse_grounding("<|ref|>text<|/ref|><|det|>[[1, 2<|/det|>x")
+    assert block.boxes.shape == (0, 4)
+
+
+def test_to_pixels_matches_scalar_transform():
+    """Test the array transform truncates like int(v / 999 * size) per coordinate."""
+    boxes = np.array([[0, 0, 999, 999], [123, 456, 789, 998], [1, 998, 500, 501]], dtype=np.float64)
+    width, height = 1224, 1583
+    expected = [[int(x1 / 999 * width), int(y1 / 999 * height), int(x2 / 999 * width), int(y2 / 999 * height)]
+                for x1, y1, x2, y2 in boxes.tolist()]
+    assert to_pixels(boxes, width, height).tolist() == expected
+
+
+def test_to_markdown():
+    """Test tags are removed, image blocks become numbered links and the text is tidied."""
+    markdown = to_markdown(OUTPUT, image_link=lambda idx: f"images/7_{idx}.jpg")
+    assert markdown == "\n# Title\n\n![](images/7_0.jpg)\n\nLet $x := 1$.\n\n![](images/7_1.jpg)\n\nend"
+    assert markdown == _old_markdown(OUTPUT, 7)
+
+
+def test_to_markdown_options():
+    """Test without image links every block is dropped, and the cleanup steps can be turned off."""
+    assert "![]" not in to_markdown(OUTPUT)
+    assert to_markdown("a<center>b</center>\n\n\n\nc", replacements={"<center>": "", "</center>": ""}) == "ab\n\nc"
+    raw = to_markdown(OUTPUT, replacements={}, collapse_newlines=False)
+    assert "\\coloneqq" in raw and "\n\n\n\n" in raw
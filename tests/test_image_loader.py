@@ -0,0 +1,81 @@
+"""Tests for resolution-aware image decoding."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+import process.image_loader as image_loader
+from process.image_loader import load_image, needed_size
+from process.modes import get_mode
+from process.tile_planner import get_tile_planner
+
+
+def _crop_ratio(size, mode="gundam"):
+    mode = get_mode(mode)
+    return get_tile_planner().plan(size[0], size[1], mode.base_size, mode.image_size, mode.crop_mode).crop_ratio
+
+
+def _save(tmp_path, name, size, **kwargs):
+    path = str(tmp_path / name)
+    y, x = np.indices((size[1], size[0]))
+    pixels = np.stack([x % 256, y % 256, (x + y) % 256], axis=-1).astype(np.uint8)
+    Image.fromarray(pixels).save(path, **kwargs)
+    return path
+
+
+@pytest.mark.parametrize("name", ["scan.jpg", "scan.png"])
+@pytest.mark.parametrize("mode", ["gundam", "base", "tiny"])
+def test_scaled_decode_covers_the_plan(tmp_path, name, mode):
+    """Test large images decode smaller, but never below what the tile plan needs or onto another grid."""
+    size = (3400, 4400)
+    image = load_image(_save(tmp_path, name, size), mode)
+    need = needed_size(*size, mode)
+    assert image.mode == "RGB"
+    assert image.size[0] < size[0] and image.size[1] < size[1]
+    assert image.size[0] >= need[0] and image.size[1] >= need[1]
+    assert _crop_ratio(image.size, mode) == _crop_ratio(size, mode)
+
+
+@pytest.mark.parametrize("mode", ["tiny", "small"])
+def test_stretched_modes_cover_both_sides(tmp_path, mode):
+    """Test tiny and small, which resize to image_size x image_size, keep the short side at image_size."""
+    image_size = get_mode(mode).image_size
+    assert needed_size(2550, 3300, mode) == (image_size, -(-3300 * image_size // 2550))
+    image = load_image(_save(tmp_path, "scan.jpg", (3400, 4400)), mode)
+    assert min(image.size) >= image_size
+
+
+def test_small_image_is_not_reduced(tmp_path):
+    """Test images already below the needed size load at native resolution."""
+    image = load_image(_save(tmp_path, "small.png", (900, 700)), "gundam")
+    assert image.size == (900, 700)
+
+
+def test_exif_orientation(tmp_path):
+    """Test rotated JPEGs come back upright and are reduced against the upright tile plan."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = _save(tmp_path, "rotated.jpg", (6600, 2500), exif=exif)
+    image = load_image(path, "gundam")
+    assert image.size[1] > image.size[0]
+    assert _crop_ratio(image.size) == _crop_ratio((2500, 6600))
+    assert load_image(path, "gundam", exif_transpose=False).size[0] > image.size[0]
+
+
+def test_decode_limit(tmp_path, monkeypatch):
+    """Test images that can not be decoded small enough are rejected."""
+    path = _save(tmp_path, "scan.png", (3000, 3000))
+    monkeypatch.setattr(image_loader, "MAX_DECODE_PIXELS", 1_000_000)
+    with pytest.raises(ValueError):
+        load_image(path, "gundam")
+
+
+def test_bomb_check_stays_on(tmp_path, monkeypatch):
+    """Test load_image decodes past PIL's declared-size limit without turning the check off for others."""
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1_000_000)
+    path = _save(tmp_path, "scan.jpg", (3400, 4400))
+    assert load_image(path, "gundam").size[0] < 3400
+    assert Image.MAX_IMAGE_PIXELS == 1_000_000
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(path)
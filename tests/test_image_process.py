@@ -0,0 +1,189 @@
+"""Tests for the vLLM image preprocessing helpers."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+Image = pytest.importorskip("PIL.Image")
+
+from process.image_process import (
+    ImageTransform, dynamic_preprocess, global_view, image_to_tiles
+)
+
+
+def _random_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+@pytest.mark.parametrize("uint8_transport", [False, True])
+@pytest.mark.parametrize("size,grid", [((1200, 1700), (2, 3)), ((1700, 1200), (3, 2)), ((3000, 800), (4, 1)),
+                                       ((900, 1000), (2, 2))])
+def test_tiles_match_pil_crops(tiny_tokenizer, size, grid, uint8_transport):
+    """Test the local views of tokenize_with_images are bit-identical to per-tile PIL crops + ImageTransform."""
+    from process.image_process import DeepseekOCRProcessor
+
+    image = _random_image(*size)
+    transform = ImageTransform()
+    crops, ratio = dynamic_preprocess(image, image_size=640)
+    expected = torch.stack([transform(crop) for crop in crops], dim=0)
+
+    processor = DeepseekOCRProcessor(tokenizer=tiny_tokenizer, uint8_transport=uint8_transport)
+    _, _, images_crop, _, images_spatial_crop, _, _ = processor.tokenize_with_images(images=[image], mode="gundam")[0]
+    assert ratio == grid
+    assert images_spatial_crop.tolist() == [list(grid)]
+    tiles = images_crop[0]
+    if uint8_transport:
+        assert tiles.dtype == torch.uint8
+        tiles = transform.from_uint8(tiles)
+    assert torch.equal(tiles, expected)
+
+
+def test_image_to_tiles_row_major_order():
+    """Test tiles follow the left-to-right, top-to-bottom order of dynamic_preprocess."""
+    canvas = Image.new("RGB", (3 * 8, 2 * 8))
+    for idx in range(6):
+        x, y = (idx % 3) * 8, (idx // 3) * 8
+        canvas.paste((idx, idx, idx), (x, y, x + 8, y + 8))
+
+    tiles = image_to_tiles(canvas, image_size=8)
+    assert tiles.shape == (6, 3, 8, 8)
+    for idx in range(6):
+        assert torch.all(tiles[idx] == idx)
+
+
+def test_from_uint8_without_normalize():
+    """Test from_uint8 only rescales when normalization is disabled."""
+    image = _random_image(16, 16)
+    transform = ImageTransform(normalize=False)
+    tiles = image_to_tiles(image, image_size=16)
+    assert torch.equal(transform.from_uint8(tiles)[0], transform(image))
+
+
+def test_uint8_global_view_matches_float_transform():
+    """Test uint8 transport normalizes back to the float pixels ImageTransform produces."""
+    image = _random_image(64, 48)
+    transform = ImageTransform()
+    raw = transform.to_uint8(image)
+    assert raw.dtype == torch.uint8
+    assert raw.shape == (3, 48, 64)
+    assert torch.equal(transform.from_uint8(raw), transform(image))
+
+
+def _text_page(width, height):
+    """Black glyph-like strokes on white, the worst case for resampling differences."""
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(height // 20, height - height // 20, max(4, height // 60)):
+        for x in range(width // 20, width - width // 20, max(3, width // 120)):
+            pixels[y:y + max(2, height // 200), x:x + max(1, width // 400)] = 0
+    return Image.fromarray(pixels)
+
+
+@pytest.mark.parametrize("size", [(1200, 1700), (3000, 800), (500, 600), (1024, 1024)])
+def test_global_view_matches_imageops_pad(size):
+    """Test global_view resampling the original is bit-identical to ImageOps.pad."""
+    ImageOps = pytest.importorskip("PIL.ImageOps")
+    image = _random_image(*size)
+    expected = ImageOps.pad(image, (1024, 1024), color=(127, 127, 127))
+    assert np.array_equal(np.asarray(global_view(image, 1024, (127, 127, 127))), np.asarray(expected))
+
+
+@pytest.mark.parametrize("size, canvas_size", [((2550, 3300), (1280, 1920)), ((5100, 2100), (1920, 640))])
+def test_global_view_from_canvas_tolerance(size, canvas_size):
+    """Test the global view derived from the tile canvas stays within the documented tolerance."""
+    image = _text_page(*size)
+    direct = np.asarray(global_view(image, 1024, (127, 127, 127)), dtype=np.int16)
+    shared = np.asarray(global_view(image, 1024, (127, 127, 127), source=image.resize(canvas_size)), dtype=np.int16)
+    diff = np.abs(direct - shared)
+    assert diff.mean() < 1
+    assert diff.max() < 32
+
+
+def test_import_does_not_load_tokenizer():
+    """Test importing the preprocessing modules leaves the tokenizer unloaded."""
+    import config
+    assert config.get_tokenizer.cache_info().currsize == 0
+
+
+def test_shared_processor_is_thread_safe(tiny_tokenizer):
+    """Test one processor serves concurrent tokenize_with_images calls with serial results."""
+    from concurrent.futures import ThreadPoolExecutor
+    from process.image_process import DeepseekOCRProcessor
+
+    processor = DeepseekOCRProcessor(tokenizer=tiny_tokenizer)
+    images = [_random_image(700 + 37 * i, 900 + 53 * i, seed=i) for i in range(8)]
+    expected = [processor.tokenize_with_images(images=[image])[0] for image in images]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda image: processor.tokenize_with_images(images=[image])[0], images * 4))
+
+    for idx, result in enumerate(results):
+        reference = expected[idx % len(images)]
+        for got, want in zip(result[:5], reference[:5]):
+            assert torch.equal(got, want)
+        assert result[5:] == reference[5:]
+
+
+def test_tokenize_with_images_token_layout(tiny_tokenizer):
+    """Test the inference fast path lays out bos, prompt text and the image block as before."""
+    from process.image_process import DeepseekOCRProcessor
+    from process.tile_planner import get_tile_planner
+
+    processor = DeepseekOCRProcessor(tokenizer=tiny_tokenizer)
+    prompt = "<image>\n<|grounding|>Convert the document to markdown."
+    image = _random_image(1200, 1700)
+
+    input_ids, _, _, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes = \
+        processor.tokenize_with_images(images=[image], bos=True, eos=True, prompt=prompt)[0]
+
+    expected_tokens = get_tile_planner().num_image_tokens(1200, 1700, 1024, 640, True)
+    text_ids = tiny_tokenizer.encode(prompt.split("<image>")[1], add_special_tokens=False)
+    assert num_image_tokens == [expected_tokens]
+    assert image_shapes == [(1200, 1700)]
+    assert images_spatial_crop.tolist() == [[2, 3]]
+    assert input_ids.shape == (1, 1 + expected_tokens + len(text_ids))
+    assert input_ids[0, 0] == processor.bos_id
+    assert torch.all(input_ids[0, 1:1 + expected_tokens] == processor.image_token_id)
+    assert input_ids[0, 1 + expected_tokens:].tolist() == text_ids
+    assert images_seq_mask.dtype == torch.bool
+    assert images_seq_mask.sum() == expected_tokens
+    assert torch.equal(images_seq_mask, input_ids[0] == processor.image_token_id)
+
+    # the prompt pieces and the image block are reused on the next page
+    processor.tokenize_with_images(images=[image], bos=True, eos=True, prompt=prompt)
+    assert list(processor._prompt_cache) == [prompt]
+    assert list(processor._image_block_cache) == [((2, 3), 1024, 640)]
+
+
+def test_iter_image_inputs_mixed_mode_batch(tiny_tokenizer):
+    """Test a batch mixing modes is read per image, whether stacked or passed as a list."""
+    from process.image_process import DeepseekOCRProcessor, iter_image_inputs
+
+    processor = DeepseekOCRProcessor(tokenizer=tiny_tokenizer)
+    requests = [processor.tokenize_with_images(images=[_random_image(1200, 1700, seed=i)], mode=mode)[0]
+                for i, mode in enumerate(["gundam", "tiny", "base"])]
+    requests.append(processor.tokenize_with_images(images=[], prompt="Free OCR.")[0])
+    pixel_values, images_crop, images_spatial_crop = ([request[i] for request in requests] for i in (1, 2, 4))
+
+    images = list(iter_image_inputs(pixel_values, images_crop, images_spatial_crop))
+    assert [tuple(image_ori.shape) for image_ori, _, _ in images] == [(1, 3, 1024, 1024), (1, 3, 512, 512),
+                                                                      (1, 3, 1024, 1024)]
+    assert [crop_shape for _, _, crop_shape in images] == [(2, 3), (1, 1), (1, 1)]
+    assert images[0][1].shape == (6, 3, 640, 640)
+
+    stacked = list(iter_image_inputs(*(torch.stack([field[2], field[2]]) for field in
+                                       (pixel_values, images_crop, images_spatial_crop))))
+    assert [crop_shape for _, _, crop_shape in stacked] == [(1, 1), (1, 1)]
+    assert torch.equal(stacked[1][0], pixel_values[2])
+
+
+def test_black_page_keeps_its_tiles(tiny_tokenizer):
+    """Test an all-black cropped page sums to zero in uint8 but still reports its tile grid."""
+    from process.image_process import DeepseekOCRProcessor, iter_image_inputs
+
+    processor = DeepseekOCRProcessor(tokenizer=tiny_tokenizer, uint8_transport=True)
+    request = processor.tokenize_with_images(images=[Image.new("RGB", (1200, 1700))], mode="gundam")[0]
+    (_, patches, crop_shape), = iter_image_inputs([request[1]], [request[2]], [request[4]])
+    assert torch.sum(patches).item() == 0
+    assert crop_shape == (2, 3)
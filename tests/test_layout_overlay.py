@@ -0,0 +1,58 @@
+"""Tests for the vector layouts PDF."""
+
+import io
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from process.layout_overlay import draw_layout, write_layout_pdf
+
+
+def _ink_box(page):
+    pixmap = page.get_pixmap(alpha=False)
+    pixels = np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width, 3).min(axis=2)
+    ys, xs = np.nonzero(pixels < 250)
+    return xs.min(), ys.min(), xs.max(), ys.max()
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_boxes_land_on_the_rendered_page(rotation):
+    """Test boxes in 0-999 coordinates of the rendered page are drawn there, on rotated pages too."""
+    doc = fitz.open()
+    page = doc.new_page(width=400, height=300)
+    page.set_rotation(rotation)
+    draw_layout(page, [("text", [[250, 500, 750, 900]])])
+    width, height = page.rect.width, page.rect.height
+    x0, y0, x1, y1 = _ink_box(page)
+    # the label sits on top of the box
+    assert abs(x0 - 0.25 * width) <= 2 and abs(x1 - 0.75 * width) <= 2
+    assert abs(y1 - 0.9 * height) <= 2 and 0.5 * height - 12 <= y0 < 0.5 * height
+    words = page.get_text("words")
+    assert [word[4] for word in words] == ["text"]
+
+
+def test_copy_of_source(tmp_path):
+    """Test the layouts PDF keeps the source pages as they are, minus the ones left out, with boxes over them."""
+    source = fitz.open()
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 400), (200, 180, 160)).save(buffer, "JPEG")
+    for page_num in range(3):
+        page = source.new_page(width=300, height=400)
+        page.insert_image(page.rect, stream=buffer.getvalue())
+        page.insert_text((20, 40), f"source page {page_num}")
+    source_path, out_path = str(tmp_path / "in.pdf"), str(tmp_path / "layouts.pdf")
+    source.save(source_path)
+
+    write_layout_pdf(source_path, out_path, [(0, [("title", [[0, 0, 500, 100]])]), (2, [])])
+    layouts = fitz.open(out_path)
+    assert layouts.page_count == 2
+    assert "source page 0" in layouts[0].get_text() and "source page 2" in layouts[1].get_text()
+    # pages are labelled with their numbers in the source
+    assert [page.get_label() for page in layouts] == ["1", "3"]
+    assert len(layouts[0].get_drawings()) == 2 and not layouts[1].get_drawings()
+    # the scan is carried over as it is, not decoded and encoded again
+    xref = layouts[0].get_images()[0][0]
+    assert layouts.xref_stream_raw(xref) == buffer.getvalue()
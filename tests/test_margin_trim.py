@@ -0,0 +1,78 @@
+"""Tests for content-aware margin trimming."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from process.margin_trim import content_box, remap_det_boxes
+from process.tile_planner import get_tile_planner
+
+
+def _page(block, size=(1224, 1584)):
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    x0, y0, x1, y1 = block
+    for y in range(y0, y1, 30):
+        draw.rectangle([x0, y, x1, min(y + 14, y1)], fill="black")
+    return page
+
+
+def test_content_box_encloses_content():
+    """Test the padded box covers the text block and the unpadded one hugs it."""
+    block = (300, 280, 920, 895)
+    x0, y0, x1, y1 = content_box(_page(block))
+    assert x0 <= block[0] and y0 <= block[1] and x1 >= block[2] and y1 >= block[3]
+    # without padding the box is accurate to about one thumbnail pixel
+    x0, y0, x1, y1 = content_box(_page(block), padding=0.0)
+    assert all(abs(a - b) <= 8 for a, b in zip((x0, y0, x1, y1), block))
+
+
+def test_trimming_reduces_tiles():
+    """Test a page with wide margins ends up on a smaller tile grid."""
+    page = _page((300, 280, 920, 900))
+    x0, y0, x1, y1 = content_box(page)
+    planner = get_tile_planner()
+    full = planner.plan(*page.size, 1024, 640, True)
+    trimmed = planner.plan(x1 - x0, y1 - y0, 1024, 640, True)
+    assert trimmed.num_tiles < full.num_tiles
+    assert trimmed.num_image_tokens < full.num_image_tokens
+
+
+@pytest.mark.parametrize("page", [
+    Image.new("RGB", (1224, 1584), "white"),
+    _page((0, 0, 1224, 1584)),
+])
+def test_no_trim(page):
+    """Test blank and full-bleed pages are left alone."""
+    assert content_box(page) is None
+
+
+def test_content_in_border_is_not_cut():
+    """Test content running into the page edge keeps the edge."""
+    x0, y0, x1, y1 = content_box(_page((0, 400, 800, 900)), padding=0.0)
+    assert x0 == 0
+    assert x1 < 1224
+
+
+def test_dust_is_ignored():
+    """Test isolated specks do not stretch the content box."""
+    page = _page((300, 280, 920, 900))
+    draw = ImageDraw.Draw(page)
+    for x, y in [(120, 120), (1100, 1400), (150, 1450)]:
+        draw.point((x, y), fill="black")
+    x0, y0, x1, y1 = content_box(page, padding=0.0)
+    assert x0 > 250 and y1 < 950
+
+
+def test_remap_det_boxes():
+    """Test crop-relative boxes land on the same pixels of the full page."""
+    page_size, box = (1000, 2000), (200, 400, 700, 1400)
+    text = ("<|ref|>title<|/ref|><|det|>[[0, 0, 999, 999]]<|/det|>\n# Title\n"
+            "<|ref|>text<|/ref|><|det|>[[100, 200, 300, 400], [0, 999, 999, 999]]<|/det|>")
+    out = remap_det_boxes(text, box, page_size)
+    assert "<|det|>[[200, 200, 699, 699]]<|/det|>" in out
+    assert "[[250, 300, 350, 400], [200, 699, 699, 699]]" in out
+    assert "# Title" in out
+    assert remap_det_boxes(text, None, page_size) == text
@@ -0,0 +1,31 @@
+"""Tests for per-request resolution modes."""
+
+import pytest
+
+from process.modes import DEFAULT_MODE, RESOLUTION_MODES, ResolutionMode, get_mode, mm_processor_kwargs
+from process.tile_planner import get_tile_planner
+
+
+def test_get_mode_resolution():
+    """Test names, mode objects and None resolve to a ResolutionMode."""
+    assert get_mode() is DEFAULT_MODE
+    assert get_mode("Tiny") == ResolutionMode("tiny", 512, 512, False)
+    assert get_mode(RESOLUTION_MODES["large"]) is RESOLUTION_MODES["large"]
+    assert get_mode(DEFAULT_MODE.name) is DEFAULT_MODE
+    assert mm_processor_kwargs("gundam") == {"mode": "gundam"}
+
+
+def test_unknown_mode():
+    """Test unknown mode names are rejected."""
+    with pytest.raises(ValueError):
+        get_mode("huge")
+
+
+@pytest.mark.parametrize("name,expected", [
+    ("tiny", 73), ("small", 111), ("base", 273), ("large", 421), ("gundam", 903),
+])
+def test_vision_tokens_follow_mode(name, expected):
+    """Test the vision-token count of a letter page follows the request's mode."""
+    mode = get_mode(name)
+    tokens = get_tile_planner().num_image_tokens(1200, 1700, mode.base_size, mode.image_size, mode.crop_mode)
+    assert tokens == expected
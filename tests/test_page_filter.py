@@ -0,0 +1,60 @@
+"""Tests for blank page detection."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from process.page_filter import ink_ratio, is_blank_page, skips_blank_pages
+
+
+def _scan(color=238, size=(1224, 1584), seed=0):
+    """An empty scanned sheet: paper grain plus a dark scanner edge."""
+    rng = np.random.default_rng(seed)
+    pixels = np.clip(rng.normal(color, 6, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+    pixels[:, :20] = 0
+    return Image.fromarray(pixels)
+
+
+def _text_page(lines=40, size=(1224, 1584)):
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    for i in range(lines):
+        draw.rectangle([100, 100 + i * 34, 1100, 118 + i * 34], fill="black")
+    return page
+
+
+@pytest.mark.parametrize("page", [
+    Image.new("RGB", (1224, 1584), "white"),
+    Image.new("L", (800, 1000), 0),
+    _scan(),
+    _scan(color=200, seed=1),
+])
+def test_blank_pages(page):
+    """Test empty, dark and noisy scanned sheets are blank."""
+    assert is_blank_page(page)
+
+
+@pytest.mark.parametrize("lines", [1, 40])
+def test_pages_with_content(lines):
+    """Test a page with even a single line of content is kept."""
+    assert not is_blank_page(_text_page(lines))
+
+
+def test_ink_ratio_grows_with_content():
+    """Test the ink ratio follows the amount of content."""
+    assert ink_ratio(_text_page(1)) < ink_ratio(_text_page(10)) < ink_ratio(_text_page(40))
+
+
+@pytest.mark.parametrize("prompt,skips", [
+    ("<image>\n<|grounding|>Convert the document to markdown.", True),
+    ("<image>\n<|grounding|>OCR this image.", True),
+    ("<image>\nFree OCR.", True),
+    ("<image>\nDescribe this image in detail.", False),
+    ("<image>\nLocate <|ref|>the signature<|/ref|> in the image.", False),
+    ("Convert the document to markdown.", False),
+])
+def test_skips_blank_pages(prompt, skips):
+    """Test only the prompts that read a page's text leave blank pages out."""
+    assert skips_blank_pages(prompt) == skips
@@ -0,0 +1,67 @@
+"""Tests for page selections of PDF runs."""
+
+import pytest
+
+from process.page_selection import PageSelection
+
+
+def _pages(spec, page_count):
+    return list(PageSelection.parse(spec).pages(page_count))
+
+
+@pytest.mark.parametrize("spec", [None, "", "  ", "all"])
+def test_empty_selects_every_page(spec):
+    """Test an empty spec selects every page."""
+    selection = PageSelection.parse(spec)
+    assert selection.all and str(selection) == ""
+    assert _pages(spec, 4) == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("spec, page_count, expected", [
+    ("3", 5, [2]),
+    ("1-3, 5", 9, [0, 1, 2, 4]),
+    ("8-", 10, [7, 8, 9]),
+    ("first 2", 10, [0, 1]),
+    ("last:3", 10, [7, 8, 9]),
+    ("LAST 2,1", 10, [0, 8, 9]),
+    ("5,1-6,first 3", 10, [0, 1, 2, 3, 4, 5]),  # overlaps are merged, every page once and in order
+    ("4-20, 30", 6, [3, 4, 5]),  # pages past the end are ignored
+    ("first 20", 3, [0, 1, 2]),
+    ("last 20", 3, [0, 1, 2]),
+    ("7", 3, []),
+])
+def test_pages(spec, page_count, expected):
+    """Test specs resolve to the sorted 0-based pages of a document of a given length."""
+    assert _pages(spec, page_count) == expected
+    assert PageSelection.parse(spec).count(page_count) == len(expected)
+
+
+def test_pages_from_start():
+    """Test pages() can carry on from part way, as a resumed run does."""
+    selection = PageSelection.parse("2-4, 8-9")
+    assert list(selection.pages(10, start=3)) == [3, 7, 8]
+    assert list(selection.pages(10, start=5)) == [7, 8]
+    assert list(selection.pages(10, start=10)) == []
+
+
+def test_large_ranges_stay_lazy():
+    """Test a huge range is kept as a range, not a list of its pages."""
+    selection = PageSelection.parse("1-100000000")
+    assert selection.ranges(10 ** 9) == [range(0, 100000000)]
+    assert selection.count(10 ** 9) == 100000000
+    pages = selection.pages(10 ** 9, start=99999998)
+    assert list(pages) == [99999998, 99999999]
+
+
+def test_str_round_trips():
+    """Test str() gives a canonical spec that parses back to the same selection."""
+    selection = PageSelection.parse(" 1 - 3 ,7,  10-, First:2,last 4 ")
+    assert str(selection) == "1-3,7,10-,first 2,last 4"
+    assert PageSelection.parse(str(selection)).parts == selection.parts
+
+
+@pytest.mark.parametrize("spec", ["0", "3-1", "a-b", "1,,2", "-4", "first", "1-2-3", "middle 2"])
+def test_invalid(spec):
+    """Test malformed specs are rejected instead of silently converting every page."""
+    with pytest.raises(ValueError):
+        PageSelection.parse(spec)
@@ -0,0 +1,254 @@
+"""Tests for PDF page rasterization."""
+
+import io
+import math
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from process.image_loader import reduction_factor, view_scale
+from process.modes import get_mode
+from process.pdf_render import PdfRenderPool, _pixmap_size, iter_pdf_pages, pixmap_to_image, render_zoom, scan_image
+from process.tile_planner import get_tile_planner
+
+
+def _png_roundtrip(pixmap):
+    return Image.open(io.BytesIO(pixmap.tobytes("png")))
+
+
+def _page():
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=120)
+    page.insert_text((20, 40), "Hello pixmap", fontsize=14)
+    page.draw_rect(fitz.Rect(20, 60, 120, 100), color=(0, 0, 1), fill=(1, 0.5, 0))
+    return doc, page
+
+
+@pytest.mark.parametrize("colorspace", ["rgb", "gray"])
+def test_matches_png_roundtrip(colorspace):
+    """Test opaque pixmaps decode to the same pixels as the PNG round trip."""
+    doc, page = _page()
+    pixmap = page.get_pixmap(matrix=fitz.Matrix(2, 2), colorspace=getattr(fitz, "cs" + colorspace.upper()), alpha=False)
+    image = pixmap_to_image(pixmap)
+    expected = _png_roundtrip(pixmap)
+    del pixmap
+    assert image.mode == expected.mode
+    assert np.array_equal(np.asarray(image), np.asarray(expected))
+    doc.close()
+
+
+def test_cmyk_is_converted():
+    """Test CMYK pixmaps come back as RGB."""
+    doc, page = _page()
+    pixmap = page.get_pixmap(colorspace=fitz.csCMYK, alpha=False)
+    image = pixmap_to_image(pixmap)
+    assert image.mode == "RGB"
+    assert image.getpixel((5, 5)) == (255, 255, 255)
+    doc.close()
+
+
+def test_alpha():
+    """Test transparent pixmaps keep straight alpha for PNG and are flattened onto white otherwise."""
+    doc = fitz.open()
+    page = doc.new_page(width=60, height=40)
+    page.draw_rect(fitz.Rect(10, 10, 50, 30), color=None, fill=(1, 0.5, 0), fill_opacity=0.5)
+    pixmap = page.get_pixmap(alpha=True)
+
+    image = pixmap_to_image(pixmap)
+    expected = _png_roundtrip(pixmap)
+    assert image.mode == "RGBA"
+    assert np.array_equal(np.asarray(image), np.asarray(expected))
+
+    flat = pixmap_to_image(pixmap, image_format="JPEG")
+    assert flat.mode == "RGB"
+    assert flat.getpixel((0, 0)) == (255, 255, 255)
+    assert np.abs(np.subtract(flat.getpixel((20, 20)), (255, 191, 128))).max() <= 1
+    doc.close()
+
+
+def test_iter_pdf_pages(tmp_path):
+    """Test every page is rendered, in order, at the requested resolution."""
+    doc = fitz.open()
+    for width in (100, 200, 300):
+        doc.new_page(width=width, height=144)
+    path = str(tmp_path / "doc.pdf")
+    doc.save(path)
+    doc.close()
+    assert [image.size for image in iter_pdf_pages(path, dpi=144)] == [(200, 288), (400, 288), (600, 288)]
+
+
+def _numbered_pdf(tmp_path, num_pages):
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        # page width encodes the page number, so order is visible in the rendered sizes
+        page = doc.new_page(width=100 + page_num, height=72)
+        page.insert_text((10, 40), str(page_num), fontsize=12)
+    path = str(tmp_path / "numbered.pdf")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_render_pool_matches_serial(tmp_path, num_workers):
+    """Test the render pool yields every page in order, with the same pixels as serial rendering."""
+    path = _numbered_pdf(tmp_path, 11)
+    expected = list(iter_pdf_pages(path, dpi=72))
+    with PdfRenderPool(num_workers=num_workers, pages_per_task=2) as pool:
+        images = list(pool.iter_pages(path, dpi=72))
+    assert [image.size for image in images] == [(100 + i, 72) for i in range(11)]
+    assert all(np.array_equal(np.asarray(a), np.asarray(b)) for a, b in zip(images, expected))
+
+
+def test_render_pool_early_exit(tmp_path):
+    """Test abandoning iter_pages part way leaves the pool usable."""
+    path = _numbered_pdf(tmp_path, 20)
+    with PdfRenderPool(num_workers=2, pages_per_task=1) as pool:
+        pages = pool.iter_pages(path, dpi=72)
+        assert next(pages).size == (100, 72)
+        pages.close()
+        assert len(list(pool.iter_pages(path, dpi=72))) == 20
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_render_selected_pages(tmp_path, num_workers):
+    """Test only the pages asked for are rendered, in their order, as for a page selection or a resumed run."""
+    path = _numbered_pdf(tmp_path, 9)
+    with PdfRenderPool(num_workers=num_workers, pages_per_task=2) as pool:
+        images = list(pool.iter_pages(path, dpi=72, pages=iter([0, 5, 6, 8])))
+        assert [image.size for image in images] == [(100, 72), (105, 72), (106, 72), (108, 72)]
+        assert list(pool.iter_pages(path, dpi=72, pages=range(0))) == []
+
+
+def _crop_ratio(size, mode):
+    mode = get_mode(mode)
+    return get_tile_planner().plan(size[0], size[1], mode.base_size, mode.image_size, mode.crop_mode).crop_ratio
+
+
+PAGE_SIZES = [(252, 144), (298, 420), (612, 792), (595, 842), (842, 1191), (2384, 3370), (1600, 400)]
+
+
+@pytest.mark.parametrize("mode", ["gundam", "base", "tiny"])
+@pytest.mark.parametrize("page_size", PAGE_SIZES)
+def test_render_zoom_keeps_the_grid_and_covers_the_views(page_size, mode):
+    """Test pages render on the grid they get at 144 dpi, at a size that covers the views of that plan."""
+    page_rect = fitz.Rect(0, 0, *page_size)
+    size = _pixmap_size(page_rect, render_zoom(page_rect, mode))
+    assert _crop_ratio(size, mode) == _crop_ratio(_pixmap_size(page_rect, 2), mode)
+    if _crop_ratio(size, mode) != (1, 1) or not get_mode(mode).crop_mode:
+        assert view_scale(*size, mode) <= 1.0
+        # and not much more than that
+        assert view_scale(*size, mode) > 0.99
+
+
+def test_render_zoom_tiny_letter_page():
+    """Test a letter page in tiny mode renders with its short side at the 512 pixels the mode resizes to."""
+    size = _pixmap_size(fitz.Rect(0, 0, 612, 792), render_zoom(fitz.Rect(0, 0, 612, 792), "tiny"))
+    assert 512 <= min(size) <= 513
+
+
+def test_adaptive_render(tmp_path):
+    """Test iter_pdf_pages with a mode renders posters smaller and small pages larger than 144 dpi."""
+    doc = fitz.open()
+    doc.new_page(width=2384, height=3370)
+    doc.new_page(width=298, height=420)
+    path = str(tmp_path / "sizes.pdf")
+    doc.save(path)
+    doc.close()
+    fixed = [image.size for image in iter_pdf_pages(path)]
+    adaptive = [image.size for image in iter_pdf_pages(path, mode="gundam")]
+    assert adaptive[0][1] < fixed[0][1] / 3
+    assert adaptive[1][1] > fixed[1][1]
+    with PdfRenderPool(num_workers=2) as pool:
+        assert [image.size for image in pool.iter_pages(path, mode="gundam")] == adaptive
+
+
+def _scan_bytes(fmt, size=(1275, 1650)):
+    y, x = np.indices(size[::-1])
+    pixels = np.where((y // 40) % 2 == 0, 230, 30).astype(np.uint8)
+    pixels[:, : size[0] // 10] = 128 + (x[:, : size[0] // 10] % 64)
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        Image.fromarray(np.stack([pixels] * 3, axis=-1)).save(buffer, "JPEG", quality=95)
+    else:
+        Image.fromarray(pixels > 128).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _scan_page(doc, fmt="JPEG", **kwargs):
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(page.rect, stream=_scan_bytes(fmt), **kwargs)
+    return page
+
+
+def test_scan_image_matches_rendering():
+    """Test the image of a scanned page comes from its JPEG stream and looks like the rendered page."""
+    doc = fitz.open()
+    page = _scan_page(doc)
+    image = scan_image(page)
+    assert image.mode == "RGB" and image.size == (1275, 1650)
+    rendered = pixmap_to_image(page.get_pixmap(matrix=fitz.Matrix(1275 / 612, 1650 / 792), alpha=False))
+    assert rendered.size == image.size
+    diff = np.abs(np.asarray(image, dtype=int) - np.asarray(rendered, dtype=int))
+    assert diff.mean() < 4
+
+
+def test_scan_image_decodes_at_reduced_scale():
+    """Test scans the tile plan needs smaller are decoded at a reduced JPEG scale, non-JPEG scans are rendered."""
+    doc = fitz.open()
+    page = _scan_page(doc)
+    assert scan_image(page, mode="gundam").size == (1275, 1650)
+    factor = reduction_factor(1275, 1650, "tiny")
+    assert factor > 1
+    assert scan_image(page, mode="tiny").size == (math.ceil(1275 / factor), math.ceil(1650 / factor))
+    assert scan_image(_scan_page(doc, "PNG")) is None
+
+
+def test_scan_image_falls_back():
+    """Test rotated, partial, cut off, stretched or overlaid scan pages are rendered instead."""
+    doc = fitz.open()
+    assert scan_image(_scan_page(doc, rotate=90)) is None
+    assert scan_image(_scan_page(doc).set_rotation(90) or doc[-1]) is None
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(fitz.Rect(0, 0, 612, 400), stream=_scan_bytes("JPEG"))
+    assert scan_image(page) is None
+    page = _scan_page(doc)
+    page.insert_text((50, 50), "stamped", fontsize=12)
+    assert scan_image(page) is None
+    page = _scan_page(doc)
+    page.add_text_annot((100, 100), "note")
+    assert scan_image(page) is None
+    # an image running off the page (or its CropBox) shows only in part
+    page = doc.new_page(width=400, height=600)
+    page.insert_image(fitz.Rect(0, 0, 800, 600), stream=_scan_bytes("JPEG", (800, 600)))
+    assert scan_image(page) is None
+    page = _scan_page(doc)
+    page.set_cropbox(fitz.Rect(0, 0, 612, 500))
+    assert scan_image(page) is None
+    # a scan stretched to the page has other proportions than its pixels
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(page.rect, stream=_scan_bytes("JPEG", (1700, 1100)), keep_proportion=False)
+    assert scan_image(page) is None
+    # an invisible OCR layer is fine
+    page = _scan_page(doc)
+    page.insert_text((50, 50), "recognized text", fontsize=12, render_mode=3)
+    assert scan_image(page) is not None
+
+
+def test_render_pool_extracts_scans(tmp_path):
+    """Test the render pool returns the same scan images as the serial path."""
+    doc = fitz.open()
+    _scan_page(doc)
+    doc.new_page(width=612, height=792).insert_text((50, 50), "born digital", fontsize=12)
+    _scan_page(doc)
+    path = str(tmp_path / "scans.pdf")
+    doc.save(path)
+    doc.close()
+    serial = list(iter_pdf_pages(path, extract_scans=True))
+    with PdfRenderPool(num_workers=2) as pool:
+        pooled = list(pool.iter_pages(path, extract_scans=True))
+    assert [image.size for image in serial] == [(1275, 1650), (1224, 1584), (1275, 1650)]
+    assert all(np.array_equal(np.asarray(a), np.asarray(b)) for a, b in zip(serial, pooled))
@@ -0,0 +1,87 @@
+"""Tests for the PDF text-layer fast path."""
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from process.pdf_text import page_markdown, text_layer_markdown, text_layer_profile, use_text_layer
+
+BODY = "Born-digital documents carry their text, so there is no need to recognize it from pixels. " * 6
+
+
+def _page(doc=None):
+    doc = doc or fitz.open()
+    page = doc.new_page(width=595, height=842)
+    return doc, page
+
+
+def _ruled_table(page, x0, y0, rows, cols, cell=(120, 20)):
+    for row in range(rows):
+        for col in range(cols):
+            page.insert_text((x0 + col * cell[0] + 4, y0 + row * cell[1] + 14), f"r{row}c{col}", fontsize=10)
+    for row in range(rows + 1):
+        page.draw_line((x0, y0 + row * cell[1]), (x0 + cols * cell[0], y0 + row * cell[1]))
+    for col in range(cols + 1):
+        page.draw_line((x0 + col * cell[0], y0), (x0 + col * cell[0], y0 + rows * cell[1]))
+
+
+def test_born_digital_page():
+    """Test a text page is taken from its text layer, as grounded markdown in reading order."""
+    doc, page = _page()
+    page.insert_text((50, 60), "Quarterly report", fontsize=24)
+    page.insert_textbox(fitz.Rect(50, 90, 545, 300), BODY, fontsize=11)
+    _ruled_table(page, 50, 320, rows=3, cols=2)
+
+    text = text_layer_markdown(page)
+    assert text is not None
+    parts = text.split("\n\n")
+    assert parts[0].startswith("<|ref|>title<|/ref|><|det|>[[") and parts[0].endswith("\n# Quarterly report")
+    assert parts[1].startswith("<|ref|>text<|/ref|>") and "Born-digital documents" in parts[1]
+    assert "<|ref|>table<|/ref|>" in parts[2]
+    assert "<table><tr><td>r0c0</td><td>r0c1</td></tr>" in parts[2]
+    # table cells are not repeated as text blocks
+    assert text.count("r1c1") == 1
+
+
+def test_two_columns_read_left_first():
+    """Test side by side columns are read left column first."""
+    doc, page = _page()
+    page.insert_textbox(fitz.Rect(50, 100, 280, 700), "Left column. " * 40, fontsize=10)
+    page.insert_textbox(fitz.Rect(315, 50, 545, 700), "Right column. " * 40, fontsize=10)
+    text = page_markdown(page)
+    assert text.index("Left column") < text.index("Right column")
+
+
+def test_scanned_page_goes_to_ocr():
+    """Test pages covered by an image, with or without an invisible OCR layer, are sent to the model."""
+    doc, page = _page()
+    page.insert_image(page.rect, pixmap=fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 60, 80), 0))
+    assert text_layer_markdown(page) is None
+
+    page.insert_textbox(fitz.Rect(50, 50, 545, 700), BODY, fontsize=11, render_mode=3)
+    profile = text_layer_profile(page)
+    assert profile.chars == 0 and profile.invisible_chars > 0
+    assert text_layer_markdown(page) is None
+
+
+def test_small_figure_stays_on_text_layer():
+    """Test a page with text and a small figure keeps the text layer and marks the figure as an image."""
+    doc, page = _page()
+    page.insert_textbox(fitz.Rect(50, 50, 545, 400), BODY * 2, fontsize=11)
+    page.insert_image(fitz.Rect(50, 450, 250, 600), pixmap=fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 40, 30), 0))
+    text = text_layer_markdown(page)
+    assert text is not None
+    assert text.count("<|ref|>image<|/ref|>") == 1
+
+
+def test_profile_rules():
+    """Test too little text, broken unicode and math fonts all send a page to the model."""
+    doc, page = _page()
+    page.insert_text((50, 60), "Short", fontsize=11)
+    assert not use_text_layer(text_layer_profile(page))
+
+    profile = text_layer_profile(doc.new_page())._replace(chars=1000)
+    assert use_text_layer(profile)
+    assert not use_text_layer(profile._replace(bad_chars=100))
+    assert not use_text_layer(profile._replace(math_chars=100))
+    assert not use_text_layer(profile._replace(graphics_area=0.9))
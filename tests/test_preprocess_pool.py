@@ -0,0 +1,33 @@
+"""Tests for the shared-memory tensor handoff of the preprocessing pool."""
+
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from process.preprocess_pool import SHM_DIR, release_shared, tensor_from_shared, tensor_to_shared
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(SHM_DIR), reason="needs posix shared memory")
+
+
+@pytest.mark.parametrize("tensor", [
+    torch.randn(1, 3, 16, 16),
+    torch.randint(0, 256, (1, 6, 3, 8, 8), dtype=torch.uint8),
+    torch.zeros((1, 1, 3, 4, 4)),
+])
+def test_shared_tensor_roundtrip(tensor):
+    """Test a tensor survives the shared-memory handoff and its block is unlinked."""
+    handle = tensor_to_shared(tensor)
+    restored = tensor_from_shared(handle)
+    assert restored.dtype == tensor.dtype
+    assert torch.equal(restored, tensor)
+    assert not os.path.exists(os.path.join(SHM_DIR, handle.name.lstrip('/')))
+
+
+def test_release_shared():
+    """Test uncollected blocks can be released."""
+    handle = tensor_to_shared(torch.ones(4))
+    release_shared(handle)
+    release_shared(handle)
+    assert not os.path.exists(os.path.join(SHM_DIR, handle.name.lstrip('/')))
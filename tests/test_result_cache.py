@@ -0,0 +1,89 @@
+"""Tests for the on-disk cache of model output per page."""
+
+import os
+import time
+
+from process.modes import get_mode
+from process.result_cache import PageResultCache, RepeatedPages, sampling_settings
+
+OUTPUT = "<|ref|>title<|/ref|><|det|>[[10, 20, 980, 90]]<|/det|>\n# Terms and conditions\n"
+SAMPLING = {"temperature": 0.0, "max_tokens": 8192}
+
+
+def _key(digest="ab" * 32, mode="gundam", prompt="<image>\nFree OCR.", sampling=SAMPLING):
+    return PageResultCache.make_key(digest, get_mode(mode), prompt, sampling)
+
+
+def test_roundtrip(tmp_path):
+    """Test a cached output reads back unchanged, also from a fresh instance on the same directory."""
+    cache = PageResultCache(str(tmp_path))
+    key = _key()
+    assert cache.get(key) is None
+    cache.put(key, OUTPUT)
+    assert cache.get(key) == OUTPUT
+    reopened = PageResultCache(str(tmp_path))
+    assert key in reopened and reopened.get(key) == OUTPUT
+
+
+def test_key_depends_on_settings():
+    """Test the key changes with the page, mode, prompt, sampling, logits processors, crop bounds and version."""
+    key = _key()
+    assert key == _key()
+    assert key != _key(digest="cd" * 32)
+    assert key != _key(mode="base")
+    assert key != _key(prompt="<image>\n<|grounding|>Convert the document to markdown.")
+    assert key != _key(sampling=dict(SAMPLING, max_tokens=4096))
+    assert key != PageResultCache.make_key("ab" * 32, get_mode("gundam"), "<image>\nFree OCR.", SAMPLING, max_crops=9)
+    assert key != PageResultCache.make_key("ab" * 32, get_mode("gundam"), "<image>\nFree OCR.", SAMPLING,
+                                           preprocess_version=0)
+
+    class NoRepeatNGram:
+        def __init__(self, window_size):
+            self.ngram_size, self.window_size, self.whitelist_token_ids = 20, window_size, {128822, 128821}
+
+    def settings(window_size):
+        return sampling_settings(None, [NoRepeatNGram(window_size)])
+
+    assert _key(sampling=settings(50)) == _key(sampling=settings(50))
+    assert _key(sampling=settings(50)) != _key(sampling=settings(90))
+
+
+def test_version_bump_drops_entries(tmp_path):
+    """Test opening the cache with another version removes the old entries."""
+    PageResultCache(str(tmp_path), version=1).put(_key(), OUTPUT)
+    cache = PageResultCache(str(tmp_path), version=2)
+    assert len(cache) == 0
+    assert os.listdir(tmp_path) == ["v2"]
+
+
+def test_lru_eviction(tmp_path):
+    """Test least recently used outputs are evicted first once the cache is over its size bound."""
+    cache = PageResultCache(str(tmp_path), max_bytes=3 * len(OUTPUT))
+    keys = [_key(digest=f"{i:02x}" * 32) for i in range(3)]
+    for key in keys:
+        cache.put(key, OUTPUT)
+        time.sleep(0.01)
+    cache.get(keys[0])
+    cache.put(_key(digest="ff" * 32), OUTPUT)
+    assert keys[0] in cache and keys[1] not in cache
+    assert cache.total_bytes <= 3 * len(OUTPUT)
+
+
+def test_repeated_pages():
+    """Test a repeat waits for an output in flight, and a repeat after it finished gets it without a request."""
+    repeats = RepeatedPages(max_recent=2)
+    assert repeats.get(_key()) is None
+    assert repeats.add(_key(), (0, 0))
+    assert not repeats.add(_key(), (0, 1))
+    assert repeats.pending
+    assert repeats.done(_key(), OUTPUT) == [(0, 0), (0, 1)]
+    assert not repeats.pending
+
+    # the first copy is written and gone from waiting; a much later copy still finds its output
+    assert repeats.get(_key()) == OUTPUT
+    for i in range(2):
+        other = _key(digest=f"{i:02x}" * 32)
+        assert repeats.add(other, (1, i))
+        repeats.done(other, str(i))
+    assert repeats.get(_key()) is None  # only the last max_recent outputs are kept
+    assert repeats.get(_key(digest="01" * 32)) == "1"
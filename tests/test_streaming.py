@@ -0,0 +1,170 @@
+"""Tests for the streaming pipeline building blocks."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from process.streaming import ReorderBuffer, hold_back, iter_engine_outputs, prefetch
+from process.tensor_store import preprocess_with_store
+
+
+def test_prefetch_keeps_order_and_bound():
+    """Test prefetch yields everything in order and never runs more than maxsize items ahead."""
+    produced = []
+    consumed = []
+    ahead = []
+
+    def numbers():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    for item in prefetch(numbers(), maxsize=4):
+        # the producer may hold one more item while waiting for queue space
+        ahead.append(len(produced) - len(consumed))
+        consumed.append(item)
+    assert consumed == list(range(50))
+    assert max(ahead) <= 4 + 2
+
+
+def test_prefetch_reraises_producer_errors():
+    """Test an exception in the producer surfaces in the consumer."""
+    def failing():
+        yield 1
+        raise RuntimeError("render failed")
+
+    items = prefetch(failing(), maxsize=2)
+    assert next(items) == 1
+    with pytest.raises(RuntimeError, match="render failed"):
+        next(items)
+
+
+def test_prefetch_early_exit_stops_producer():
+    """Test abandoning the consumer lets the producer thread finish."""
+    before = threading.active_count()
+    items = prefetch(iter(range(1000)), maxsize=1)
+    next(items)
+    items.close()
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.daemon:
+            thread.join(timeout=2)
+    assert threading.active_count() <= before
+
+
+def test_reorder_buffer():
+    """Test out-of-order items are released in index order without gaps."""
+    buffer = ReorderBuffer()
+    assert buffer.put(2, "c") == []
+    assert buffer.put(1, "b") == []
+    assert len(buffer) == 2
+    assert buffer.put(0, "a") == [(0, "a"), (1, "b"), (2, "c")]
+    assert buffer.put(3, "d") == [(3, "d")]
+    assert len(buffer) == 0
+
+
+def test_reorder_buffer_order():
+    """Test a reorder buffer given the indices to expect skips the others and ends after the last one."""
+    buffer = ReorderBuffer(order=[1, 4, 5])
+    assert buffer.put(4, "e") == []
+    assert buffer.put(1, "b") == [(1, "b"), (4, "e")]
+    assert buffer.next_index == 5
+    assert buffer.put(5, "f") == [(5, "f")]
+    assert buffer.next_index is None
+
+
+class _Engine:
+    """LLMEngine stand-in: every request finishes after its own number of steps."""
+
+    def __init__(self):
+        self.running = {}
+        self.max_running = 0
+
+    def add_request(self, request_id, inputs, params):
+        self.running[request_id] = inputs["steps"]
+        self.max_running = max(self.max_running, len(self.running))
+
+    def has_unfinished_requests(self):
+        return bool(self.running)
+
+    def step(self):
+        outputs = []
+        for request_id in list(self.running):
+            self.running[request_id] -= 1
+            finished = self.running[request_id] <= 0
+            if finished:
+                del self.running[request_id]
+            outputs.append(SimpleNamespace(request_id=request_id, finished=finished))
+        return outputs
+
+
+def test_iter_engine_outputs_bounds_inflight():
+    """Test every request completes once and the engine never holds more than max_inflight."""
+    engine = _Engine()
+    requests = ((str(i), {"steps": 1 + (i * 7) % 5}) for i in range(40))
+    done = [output.request_id for output in iter_engine_outputs(engine, requests, None, max_inflight=6)]
+    assert sorted(done, key=int) == [str(i) for i in range(40)]
+    assert engine.max_running == 6
+
+
+def test_iter_engine_outputs_backpressure():
+    """Test can_admit holds back new requests, but an idle engine still makes progress."""
+    engine = _Engine()
+    requests = ((str(i), {"steps": 2}) for i in range(10))
+    done = list(iter_engine_outputs(engine, requests, None, max_inflight=6, can_admit=lambda: False))
+    assert len(done) == 10
+    assert engine.max_running == 1
+
+
+class _IdentityPool:
+    def submit(self, item):
+        return item
+
+    def result(self, future):
+        return future
+
+
+def test_hold_back_bounds_pages_behind_a_pending_page():
+    """Test pages finished without the model can not pile up behind a page still being decoded."""
+    engine = _Engine()
+    limit = 20
+    live, waiting, written = set(), set(), []
+    finished = ReorderBuffer()
+    rendered = []
+
+    def finish(idx):
+        for page_idx, _ in finished.put(idx, None):
+            live.discard(page_idx)
+            written.append(page_idx)
+
+    def keys():
+        # page 0 goes to the model and takes a while, the 999 after it are finished right away (text layer)
+        for idx in hold_back(range(1000), lambda: len(live) >= limit and bool(waiting)):
+            if idx is None:
+                yield None
+                continue
+            rendered.append(len(live))
+            live.add(idx)
+            if idx == 0:
+                waiting.add(idx)
+                yield idx
+            else:
+                finish(idx)
+
+    def requests():
+        for item in preprocess_with_store(_IdentityPool(), None, keys(), lambda i: {"steps": 50}, lookahead=4):
+            yield None if item is None else ("0", item)
+
+    for output in iter_engine_outputs(engine, requests(), None, max_inflight=4, can_admit=lambda: len(live) < limit):
+        waiting.discard(int(output.request_id))
+        finish(int(output.request_id))
+
+    assert written == list(range(1000))
+    assert max(rendered) < limit
+
+
+def test_hold_back():
+    """Test hold_back yields None instead of pulling items while full."""
+    full = [True, True, False]
+    items = hold_back(iter("ab"), lambda: full.pop(0) if full else False)
+    assert list(items) == [None, None, "a", "b"]
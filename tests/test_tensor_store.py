@@ -0,0 +1,146 @@
+"""Tests for the on-disk store of preprocessed page tensors."""
+
+from concurrent.futures import Future
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+Image = pytest.importorskip("PIL.Image")
+
+from process.modes import get_mode
+from process.tensor_store import PageTensorStore, preprocess_with_store
+
+
+def _page(color, size=(800, 600)):
+    return Image.new("RGB", size, color)
+
+
+class _InlinePool:
+    """Pool interface of PreprocessPool, run synchronously; counts preprocessed pages."""
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.mode = processor.mode
+        self.submitted = 0
+
+    def submit(self, image):
+        self.submitted += 1
+        future = Future()
+        future.set_result(self.processor.tokenize_with_images(images=[image], bos=True, eos=True)[0])
+        return future
+
+    def result(self, future):
+        return [future.result()]
+
+
+@pytest.fixture
+def processor(tiny_tokenizer):
+    from process.image_process import DeepseekOCRProcessor
+    return DeepseekOCRProcessor(tokenizer=tiny_tokenizer, mode="gundam")
+
+
+def _assert_same(stored, fresh):
+    for a, b in zip(stored[0][:5], fresh[0][:5]):
+        assert a.dtype == b.dtype
+        assert torch.equal(a, b)
+    assert list(stored[0][5]) == list(fresh[0][5])
+    assert [tuple(s) for s in stored[0][6]] == [tuple(s) for s in fresh[0][6]]
+
+
+def test_roundtrip(tmp_path, processor):
+    """Test a stored page comes back identical and memory-mapped."""
+    store = PageTensorStore(root=str(tmp_path))
+    image = _page("white")
+    features = processor.tokenize_with_images(images=[image], bos=True, eos=True)
+    key = PageTensorStore.make_key(PageTensorStore.digest_image(image), processor.mode, "p", False)
+
+    assert store.get(key) is None
+    store.put(key, features)
+    assert key in store
+
+    reopened = PageTensorStore(root=str(tmp_path))
+    assert len(reopened) == 1
+    _assert_same(reopened.get(key), features)
+
+
+def test_key_depends_on_settings():
+    """Test mode, prompt, pixel dtype and the tile planner bounds all change the key."""
+    base = PageTensorStore.make_key("abc", get_mode("gundam"), "p", False)
+    assert base == PageTensorStore.make_key("abc", get_mode("gundam"), "p", False)
+    assert base != PageTensorStore.make_key("abc", get_mode("base"), "p", False)
+    assert base != PageTensorStore.make_key("abc", get_mode("gundam"), "q", False)
+    assert base != PageTensorStore.make_key("abc", get_mode("gundam"), "p", True)
+    assert base != PageTensorStore.make_key("abd", get_mode("gundam"), "p", False)
+    assert base != PageTensorStore.make_key("abc", get_mode("gundam"), "p", False, min_crops=1)
+    assert base != PageTensorStore.make_key("abc", get_mode("gundam"), "p", False, max_crops=9)
+
+
+def test_version_bump_drops_entries(tmp_path, processor):
+    """Test opening the store with another preprocessing version invalidates old entries."""
+    features = processor.tokenize_with_images(images=[_page("white")], bos=True, eos=True)
+    PageTensorStore(root=str(tmp_path), version=1).put("aa-1", features)
+
+    store = PageTensorStore(root=str(tmp_path), version=2)
+    assert len(store) == 0
+    assert not (tmp_path / "v1").exists()
+
+
+def test_lru_eviction(tmp_path, processor):
+    """Test the least recently used entries are evicted once the store is over budget."""
+    features = processor.tokenize_with_images(images=[_page("white")], bos=True, eos=True)
+    store = PageTensorStore(root=str(tmp_path))
+    store.put("aa-0", features)
+    entry_size = store.total_bytes
+
+    store.max_bytes = int(entry_size * 2.5)
+    store.put("bb-1", features)
+    store.get("aa-0")
+    store.put("cc-2", features)
+
+    assert "aa-0" in store and "cc-2" in store
+    assert "bb-1" not in store
+    assert store.total_bytes <= store.max_bytes
+
+
+def test_preprocess_with_store_skips_hits(tmp_path, processor):
+    """Test a second pass serves every page from the store without preprocessing."""
+    images = [_page("white"), _page("black", (500, 1400)), _page("gray", (300, 200))]
+    keys = [PageTensorStore.make_key(PageTensorStore.digest_image(image), processor.mode, "p", False)
+            for image in images]
+    store = PageTensorStore(root=str(tmp_path))
+
+    pool = _InlinePool(processor)
+    first = list(preprocess_with_store(pool, store, keys, lambda idx: images[idx]))
+    assert pool.submitted == 3
+
+    pool = _InlinePool(processor)
+    second = list(preprocess_with_store(pool, store, keys, lambda idx: images[idx]))
+    assert pool.submitted == 0
+    for stored, fresh in zip(second, first):
+        _assert_same(stored, fresh)
+
+
+def test_preprocess_without_store(processor):
+    """Test every page is preprocessed when no store is configured."""
+    images = [_page("white"), _page("black")]
+    pool = _InlinePool(processor)
+    items = list(preprocess_with_store(pool, None, [0, 1], lambda idx: images[idx]))
+    assert len(items) == 2 and pool.submitted == 2
+
+
+def test_preprocess_lookahead_is_bounded(processor):
+    """Test lazy keys are consumed at most lookahead pages ahead of the consumer."""
+    images = [_page("white"), _page("black"), _page("gray"), _page("white", (700, 900)), _page("black", (900, 700))]
+    pulled = []
+
+    def keys():
+        for idx in range(len(images)):
+            pulled.append(idx)
+            yield idx
+
+    pool = _InlinePool(processor)
+    items = preprocess_with_store(pool, None, keys(), lambda idx: images[idx], lookahead=2)
+    for consumed, _ in enumerate(items, start=1):
+        assert len(pulled) - consumed <= 1
+    assert pool.submitted == len(images)
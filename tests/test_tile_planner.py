@@ -0,0 +1,75 @@
+"""Tests for the pixel-free tile planner."""
+
+import math
+
+import pytest
+
+from process.tile_planner import TilePlanner, count_image_tokens, get_tile_planner
+
+
+def _reference_ratio(width, height, min_num, max_num, image_size):
+    """The original count_tiles: rebuild, sort and scan the candidate grids."""
+    target_ratios = sorted(
+        set((i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1)
+            if min_num <= i * j <= max_num),
+        key=lambda x: x[0] * x[1])
+    best_ratio_diff, best_ratio = float('inf'), (1, 1)
+    for ratio in target_ratios:
+        ratio_diff = abs(width / height - ratio[0] / ratio[1])
+        if ratio_diff < best_ratio_diff:
+            best_ratio_diff, best_ratio = ratio_diff, ratio
+        elif ratio_diff == best_ratio_diff and width * height > 0.5 * image_size * image_size * ratio[0] * ratio[1]:
+            best_ratio = ratio
+    return best_ratio
+
+
+def _reference_tokens(crop_ratio, base_size, image_size):
+    q_base = math.ceil((base_size // 16) / 4)
+    q = math.ceil((image_size // 16) / 4)
+    tokens = (q_base + 1) * q_base + 1
+    if crop_ratio[0] > 1 or crop_ratio[1] > 1:
+        tokens += (q * crop_ratio[0] + 1) * (q * crop_ratio[1])
+    return tokens
+
+
+@pytest.mark.parametrize("width,height", [
+    (1224, 1584), (2480, 3508), (3508, 2480), (641, 100), (100, 641),
+    (1000, 1000), (1280, 1280), (5000, 600), (700, 640), (640, 640),
+])
+@pytest.mark.parametrize("min_crops,max_crops", [(2, 6), (2, 9)])
+def test_plan_matches_reference(width, height, min_crops, max_crops):
+    """Test the memoized plan matches the original grid selection and token count."""
+    plan = TilePlanner(min_crops, max_crops).plan(width, height, 1024, 640, True)
+
+    if width <= 640 and height <= 640:
+        expected_ratio = (1, 1)
+    else:
+        expected_ratio = _reference_ratio(width, height, min_crops, max_crops, 640)
+    assert plan.crop_ratio == expected_ratio
+    assert plan.num_image_tokens == _reference_tokens(expected_ratio, 1024, 640)
+
+
+def test_plan_without_cropping():
+    """Test non-cropping modes only pay for the global view."""
+    plan = get_tile_planner().plan(2480, 3508, 1280, 1280, False)
+    assert plan.crop_ratio == (1, 1)
+    assert plan.tile_boxes == ()
+    assert plan.num_image_tokens == count_image_tokens((1, 1), base_size=1280, image_size=1280) == 421
+
+
+def test_tile_boxes_row_major():
+    """Test tile boxes cover the canvas in dynamic_preprocess order."""
+    plan = TilePlanner(2, 6).plan(1200, 1700, 1024, 640, True)
+    assert plan.crop_ratio == (2, 3)
+    assert plan.canvas_size == (1280, 1920)
+    assert plan.tile_boxes[:3] == ((0, 0, 640, 640), (640, 0, 1280, 640), (0, 640, 640, 1280))
+    assert plan.num_tiles == 6
+
+
+def test_plans_are_memoized():
+    """Test repeated page sizes hit the cache and planners are shared."""
+    planner = TilePlanner(2, 6)
+    planner.plan(1224, 1584, 1024, 640, True)
+    planner.plan(1224, 1584, 1024, 640, True)
+    assert planner.plan.cache_info().hits == 1
+    assert get_tile_planner(2, 6) is get_tile_planner(2, 6)